@@ -1,19 +1,593 @@
 from __future__ import annotations
 
+import hashlib
+import json
+from dataclasses import dataclass
+from operator import attrgetter
+
+from .keyword_matcher import KeywordAutomaton
 from .models import FeedbackMode
 from .schemas import AnalysisOutput, DebriefInput, PreparationInput
 
+NEGOTIATION_TYPE = "context.negotiation_type"
+RELATIONSHIP = "context.counterpart_relationship"
+EXPLICIT_OBJECTIVE = "objective.explicit_objective"
+MINIMUM_RESULT = "objective.minimum_acceptable_result"
+MAAN = "power_alternatives.maan"
+COUNTERPART_STRENGTH = "power_alternatives.counterpart_perceived_strength"
+BREAKPOINT = "power_alternatives.breakpoint"
+CONCESSIONS = "strategy.concession_sequence"
+HYPOTHESIS = "strategy.counterpart_hypothesis"
+EMOTIONAL = "risk.emotional_variable"
+MAIN_RISK = "risk.main_risk"
+KEY_SIGNAL = "risk.key_signal"
+
+
+@dataclass(frozen=True)
+class _Clause:
+    fields: tuple[str, ...]
+    tokens: frozenset[str]
+
+
+@dataclass(frozen=True)
+class _Condition:
+    # Se cumple si alguna cláusula encuentra un token (o ninguna, si negate=True).
+    clauses: tuple[_Clause, ...]
+    negate: bool = False
+
+
+@dataclass(frozen=True)
+class _Rule:
+    bucket: str
+    message: str
+    when: tuple[_Condition, ...]
+
+
+def _has(*fields: str, tokens: list[str]) -> _Condition:
+    return _Condition(clauses=(_Clause(fields=fields, tokens=frozenset(token.lower() for token in tokens)),))
+
+
+def _lacks(*fields: str, tokens: list[str]) -> _Condition:
+    return _Condition(clauses=_has(*fields, tokens=tokens).clauses, negate=True)
+
+
+def _has_any(*conditions: _Condition) -> _Condition:
+    return _Condition(clauses=tuple(clause for condition in conditions for clause in condition.clauses))
+
+
+_COMPETITIVE = _has(NEGOTIATION_TYPE, tokens=["beauty", "licitación", "negotiauction", "concurso"])
+_SALARY = _has(NEGOTIATION_TYPE, tokens=["salar", "oferta laboral", "compensación", "empleo"])
+_ONLINE = _has(NEGOTIATION_TYPE, tokens=["online", "virtual", "remota", "video", "zoom", "email", "mail"])
+
+# Catálogo de reglas: el orden de la tabla define el orden de los mensajes en cada bloque.
+RULES: tuple[_Rule, ...] = (
+    _Rule(
+        "clarification_questions",
+        "¿Tu MAAN describe una alternativa accionable y específica si no hay acuerdo?",
+        (_lacks(MAAN, tokens=["alternativa", "plan b", "opción", "proveedor", "cliente"]),),
+    ),
+    _Rule(
+        "inconsistencies",
+        "El riesgo principal parece emocional, pero la variable emocional propia no está alineada.",
+        (
+            _has(MAIN_RISK, tokens=["emoc", "ansiedad", "enojo", "frustr"]),
+            _lacks(EMOTIONAL, tokens=["emoc", "ansiedad", "enojo", "frustr"]),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Antes de ejecutar, explicitá un estándar ético mínimo: qué no vas a falsear, qué presión no vas a usar y qué criterio de justicia vas a sostener.",
+        (
+            _lacks(
+                CONCESSIONS,
+                MAIN_RISK,
+                tokens=["ética", "candor", "buena fe", "justicia", "transpar", "límite táctico", "no mentir"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "Si usás táctica dura, definí límites explícitos para no deteriorar legitimidad ni relación futura.",
+        (
+            _has(CONCESSIONS, MAIN_RISK, tokens=["amenaza", "ultim", "presión", "forzar", "arrincon", "dirty", "hardball"]),
+            _lacks(CONCESSIONS, KEY_SIGNAL, tokens=["límite", "resumen", "pausa", "regla", "reciproc", "respeto"]),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Tu BATNA está cuantificada en valor esperado (escenarios, probabilidades y costos), no solo descrita en términos generales?",
+        (
+            _lacks(
+                MAAN,
+                BREAKPOINT,
+                tokens=["valor esperado", "probab", "%", "escenario", "costo", "litig", "best alternative", "batna"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Definí un valor de reserva explícito (umbral de aceptación) traducido a términos comparables con la oferta en mesa.",
+        (_lacks(MINIMUM_RESULT, BREAKPOINT, tokens=["reserva", "mínimo", "walk-away", "punto de retiro", "umbral"]),),
+    ),
+    _Rule(
+        "observations",
+        "Falta estimación explícita del BATNA de la contraparte; eso puede sesgar tu lectura de poder relativo.",
+        (
+            _lacks(
+                HYPOTHESIS,
+                COUNTERPART_STRENGTH,
+                tokens=["batna", "alternativa", "sin acuerdo", "plan b", "segunda opción", "outside option"],
+            ),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Ya tradujiste tu alternativa externa a términos comparables con esta oferta (alcance, riesgo, implementación y costo total)?",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["empresa", "b2b", "proveedor", "contrato", "compra"]),
+            _lacks(
+                MINIMUM_RESULT,
+                CONCESSIONS,
+                tokens=["comparable", "equivalente", "alcance", "cobertura", "servicio", "riesgo", "tco", "implement"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "La secuencia de concesiones sugiere riesgo de ceder valor demasiado temprano.",
+        (_has(CONCESSIONS, tokens=["rápido", "inmediato", "todo", "primera oferta"]),),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Qué variables no monetarias podés sumar para convertir esta conversación en una negociación multi-issue?",
+        (
+            _has(EXPLICIT_OBJECTIVE, tokens=["precio", "tarifa", "salario", "fee"]),
+            _lacks(
+                CONCESSIONS,
+                tokens=["plazo", "volumen", "calidad", "servicio", "garant", "riesgo", "sla", "gobernanza"],
+            ),
+        ),
+    ),
+    _Rule(
+        "inconsistencies",
+        "En una negociación contractual no aparece un mecanismo explícito de revisión o manejo de disputas.",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["contrato", "b2b", "proveedor"]),
+            _lacks(MINIMUM_RESULT, MAIN_RISK, tokens=["revisión", "renegoci", "mediación", "arbitra", "disputa"]),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "En contexto competitivo, ¿qué paquetes simultáneos vas a presentar para evitar competir solo por precio?",
+        (_COMPETITIVE, _lacks(CONCESSIONS, tokens=["opción", "paquete", "alternativa"])),
+    ),
+    _Rule(
+        "observations",
+        "Podría faltar una táctica de cierre tipo 'shut-down move' para limitar el ida y vuelta con competidores.",
+        (_COMPETITIVE, _lacks(KEY_SIGNAL, tokens=["exclus", "ahora", "cierre", "hoy"])),
+    ),
+    _Rule(
+        "suggestions",
+        "Incorporá una secuencia explícita de intercambio de información: revelar una variable propia y pedir reciprocidad.",
+        (_lacks(HYPOTHESIS, tokens=["pregunt", "inform", "abr", "interes", "reciproc"]),),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Qué indicador observable te confirmará que debes sostener o cambiar la estrategia?",
+        (_lacks(KEY_SIGNAL, tokens=["si", "cuando", "señal", "indicador", "pregunta"]),),
+    ),
+    _Rule(
+        "suggestions",
+        "Definí un protocolo de manejo de escalada: pausa táctica, reglas de interacción y cierre de cada sesión por escrito.",
+        (
+            _has(
+                COUNTERPART_STRENGTH,
+                MAIN_RISK,
+                tokens=["difícil", "duro", "ultim", "amenaz", "hostil", "agres", "no negociable", "presión"],
+            ),
+            _lacks(
+                CONCESSIONS,
+                tokens=["pausa", "break", "balcón", "tiempo", "norma", "protocolo", "regla", "resumen"],
+            ),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Qué ajuste de proceso usarás para compensar asimetrías de poder (turnos, respaldo, tercero neutral o validación escrita)?",
+        (
+            _has(
+                COUNTERPART_STRENGTH,
+                RELATIONSHIP,
+                tokens=["asimetr", "domin", "muy fuerte", "jerarqu", "senior", "monopol", "dependencia"],
+            ),
+            _lacks(
+                HYPOTHESIS,
+                KEY_SIGNAL,
+                tokens=["proceso", "turno", "voz", "sesgo", "estatus", "género", "raza", "tercero", "respaldo"],
+            ),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Cuál es tu BATNA operativo y qué condición concreta activa tu salida de la negociación?",
+        (
+            _lacks(
+                MAAN,
+                BREAKPOINT,
+                tokens=["batna", "alternativa", "walk", "retiro", "salir", "plan b", "límite"],
+            ),
+        ),
+    ),
+    _Rule(
+        "inconsistencies",
+        "Reconocés riesgo emocional, pero la estrategia no explicita técnicas de escucha activa ni reencuadre.",
+        (
+            _has(MAIN_RISK, tokens=["emoc", "enojo", "frustr", "ansiedad", "reacción"]),
+            _lacks(
+                CONCESSIONS,
+                tokens=["pregunta", "escuchar", "parafrase", "interés", "reencuadre", "yes", "propuesta"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "Podrían faltar hipótesis sobre restricciones ocultas de la contraparte (autoridad, precedentes, presupuesto o legales).",
+        (
+            _lacks(
+                HYPOTHESIS,
+                tokens=["restric", "autoridad", "precedente", "presupuesto", "abogado", "superior", "instrucción"],
+            ),
+        ),
+    ),
+    _Rule(
+        "inconsistencies",
+        "El diseño prioriza cierre, pero no explicita cómo se implementará ni quién gobernará el acuerdo después de firmar.",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["contrato", "alianza", "joint", "proveedor", "b2b"]),
+            _lacks(
+                HYPOTHESIS,
+                MINIMUM_RESULT,
+                tokens=["implement", "seguimiento", "gobernanza", "responsable", "comité", "hito"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Hacé un mini 3D audit: táctica en mesa, diseño de propuestas y setup (quién decide, en qué orden y con qué proceso).",
+        (_lacks(CONCESSIONS, tokens=["táct", "interpersonal", "diseño", "setup", "secuencia", "actor", "orden"]),),
+    ),
+    _Rule(
+        "clarification_questions",
+        "Si el cierre se traba, ¿qué barrera principal esperás (táctica, diseño o setup) y qué acción concreta aplicarás?",
+        (
+            _has(MAIN_RISK, tokens=["cierre", "firma", "último", "deadline", "demora"]),
+            _lacks(
+                KEY_SIGNAL,
+                CONCESSIONS,
+                tokens=["barrera", "impasse", "consecuencia", "plazo", "deadline", "tercero", "mediación"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "Objetivo ambicioso detectado: cuidá el posible backlash relacional con concesiones graduales y cierre percibido como justo.",
+        (
+            _has(EXPLICIT_OBJECTIVE, tokens=["máximo", "muy alto", "agresivo", "techo", "premium"]),
+            _lacks(
+                CONCESSIONS,
+                MAIN_RISK,
+                tokens=["relación", "backlash", "aceptación gradual", "satisfacción", "percepción"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Prepará respuesta para la 'pregunta más difícil' (mínimo aceptable, ultimátum o demanda de cierre inmediato) sin revelar de más.",
+        (_lacks(HYPOTHESIS, MAIN_RISK, tokens=["pregunta difícil", "ultim", "mínimo", "final offer", "hardest"]),),
+    ),
+    _Rule(
+        "suggestions",
+        "Incluí un ensayo breve pre-negociación: reencuadre de ansiedad en foco operativo y práctica de primera oferta.",
+        (
+            _has(EMOTIONAL, MAIN_RISK, tokens=["ansiedad", "nerv", "miedo", "bloqueo"]),
+            _lacks(CONCESSIONS, tokens=["práctica", "role", "ensayo", "coach", "reencuadre", "excitación"]),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "Si negociás en grupo, ¿cómo vas a mantener mensaje común y disciplina de coalición durante la presión final?",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["sindicato", "equipo", "coalición", "grupo", "colectiva"]),
+            _lacks(CONCESSIONS, tokens=["coalición", "alineación", "mensaje común", "frente"]),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "En multiparte, usá una mini matriz por actor (prioridades, BATNA y posible alineación) para anticipar cambios de coalición.",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["sindicato", "equipo", "coalición", "grupo", "colectiva", "familiar"]),
+            _lacks(
+                HYPOTHESIS,
+                CONCESSIONS,
+                tokens=["matriz", "prioridad", "alianza", "bloque", "voto", "paquete por actor"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "Si invertiste mucho en alternativas, vigilá sesgo de entitlement/costos hundidos para no endurecerte de más y dañar la relación.",
+        (
+            _has(MAAN, tokens=["invert", "investig", "tiempo", "costoso", "caro", "consultor", "due diligence"]),
+            _lacks(
+                CONCESSIONS,
+                MAIN_RISK,
+                tokens=["buena fe", "ética", "relación", "reciproc", "transpar", "largo plazo"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Además del salario, incluí 1-2 variables de valor futuro (revisión, alcance de rol, desarrollo o flexibilidad).",
+        (
+            _SALARY,
+            _lacks(
+                MINIMUM_RESULT,
+                CONCESSIONS,
+                tokens=["desarrollo", "rol", "aprendiz", "mentor", "revisión", "crecimiento", "proyecto", "flex"],
+            ),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Qué parte del paquete es realmente no negociable y qué parte sí admite ajustes (timing, estructura, revisión)?",
+        (
+            _SALARY,
+            _lacks(
+                HYPOTHESIS,
+                COUNTERPART_STRENGTH,
+                tokens=["banda", "política", "paquete", "no negociable", "estándar", "hr", "recruit"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "En ofertas laborales conviene priorizar 2-3 temas críticos para evitar sobrecargar la contraparte y deteriorar la relación.",
+        (
+            _SALARY,
+            _has_any(
+                _has(CONCESSIONS, tokens=["lista", "todo", "muchas", "varias demandas"]),
+                _has(MAIN_RISK, tokens=["rechazo", "revocar", "retirar oferta"]),
+            ),
+        ),
+    ),
+    _Rule(
+        "inconsistencies",
+        "La estrategia salarial no explicita alternativa externa/interna; eso debilita tu poder de negociación percibido.",
+        (_SALARY, _lacks(MAAN, tokens=["proceso", "otra oferta", "mercado", "alternativa", "actual"])),
+    ),
+    _Rule(
+        "suggestions",
+        "Para cuidar la relación, definí una micro-rutina: apertura de rapport, transparencia de criterios y cierre con próximos pasos explícitos.",
+        (
+            _has(RELATIONSHIP, tokens=["largo", "en curso", "nueva"]),
+            _lacks(
+                CONCESSIONS,
+                HYPOTHESIS,
+                tokens=["rapport", "confianza", "alineación", "small talk", "transpar", "seguimiento", "check-in"],
+            ),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Cómo vas a gestionar expectativas y percepción de justicia para evitar que la otra parte “cobre” en la próxima negociación?",
+        (
+            _has(MAIN_RISK, tokens=["relación", "confianza", "resent", "fricción"]),
+            _lacks(
+                KEY_SIGNAL,
+                CONCESSIONS,
+                tokens=["expectativa", "satisfacción", "compar", "explicación", "percepción"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "En negociaciones con alto componente relacional conviene prever un tercero neutral y reglas de transparencia desde el inicio.",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["familiar", "sucesión", "socios"]),
+            _lacks(CONCESSIONS, KEY_SIGNAL, tokens=["neutral", "mediación", "tercero", "proceso", "transpar"]),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Para consolidar aprendizaje, agregá un mini debrief estructurado: qué patrón funcionó, qué ajustar y cómo transferirlo al próximo caso.",
+        (
+            _lacks(
+                CONCESSIONS,
+                HYPOTHESIS,
+                tokens=["debrief", "aprendiz", "analog", "transfer", "observ", "feedback"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "En simulación, además del resultado, monitoreá sesgos de desempeño (miedo a perder, rigidez, reacción defensiva).",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["simul", "entren", "clase"]),
+            _lacks(MAIN_RISK, KEY_SIGNAL, tokens=["ganar", "perder", "compet", "estrés", "defensiv", "hábito"]),
+        ),
+    ),
+    _Rule(
+        "clarification_questions",
+        "¿Qué canal usarás en cada fase (alineación por videollamada, iteración por escrito y cierre por recap)?",
+        (
+            _ONLINE,
+            _lacks(
+                CONCESSIONS,
+                KEY_SIGNAL,
+                tokens=["canal", "video", "llamada", "email", "sincr", "asincr", "chat"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "En tramos por e-mail, definí cadencia de respuesta y cierre de cada ronda con resumen escrito para reducir malentendidos.",
+        (
+            _ONLINE,
+            _has(NEGOTIATION_TYPE, CONCESSIONS, tokens=["email", "mail", "asincr"]),
+            _lacks(
+                CONCESSIONS,
+                KEY_SIGNAL,
+                tokens=["plazo de respuesta", "cadencia", "48h", "24h", "resumen", "confirmación escrita"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "En videonegociación conviene explicitar una apertura breve de rapport y reglas de interacción (agenda, turnos y recap).",
+        (
+            _ONLINE,
+            _has(NEGOTIATION_TYPE, CONCESSIONS, tokens=["video", "zoom", "meet", "teams"]),
+            _lacks(
+                CONCESSIONS,
+                MAIN_RISK,
+                tokens=["rapport", "confianza", "apertura", "agenda", "turnos", "sin interrup"],
+            ),
+        ),
+    ),
+    _Rule(
+        "inconsistencies",
+        "Hay riesgo de malentendidos, pero no aparece un protocolo explícito de validación (paráfrasis + confirmación).",
+        (
+            _has(MAIN_RISK, tokens=["malentendido", "interpret", "tono", "fricción digital"]),
+            _lacks(
+                CONCESSIONS,
+                KEY_SIGNAL,
+                tokens=["parafrase", "resumen", "confirmación", "check-back", "pregunta de validación"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Antes de negociar, hacé un ensayo breve (10 min) y definí qué indicador revisarás en debrief para sostener aprendizaje transferible.",
+        (
+            _lacks(
+                CONCESSIONS,
+                KEY_SIGNAL,
+                tokens=["ensayo", "rehears", "simulación", "práctica", "debrief", "aprendiz"],
+            ),
+        ),
+    ),
+    _Rule(
+        "suggestions",
+        "Definí una microconducta observable para practicar bajo presión (por ejemplo: pausar, parafrasear y preguntar antes de conceder).",
+        (
+            _lacks(
+                CONCESSIONS,
+                KEY_SIGNAL,
+                tokens=["hábito", "microconducta", "si pasa", "entonces", "provoc", "coach", "interrup"],
+            ),
+        ),
+    ),
+    _Rule(
+        "observations",
+        "Podrían faltar restricciones estructurales de la organización (métricas, incentivos, autoridad o proceso) que impactan el resultado.",
+        (
+            _has(NEGOTIATION_TYPE, tokens=["empresa", "b2b", "proveedor", "interna", "equipo"]),
+            _lacks(
+                COUNTERPART_STRENGTH,
+                HYPOTHESIS,
+                tokens=["incentivo", "métrica", "autoridad", "proceso", "estructura", "aprobación", "presupuesto"],
+            ),
+        ),
+    ),
+)
+
+
+class _CompiledRules:
+    """Tabla de reglas compilada una sola vez: autómata de keywords y condiciones aplanadas."""
+
+    def __init__(self, rules: tuple[_Rule, ...]) -> None:
+        self.rules = rules
+        vocabulary: dict[str, set[str]] = {}
+        compiled: list[tuple[str, str, tuple[tuple[bool, tuple[tuple[str, frozenset[str]], ...]], ...]]] = []
+        for rule in rules:
+            conditions = []
+            for condition in rule.when:
+                pairs = []
+                for clause in condition.clauses:
+                    for field in clause.fields:
+                        vocabulary.setdefault(field, set()).update(clause.tokens)
+                        pairs.append((field, clause.tokens))
+                conditions.append((condition.negate, tuple(pairs)))
+            compiled.append((rule.bucket, rule.message, tuple(conditions)))
+        self.vocabulary = {field: frozenset(tokens) for field, tokens in vocabulary.items()}
+        self.getters = {field: attrgetter(field) for field in self.vocabulary}
+        self.automaton = KeywordAutomaton(token for tokens in vocabulary.values() for token in tokens)
+        self._compiled = tuple(compiled)
+
+    def field_hits(self, data: PreparationInput) -> dict[str, frozenset[str]]:
+        find_all = self.automaton.find_all
+        return {field: find_all(getter(data).lower()) for field, getter in self.getters.items()}
+
+    def evaluate(self, data: PreparationInput) -> dict[str, list[str]]:
+        hits = self.field_hits(data)
+        buckets: dict[str, list[str]] = {
+            "inconsistencies": [],
+            "clarification_questions": [],
+            "observations": [],
+            "suggestions": [],
+        }
+        for bucket, message, conditions in self._compiled:
+            for negate, pairs in conditions:
+                matched = False
+                for field, tokens in pairs:
+                    if not hits[field].isdisjoint(tokens):
+                        matched = True
+                        break
+                if matched == negate:
+                    break
+            else:
+                buckets[bucket].append(message)
+        return buckets
+
+
+_COMPILED_RULES = _CompiledRules(RULES)
+
+
+def _ruleset_version(rules: tuple[_Rule, ...]) -> str:
+    spec = [
+        [
+            rule.bucket,
+            rule.message,
+            [
+                [condition.negate, [[list(clause.fields), sorted(clause.tokens)] for clause in condition.clauses]]
+                for condition in rule.when
+            ],
+        ]
+        for rule in rules
+    ]
+    return hashlib.sha256(json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+# Cambia automáticamente cuando se edita el catálogo; invalida resultados cacheados.
+RULESET_VERSION = _ruleset_version(RULES)
+
+
+def preparation_fingerprint(data: PreparationInput) -> str:
+    normalized = {
+        block: {field: value.strip() if isinstance(value, str) else value for field, value in fields.items()}
+        for block, fields in data.model_dump().items()
+    }
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 
-def _contains_any(text: str, tokens: list[str]) -> bool:
-    lowered = text.lower()
-    return any(token in lowered for token in tokens)
+def analysis_cache_key(data: PreparationInput, mode: FeedbackMode, provider: str) -> str:
+    return f"{preparation_fingerprint(data)}:{mode.value}:{provider}:{RULESET_VERSION}"
 
 
 def analyze_preparation(data: PreparationInput, mode: FeedbackMode) -> AnalysisOutput:
     inconsistencies: list[str] = []
-    clarification_questions: list[str] = []
-    observations: list[str] = []
-    suggestions: list[str] = []
     next_steps: list[str] = []
 
     if data.objective.explicit_objective.strip().lower() == data.objective.real_objective.strip().lower():
@@ -21,356 +595,11 @@ def analyze_preparation(data: PreparationInput, mode: FeedbackMode) -> AnalysisO
             "Objetivo explícito y objetivo real están definidos de forma idéntica; falta tensión estratégica explícita."
         )
 
-    if not _contains_any(data.power_alternatives.maan, ["alternativa", "plan b", "opción", "proveedor", "cliente"]):
-        clarification_questions.append(
-            "¿Tu MAAN describe una alternativa accionable y específica si no hay acuerdo?"
-        )
-
-    if _contains_any(data.risk.main_risk, ["emoc", "ansiedad", "enojo", "frustr"]) and not _contains_any(
-        data.risk.emotional_variable, ["emoc", "ansiedad", "enojo", "frustr"]
-    ):
-        inconsistencies.append(
-            "El riesgo principal parece emocional, pero la variable emocional propia no está alineada."
-        )
-
-    if not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.main_risk,
-        ["ética", "candor", "buena fe", "justicia", "transpar", "límite táctico", "no mentir"],
-    ):
-        suggestions.append(
-            "Antes de ejecutar, explicitá un estándar ético mínimo: qué no vas a falsear, qué presión no vas a usar y qué criterio de justicia vas a sostener."
-        )
-
-    if _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.main_risk,
-        ["amenaza", "ultim", "presión", "forzar", "arrincon", "dirty", "hardball"],
-    ) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.key_signal,
-        ["límite", "resumen", "pausa", "regla", "reciproc", "respeto"],
-    ):
-        observations.append(
-            "Si usás táctica dura, definí límites explícitos para no deteriorar legitimidad ni relación futura."
-        )
-
-    if not _contains_any(
-        data.power_alternatives.maan + " " + data.power_alternatives.breakpoint,
-        ["valor esperado", "probab", "%", "escenario", "costo", "litig", "best alternative", "batna"],
-    ):
-        clarification_questions.append(
-            "¿Tu BATNA está cuantificada en valor esperado (escenarios, probabilidades y costos), no solo descrita en términos generales?"
-        )
-
-    if not _contains_any(
-        data.objective.minimum_acceptable_result + " " + data.power_alternatives.breakpoint,
-        ["reserva", "mínimo", "walk-away", "punto de retiro", "umbral"],
-    ):
-        suggestions.append(
-            "Definí un valor de reserva explícito (umbral de aceptación) traducido a términos comparables con la oferta en mesa."
-        )
-
-    if not _contains_any(
-        data.strategy.counterpart_hypothesis + " " + data.power_alternatives.counterpart_perceived_strength,
-        ["batna", "alternativa", "sin acuerdo", "plan b", "segunda opción", "outside option"],
-    ):
-        observations.append(
-            "Falta estimación explícita del BATNA de la contraparte; eso puede sesgar tu lectura de poder relativo."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["empresa", "b2b", "proveedor", "contrato", "compra"]) and not _contains_any(
-        data.objective.minimum_acceptable_result + " " + data.strategy.concession_sequence,
-        ["comparable", "equivalente", "alcance", "cobertura", "servicio", "riesgo", "tco", "implement"],
-    ):
-        clarification_questions.append(
-            "¿Ya tradujiste tu alternativa externa a términos comparables con esta oferta (alcance, riesgo, implementación y costo total)?"
-        )
-
-    if _contains_any(data.strategy.concession_sequence, ["rápido", "inmediato", "todo", "primera oferta"]):
-        observations.append("La secuencia de concesiones sugiere riesgo de ceder valor demasiado temprano.")
-
-    if _contains_any(data.objective.explicit_objective, ["precio", "tarifa", "salario", "fee"]) and not _contains_any(
-        data.strategy.concession_sequence,
-        ["plazo", "volumen", "calidad", "servicio", "garant", "riesgo", "sla", "gobernanza"],
-    ):
-        clarification_questions.append(
-            "¿Qué variables no monetarias podés sumar para convertir esta conversación en una negociación multi-issue?"
-        )
-
-    if _contains_any(data.context.negotiation_type, ["contrato", "b2b", "proveedor"]) and not _contains_any(
-        data.objective.minimum_acceptable_result + " " + data.risk.main_risk,
-        ["revisión", "renegoci", "mediación", "arbitra", "disputa"],
-    ):
-        inconsistencies.append(
-            "En una negociación contractual no aparece un mecanismo explícito de revisión o manejo de disputas."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["beauty", "licitación", "negotiauction", "concurso"]):
-        if not _contains_any(data.strategy.concession_sequence, ["opción", "paquete", "alternativa"]):
-            clarification_questions.append(
-                "En contexto competitivo, ¿qué paquetes simultáneos vas a presentar para evitar competir solo por precio?"
-            )
-        if not _contains_any(data.risk.key_signal, ["exclus", "ahora", "cierre", "hoy"]):
-            observations.append(
-                "Podría faltar una táctica de cierre tipo 'shut-down move' para limitar el ida y vuelta con competidores."
-            )
-
-    if not _contains_any(data.strategy.counterpart_hypothesis, ["pregunt", "inform", "abr", "interes", "reciproc"]):
-        suggestions.append(
-            "Incorporá una secuencia explícita de intercambio de información: revelar una variable propia y pedir reciprocidad."
-        )
-
-    if not _contains_any(data.risk.key_signal, ["si", "cuando", "señal", "indicador", "pregunta"]):
-        clarification_questions.append(
-            "¿Qué indicador observable te confirmará que debes sostener o cambiar la estrategia?"
-        )
-
-    if _contains_any(
-        data.power_alternatives.counterpart_perceived_strength + " " + data.risk.main_risk,
-        ["difícil", "duro", "ultim", "amenaz", "hostil", "agres", "no negociable", "presión"],
-    ):
-        if not _contains_any(
-            data.strategy.concession_sequence,
-            ["pausa", "break", "balcón", "tiempo", "norma", "protocolo", "regla", "resumen"],
-        ):
-            suggestions.append(
-                "Definí un protocolo de manejo de escalada: pausa táctica, reglas de interacción y cierre de cada sesión por escrito."
-            )
-
-    if _contains_any(
-        data.power_alternatives.counterpart_perceived_strength + " " + data.context.counterpart_relationship,
-        ["asimetr", "domin", "muy fuerte", "jerarqu", "senior", "monopol", "dependencia"],
-    ) and not _contains_any(
-        data.strategy.counterpart_hypothesis + " " + data.risk.key_signal,
-        ["proceso", "turno", "voz", "sesgo", "estatus", "género", "raza", "tercero", "respaldo"],
-    ):
-        clarification_questions.append(
-            "¿Qué ajuste de proceso usarás para compensar asimetrías de poder (turnos, respaldo, tercero neutral o validación escrita)?"
-        )
-
-    if not _contains_any(
-        data.power_alternatives.maan + " " + data.power_alternatives.breakpoint,
-        ["batna", "alternativa", "walk", "retiro", "salir", "plan b", "límite"],
-    ):
-        clarification_questions.append(
-            "¿Cuál es tu BATNA operativo y qué condición concreta activa tu salida de la negociación?"
-        )
-
-    if _contains_any(data.risk.main_risk, ["emoc", "enojo", "frustr", "ansiedad", "reacción"]) and not _contains_any(
-        data.strategy.concession_sequence,
-        ["pregunta", "escuchar", "parafrase", "interés", "reencuadre", "yes", "propuesta"],
-    ):
-        inconsistencies.append(
-            "Reconocés riesgo emocional, pero la estrategia no explicita técnicas de escucha activa ni reencuadre."
-        )
-
-    if not _contains_any(
-        data.strategy.counterpart_hypothesis,
-        ["restric", "autoridad", "precedente", "presupuesto", "abogado", "superior", "instrucción"],
-    ):
-        observations.append(
-            "Podrían faltar hipótesis sobre restricciones ocultas de la contraparte (autoridad, precedentes, presupuesto o legales)."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["contrato", "alianza", "joint", "proveedor", "b2b"]) and not _contains_any(
-        data.strategy.counterpart_hypothesis + " " + data.objective.minimum_acceptable_result,
-        ["implement", "seguimiento", "gobernanza", "responsable", "comité", "hito"],
-    ):
-        inconsistencies.append(
-            "El diseño prioriza cierre, pero no explicita cómo se implementará ni quién gobernará el acuerdo después de firmar."
-        )
-
-    if not _contains_any(
-        data.strategy.concession_sequence,
-        ["táct", "interpersonal", "diseño", "setup", "secuencia", "actor", "orden"],
-    ):
-        suggestions.append(
-            "Hacé un mini 3D audit: táctica en mesa, diseño de propuestas y setup (quién decide, en qué orden y con qué proceso)."
-        )
-
-    if _contains_any(data.risk.main_risk, ["cierre", "firma", "último", "deadline", "demora"]) and not _contains_any(
-        data.risk.key_signal + " " + data.strategy.concession_sequence,
-        ["barrera", "impasse", "consecuencia", "plazo", "deadline", "tercero", "mediación"],
-    ):
-        clarification_questions.append(
-            "Si el cierre se traba, ¿qué barrera principal esperás (táctica, diseño o setup) y qué acción concreta aplicarás?"
-        )
-
-    if _contains_any(data.objective.explicit_objective, ["máximo", "muy alto", "agresivo", "techo", "premium"]) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.main_risk,
-        ["relación", "backlash", "aceptación gradual", "satisfacción", "percepción"],
-    ):
-        observations.append(
-            "Objetivo ambicioso detectado: cuidá el posible backlash relacional con concesiones graduales y cierre percibido como justo."
-        )
-
-    if not _contains_any(
-        data.strategy.counterpart_hypothesis + " " + data.risk.main_risk,
-        ["pregunta difícil", "ultim", "mínimo", "final offer", "hardest"],
-    ):
-        suggestions.append(
-            "Prepará respuesta para la 'pregunta más difícil' (mínimo aceptable, ultimátum o demanda de cierre inmediato) sin revelar de más."
-        )
-
-    if _contains_any(data.risk.emotional_variable + " " + data.risk.main_risk, ["ansiedad", "nerv", "miedo", "bloqueo"]) and not _contains_any(
-        data.strategy.concession_sequence,
-        ["práctica", "role", "ensayo", "coach", "reencuadre", "excitación"],
-    ):
-        suggestions.append(
-            "Incluí un ensayo breve pre-negociación: reencuadre de ansiedad en foco operativo y práctica de primera oferta."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["sindicato", "equipo", "coalición", "grupo", "colectiva"]) and not _contains_any(
-        data.strategy.concession_sequence,
-        ["coalición", "alineación", "mensaje común", "frente"],
-    ):
-        clarification_questions.append(
-            "Si negociás en grupo, ¿cómo vas a mantener mensaje común y disciplina de coalición durante la presión final?"
-        )
-
-    if _contains_any(data.context.negotiation_type, ["sindicato", "equipo", "coalición", "grupo", "colectiva", "familiar"]) and not _contains_any(
-        data.strategy.counterpart_hypothesis + " " + data.strategy.concession_sequence,
-        ["matriz", "prioridad", "alianza", "bloque", "voto", "paquete por actor"],
-    ):
-        suggestions.append(
-            "En multiparte, usá una mini matriz por actor (prioridades, BATNA y posible alineación) para anticipar cambios de coalición."
-        )
-
-    if _contains_any(
-        data.power_alternatives.maan,
-        ["invert", "investig", "tiempo", "costoso", "caro", "consultor", "due diligence"],
-    ) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.main_risk,
-        ["buena fe", "ética", "relación", "reciproc", "transpar", "largo plazo"],
-    ):
-        observations.append(
-            "Si invertiste mucho en alternativas, vigilá sesgo de entitlement/costos hundidos para no endurecerte de más y dañar la relación."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["salar", "oferta laboral", "compensación", "empleo"]):
-        if not _contains_any(
-            data.objective.minimum_acceptable_result + " " + data.strategy.concession_sequence,
-            ["desarrollo", "rol", "aprendiz", "mentor", "revisión", "crecimiento", "proyecto", "flex"],
-        ):
-            suggestions.append(
-                "Además del salario, incluí 1-2 variables de valor futuro (revisión, alcance de rol, desarrollo o flexibilidad)."
-            )
-
-        if not _contains_any(
-            data.strategy.counterpart_hypothesis + " " + data.power_alternatives.counterpart_perceived_strength,
-            ["banda", "política", "paquete", "no negociable", "estándar", "hr", "recruit"],
-        ):
-            clarification_questions.append(
-                "¿Qué parte del paquete es realmente no negociable y qué parte sí admite ajustes (timing, estructura, revisión)?"
-            )
-
-        if _contains_any(data.strategy.concession_sequence, ["lista", "todo", "muchas", "varias demandas"]) or _contains_any(
-            data.risk.main_risk,
-            ["rechazo", "revocar", "retirar oferta"],
-        ):
-            observations.append(
-                "En ofertas laborales conviene priorizar 2-3 temas críticos para evitar sobrecargar la contraparte y deteriorar la relación."
-            )
-
-        if not _contains_any(data.power_alternatives.maan, ["proceso", "otra oferta", "mercado", "alternativa", "actual"]):
-            inconsistencies.append(
-                "La estrategia salarial no explicita alternativa externa/interna; eso debilita tu poder de negociación percibido."
-            )
-
-    if _contains_any(data.context.counterpart_relationship, ["largo", "en curso", "nueva"]) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.strategy.counterpart_hypothesis,
-        ["rapport", "confianza", "alineación", "small talk", "transpar", "seguimiento", "check-in"],
-    ):
-        suggestions.append(
-            "Para cuidar la relación, definí una micro-rutina: apertura de rapport, transparencia de criterios y cierre con próximos pasos explícitos."
-        )
-
-    if _contains_any(data.risk.main_risk, ["relación", "confianza", "resent", "fricción"]) and not _contains_any(
-        data.risk.key_signal + " " + data.strategy.concession_sequence,
-        ["expectativa", "satisfacción", "compar", "explicación", "percepción"],
-    ):
-        clarification_questions.append(
-            "¿Cómo vas a gestionar expectativas y percepción de justicia para evitar que la otra parte “cobre” en la próxima negociación?"
-        )
-
-    if _contains_any(data.context.negotiation_type, ["familiar", "sucesión", "socios"]) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.key_signal,
-        ["neutral", "mediación", "tercero", "proceso", "transpar"],
-    ):
-        observations.append(
-            "En negociaciones con alto componente relacional conviene prever un tercero neutral y reglas de transparencia desde el inicio."
-        )
-
-    if not _contains_any(
-        data.strategy.concession_sequence + " " + data.strategy.counterpart_hypothesis,
-        ["debrief", "aprendiz", "analog", "transfer", "observ", "feedback"],
-    ):
-        suggestions.append(
-            "Para consolidar aprendizaje, agregá un mini debrief estructurado: qué patrón funcionó, qué ajustar y cómo transferirlo al próximo caso."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["simul", "entren", "clase"]) and not _contains_any(
-        data.risk.main_risk + " " + data.risk.key_signal,
-        ["ganar", "perder", "compet", "estrés", "defensiv", "hábito"],
-    ):
-        observations.append(
-            "En simulación, además del resultado, monitoreá sesgos de desempeño (miedo a perder, rigidez, reacción defensiva)."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["online", "virtual", "remota", "video", "zoom", "email", "mail"]):
-        if not _contains_any(
-            data.strategy.concession_sequence + " " + data.risk.key_signal,
-            ["canal", "video", "llamada", "email", "sincr", "asincr", "chat"],
-        ):
-            clarification_questions.append(
-                "¿Qué canal usarás en cada fase (alineación por videollamada, iteración por escrito y cierre por recap)?"
-            )
-
-        if _contains_any(data.context.negotiation_type + " " + data.strategy.concession_sequence, ["email", "mail", "asincr"]) and not _contains_any(
-            data.strategy.concession_sequence + " " + data.risk.key_signal,
-            ["plazo de respuesta", "cadencia", "48h", "24h", "resumen", "confirmación escrita"],
-        ):
-            suggestions.append(
-                "En tramos por e-mail, definí cadencia de respuesta y cierre de cada ronda con resumen escrito para reducir malentendidos."
-            )
-
-        if _contains_any(data.context.negotiation_type + " " + data.strategy.concession_sequence, ["video", "zoom", "meet", "teams"]) and not _contains_any(
-            data.strategy.concession_sequence + " " + data.risk.main_risk,
-            ["rapport", "confianza", "apertura", "agenda", "turnos", "sin interrup"],
-        ):
-            observations.append(
-                "En videonegociación conviene explicitar una apertura breve de rapport y reglas de interacción (agenda, turnos y recap)."
-            )
-
-    if _contains_any(data.risk.main_risk, ["malentendido", "interpret", "tono", "fricción digital"]) and not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.key_signal,
-        ["parafrase", "resumen", "confirmación", "check-back", "pregunta de validación"],
-    ):
-        inconsistencies.append(
-            "Hay riesgo de malentendidos, pero no aparece un protocolo explícito de validación (paráfrasis + confirmación)."
-        )
-
-    if not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.key_signal,
-        ["ensayo", "rehears", "simulación", "práctica", "debrief", "aprendiz"],
-    ):
-        suggestions.append(
-            "Antes de negociar, hacé un ensayo breve (10 min) y definí qué indicador revisarás en debrief para sostener aprendizaje transferible."
-        )
-
-    if not _contains_any(
-        data.strategy.concession_sequence + " " + data.risk.key_signal,
-        ["hábito", "microconducta", "si pasa", "entonces", "provoc", "coach", "interrup"],
-    ):
-        suggestions.append(
-            "Definí una microconducta observable para practicar bajo presión (por ejemplo: pausar, parafrasear y preguntar antes de conceder)."
-        )
-
-    if _contains_any(data.context.negotiation_type, ["empresa", "b2b", "proveedor", "interna", "equipo"]) and not _contains_any(
-        data.power_alternatives.counterpart_perceived_strength + " " + data.strategy.counterpart_hypothesis,
-        ["incentivo", "métrica", "autoridad", "proceso", "estructura", "aprobación", "presupuesto"],
-    ):
-        observations.append(
-            "Podrían faltar restricciones estructurales de la organización (métricas, incentivos, autoridad o proceso) que impactan el resultado."
-        )
+    buckets = _COMPILED_RULES.evaluate(data)
+    inconsistencies.extend(buckets["inconsistencies"])
+    clarification_questions = buckets["clarification_questions"]
+    observations = buckets["observations"]
+    suggestions = buckets["suggestions"]
 
     if not observations:
         observations.append("La preparación cubre variables clave y mantiene un encuadre estratégico consistente.")
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class AnalysisJobQueue:
+    """Pool acotado de workers que procesa jobs de análisis persistidos por id.
+
+    El estado del job vive en la base (tabla analysisjob); la cola solo transporta ids,
+    así que un reinicio puede reencolar lo pendiente sin perder trabajo. El tamaño del
+    pool es el techo de llamadas concurrentes al proveedor desde este proceso.
+    """
+
+    def __init__(self, handler: Callable[[int], None], max_workers: int) -> None:
+        self._handler = handler
+        self.max_workers = max(1, max_workers)
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="analysis-job",
+                )
+            return self._executor
+
+    def submit(self, job_id: int) -> Future:
+        return self._get_executor().submit(self._handler, job_id)
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
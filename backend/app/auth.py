@@ -5,15 +5,25 @@ from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlmodel import Session, select
 
+from .cache import TTLCache
 from .db import get_session
 from .models import User
+from .password_hashing import PasswordHasher, pwd_context
 from .settings import settings
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
+password_hasher = PasswordHasher(
+    max_workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+)
+
+# id -> snapshot del usuario; evita la consulta a la base en cada request autenticado.
+user_cache = TTLCache(
+    max_entries=settings.auth_user_cache_max_entries,
+    ttl_seconds=settings.auth_user_cache_ttl_seconds,
+)
 
 
 def hash_password(password: str) -> str:
@@ -24,13 +34,51 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
 
-def create_access_token(subject: str) -> str:
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    return await password_hasher.verify(plain_password, password_hash)
+
+
+def create_access_token(user: User) -> str:
     expires_delta = timedelta(minutes=settings.access_token_expire_minutes)
     expire = datetime.now(timezone.utc) + expires_delta
-    payload = {"sub": subject, "exp": expire}
+    payload = {
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role.value,
+        "tv": user.token_version,
+        "exp": expire,
+    }
     return jwt.encode(payload, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
 
 
+def invalidate_cached_user(user_id: int | None) -> None:
+    if user_id is not None:
+        user_cache.invalidate(user_id)
+
+
+def _cache_user(user: User) -> None:
+    user_cache.set(user.id, user.model_dump())
+
+
+def _load_user(session: Session, user_id: int) -> User | None:
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        # Copia nueva por request: el snapshot compartido no se muta ni queda atado a una sesión.
+        return User(**cached)
+    user = session.get(User, user_id)
+    if user is not None:
+        _cache_user(user)
+    return user
+
+
+def _matches_token(user: User, payload: dict) -> bool:
+    return user.token_version == payload.get("tv") and user.role.value == payload.get("role")
+
+
 def _unauthorized() -> HTTPException:
     return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
 
@@ -51,9 +99,21 @@ def get_current_user(
     except JWTError as exc:
         raise _unauthorized() from exc
 
-    statement = select(User).where(User.email == subject)
-    user = session.exec(statement).first()
-    if not user or not user.is_active:
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Tokens emitidos antes de incluir uid/rol/versión: se validan contra la base.
+        user = session.exec(select(User).where(User.email == subject)).first()
+        if not user or not user.is_active:
+            raise _unauthorized()
+        return user
+
+    user = _load_user(session, user_id)
+    if user is not None and not _matches_token(user, payload):
+        # El cache es por proceso: otro worker pudo cambiar la versión o el rol y emitir un
+        # token nuevo. Antes de rechazar se compara contra la base.
+        invalidate_cached_user(user_id)
+        user = _load_user(session, user_id)
+    if not user or not user.is_active or not _matches_token(user, payload):
         raise _unauthorized()
 
     return user
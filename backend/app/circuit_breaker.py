@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker por tasa de fallas sobre una ventana de las últimas llamadas.
+
+    - closed: deja pasar todo; si la tasa de fallas de la ventana supera el umbral, abre.
+    - open: rechaza sin llamar al proveedor hasta que pasan open_seconds.
+    - half_open: deja pasar hasta half_open_max_calls llamadas de prueba; un éxito cierra,
+      una falla vuelve a abrir.
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float,
+        window_size: int,
+        minimum_calls: int,
+        open_seconds: float,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_size = max(1, window_size)
+        self.minimum_calls = max(1, minimum_calls)
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._outcomes: deque[bool] = deque(maxlen=self.window_size)
+            self._opened_at = 0.0
+            self._half_open_in_flight = 0
+            self.short_circuited = 0
+            self.times_opened = 0
+
+    def _refresh_state(self) -> None:
+        if self._state == CircuitState.OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+        self._half_open_in_flight = 0
+        self.times_opened += 1
+
+    def _failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._refresh_state()
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._state = CircuitState.CLOSED
+                self._outcomes.clear()
+                self._half_open_in_flight = 0
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            if (
+                self._state == CircuitState.CLOSED
+                and len(self._outcomes) >= self.minimum_calls
+                and self._failure_rate() >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def release(self) -> None:
+        """Devuelve un cupo de prueba sin registrar resultado (ej. llamada cancelada por el cliente)."""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refresh_state()
+            retry_in = 0.0
+            if self._state == CircuitState.OPEN:
+                retry_in = max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+            return {
+                "state": self._state.value,
+                "failure_rate": round(self._failure_rate(), 4),
+                "window_calls": len(self._outcomes),
+                "window_size": self.window_size,
+                "failure_rate_threshold": self.failure_rate_threshold,
+                "open_seconds": self.open_seconds,
+                "retry_in_seconds": round(retry_in, 2),
+                "times_opened": self.times_opened,
+                "short_circuited": self.short_circuited,
+            }
@@ -1,79 +1,67 @@
-from sqlalchemy import text
-from sqlmodel import Session, SQLModel, create_engine
-
-DATABASE_URL = "sqlite:///./rb_framework.db"
-
-engine = create_engine(DATABASE_URL, echo=False)
-
-
-def _ensure_case_columns() -> None:
-    with engine.begin() as conn:
-        table_exists = conn.execute(
-            text("SELECT name FROM sqlite_master WHERE type='table' AND name='case'")
-        ).first()
-        if not table_exists:
-            return
-
-        existing_columns = {
-            row[1]
-            for row in conn.execute(text("PRAGMA table_info('case')")).fetchall()
-        }
-
-        migration_columns = {
-            "owner_user_id": "INTEGER",
-            "cohort_id": "INTEGER",
-            "origin": "VARCHAR(20) NOT NULL DEFAULT 'sparring'",
-            "is_read_only": "BOOLEAN NOT NULL DEFAULT 0",
-            "confidence_start": "INTEGER",
-            "confidence_end": "INTEGER",
-            "agreement_quality_result": "INTEGER",
-            "agreement_quality_relationship": "INTEGER",
-            "agreement_quality_sustainability": "INTEGER",
-            "closed_at": "DATETIME",
-        }
-
-        for col_name, col_type in migration_columns.items():
-            if col_name not in existing_columns:
-                conn.execute(text(f"ALTER TABLE 'case' ADD COLUMN {col_name} {col_type}"))
-
-        conn.execute(
-            text(
-                "UPDATE 'case' "
-                "SET origin = CASE origin "
-                "WHEN 'SPARRING' THEN 'sparring' "
-                "WHEN 'LIVE_SESSION' THEN 'live_session' "
-                "ELSE origin END "
-                "WHERE origin IN ('SPARRING', 'LIVE_SESSION')"
-            )
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, create_engine
+
+from .migrations import run_migrations
+from .settings import settings
+
+DATABASE_URL = settings.database_url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # Se aplica a cada conexión nueva del pool; WAL deja leer mientras otro escribe.
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size_bytes)}")
+        # cache_size negativo se expresa en KiB en lugar de páginas.
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kib)}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str) -> Engine:
+    database_url = make_url(url)
+    if database_url.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            echo=False,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_pre_ping=True,
         )
 
-
-def _ensure_leader_evaluation_columns() -> None:
-    with engine.begin() as conn:
-        table_exists = conn.execute(
-            text("SELECT name FROM sqlite_master WHERE type='table' AND name='leaderevaluation'")
-        ).first()
-        if not table_exists:
-            return
-
-        existing_columns = {
-            row[1]
-            for row in conn.execute(text("PRAGMA table_info('leaderevaluation')")).fetchall()
+    in_memory = database_url.database in (None, "", ":memory:")
+    pool_options = (
+        # Una base en memoria vive en su conexión: todos los threads deben compartir la misma.
+        {"poolclass": StaticPool}
+        if in_memory
+        else {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout_seconds,
         }
+    )
+    # La espera por locks la fija PRAGMA busy_timeout en cada conexión nueva.
+    sqlite_engine = create_engine(
+        url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+        **pool_options,
+    )
+    event.listen(sqlite_engine, "connect", _set_sqlite_pragmas)
+    return sqlite_engine
 
-        migration_columns = {
-            "follow_up_date": "DATETIME",
-        }
 
-        for col_name, col_type in migration_columns.items():
-            if col_name not in existing_columns:
-                conn.execute(text(f"ALTER TABLE 'leaderevaluation' ADD COLUMN {col_name} {col_type}"))
+engine = create_db_engine(DATABASE_URL)
 
 
 def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
-    _ensure_case_columns()
-    _ensure_leader_evaluation_columns()
+    run_migrations(engine)
 
 
 def get_session():
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Iterable
+
+
+class KeywordAutomaton:
+    """Autómata Aho-Corasick: encuentra todas las keywords de un texto en una sola pasada.
+
+    Se construye una vez y se determiniza (cada estado conoce su transición para todo
+    carácter del alfabeto), de modo que el recorrido es una búsqueda en dict por carácter,
+    independiente de la cantidad de keywords del catálogo.
+    """
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        self.keywords = frozenset(keyword for keyword in keywords if keyword)
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[set[str]] = [set()]
+
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(keyword)
+
+        alphabet = {char for keyword in self.keywords for char in keyword}
+        fail = [0] * len(goto)
+        transitions: list[dict[str, int]] = [{} for _ in goto]
+        transitions[0] = dict(goto[0])
+
+        queue: deque[int] = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            for char in alphabet:
+                child = goto[state].get(char)
+                if child is not None:
+                    fail[child] = transitions[fail[state]].get(char, 0)
+                    transitions[state][char] = child
+                    queue.append(child)
+                else:
+                    fallback = transitions[fail[state]].get(char, 0)
+                    if fallback:
+                        transitions[state][char] = fallback
+
+        self._transitions = transitions
+        self._outputs = [frozenset(output) for output in outputs]
+
+    def find_all(self, text: str) -> frozenset[str]:
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+        found: set[str] = set()
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return frozenset(found)
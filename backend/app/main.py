@@ -2,17 +2,42 @@
 from __future__ import annotations
 from fastapi import Body
 
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+import math
+from collections.abc import Awaitable, Callable
 from contextlib import asynccontextmanager
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import func, tuple_, update
 from sqlmodel import Session, select
 
-from .analysis_engine import analyze_preparation, build_final_memo
-from .auth import create_access_token, get_current_user, hash_password, verify_password
+from .analysis_engine import analysis_cache_key, analyze_preparation, build_final_memo, preparation_fingerprint
+from .analysis_jobs import AnalysisJobQueue
+from .auth import (
+    create_access_token,
+    get_current_user,
+    hash_password,
+    hash_password_async,
+    invalidate_cached_user,
+    password_hasher,
+    verify_password_async,
+)
+from .cache import TTLCache
+from .circuit_breaker import CircuitBreaker
 from .db import engine, get_session, init_db
 from .models import (
+    AnalysisBatch,
+    AnalysisJob,
+    AnalysisJobStatus,
     Case,
     CaseOrigin,
     CaseStatus,
@@ -20,16 +45,38 @@ from .models import (
     Cohort,
     CohortMembership,
     CohortStatus,
+    FeedbackMode,
     LeaderEvaluation,
+    LLMCallMetric,
+    MetricsRollup,
+    MetricsScope,
     User,
     UserRole,
 )
-from .openai_engine import analyze_preparation_with_openai
+from .metrics_rollup import read_metrics_summary, record_case_closed, record_case_created, record_case_deleted
+from .openai_engine import (
+    LLMCallInfo,
+    analyze_preparation_with_openai,
+    analyze_preparation_with_openai_async,
+    close_async_openai_client,
+    close_openai_client,
+    fetch_analysis_batch_results,
+    retrieve_analysis_batch,
+    stream_analysis_with_openai,
+    submit_analysis_batch,
+)
 from .schemas import (
     AdminAnonymousMetricsSummary,
     AdminUserCreate,
     AdminUserRead,
+    AdminUserUpdate,
+    AnalysisBatchRead,
+    AnalysisCacheStats,
+    AnalysisJobRead,
     AnalysisOutput,
+    BulkUserImport,
+    BulkUserImportResult,
+    CircuitBreakerStatus,
     CaseCreate,
     CaseFromTemplateCreate,
     CaseListItem,
@@ -42,23 +89,52 @@ from .schemas import (
     CohortUpdate,
     DebriefInput,
     FinalMemo,
-    MetricsTrendPoint,
     StudentMetricsSummary,
     LeaderEvaluationCreate,
     LeaderEvaluationRead,
+    LLMUsageBucket,
     LoginInput,
+    PasswordHashingStats,
     PreparationInput,
     TokenResponse,
     UserProfile,
 )
 from .settings import settings
+from .singleflight import SingleFlight
 from .templates import CASE_TEMPLATES
 
 
+logger = logging.getLogger(__name__)
+
+STALE_ANALYSIS_JOB_AFTER = timedelta(minutes=10)
+ANALYSIS_BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+CASE_LIST_MAX_LIMIT = 200
+CASE_LIST_COLUMNS = tuple(getattr(Case, field) for field in CaseListItem.model_fields)
+
+
 def _utc_now() -> datetime:
     return datetime.now(UTC)
 
 
+analysis_cache = TTLCache(
+    max_entries=settings.analysis_cache_max_entries,
+    ttl_seconds=settings.analysis_cache_ttl_seconds,
+)
+analysis_flights = SingleFlight()
+# user_id -> perfil de acceso resuelto; la entrada vence en el próximo borde de cohorte/membresía.
+access_cache = TTLCache(
+    max_entries=settings.access_cache_max_entries,
+    ttl_seconds=settings.access_cache_ttl_seconds,
+)
+_background_tasks: set[asyncio.Task] = set()
+openai_breaker = CircuitBreaker(
+    failure_rate_threshold=settings.openai_breaker_failure_rate,
+    window_size=settings.openai_breaker_window_size,
+    minimum_calls=settings.openai_breaker_minimum_calls,
+    open_seconds=settings.openai_breaker_open_seconds,
+)
+
+
 def _bootstrap_admin() -> None:
     init_db()
     with Session(engine) as session:
@@ -76,10 +152,47 @@ def _bootstrap_admin() -> None:
             session.commit()
 
 
+def _sweep_expired_memberships(now: datetime | None = None) -> int:
+    now = now or _utc_now()
+    with Session(engine) as session:
+        result = session.execute(
+            update(CohortMembership)
+            .where(CohortMembership.is_active == True)  # noqa: E712
+            .where(CohortMembership.expiry_date.is_not(None))
+            .where(CohortMembership.expiry_date < now)
+            .values(is_active=False, left_at=now)
+        )
+        session.commit()
+    if result.rowcount:
+        access_cache.clear()
+    return result.rowcount
+
+
+async def _background_sweeper() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(_sweep_expired_memberships)
+        except Exception:
+            logger.exception("Falló el barrido de membresías vencidas")
+        try:
+            # Un reinicio rápido deja jobs "running" todavía recientes: se reencolan cuando vencen.
+            await asyncio.to_thread(_requeue_stale_analysis_jobs)
+        except Exception:
+            logger.exception("Falló el barrido de jobs de análisis colgados")
+        await asyncio.sleep(settings.membership_sweep_interval_seconds)
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     _bootstrap_admin()
+    _resume_analysis_jobs()
+    sweeper = asyncio.create_task(_background_sweeper())
     yield
+    sweeper.cancel()
+    analysis_jobs.shutdown()
+    password_hasher.shutdown()
+    close_openai_client()
+    await close_async_openai_client()
 
 
 app = FastAPI(title="RB Strategic Framework API", lifespan=lifespan)
@@ -89,11 +202,14 @@ app.add_middleware(
     allow_origins=list(settings.frontend_origins),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
-def _save_version(session: Session, case_id: int, event: str, payload: dict) -> None:
-    session.add(CaseVersion(case_id=case_id, event=event, payload=payload))
+def _save_version(session: Session, case_id: int, event: str, payload: dict) -> CaseVersion:
+    version = CaseVersion(case_id=case_id, event=event, payload=payload)
+    session.add(version)
+    return version
 
 
 def _get_case_or_404(session: Session, case_id: int) -> Case:
@@ -118,80 +234,116 @@ def _is_valid_period_label(value: str) -> bool:
         return False
 
 
-def _resolve_user_access(session: Session, user: User) -> dict:
-    if user.role == UserRole.ADMIN:
-        return {
-            "effective_mode": "sparring",
-            "can_access_live_session": True,
-            "can_access_sparring": True,
-            "active_cohort_id": None,
-            "active_cohort_name": None,
-        }
+def _as_utc(value: datetime) -> datetime:
+    # SQLite devuelve datetimes naive; se guardan siempre en UTC.
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
 
-    now = _utc_now()
-    # Buscar membresía activa en cohorte activa (modo clase)
-    statement_active = (
+
+def _default_access(user: User) -> dict:
+    return {
+        "effective_mode": "sparring",
+        "can_access_live_session": user.role == UserRole.ADMIN,
+        "can_access_sparring": True,
+        "active_cohort_id": None,
+        "active_cohort_name": None,
+    }
+
+
+def _compute_user_access(session: Session, user: User, now: datetime) -> tuple[dict, datetime | None]:
+    """Resuelve el acceso con una sola consulta y devuelve también hasta cuándo es válido:
+    el próximo inicio/fin de cohorte o vencimiento de membresía que podría cambiarlo."""
+    rows = session.exec(
         select(CohortMembership, Cohort)
         .join(Cohort, CohortMembership.cohort_id == Cohort.id)
         .where(CohortMembership.user_id == user.id)
-        .where(CohortMembership.is_active == True)
-        .where(Cohort.status == CohortStatus.ACTIVE)
-        .where(Cohort.start_date <= now)
-        .where(Cohort.end_date >= now)
-        .order_by(Cohort.start_date.desc())
+        .where(CohortMembership.is_active == True)  # noqa: E712
+    ).all()
+
+    boundaries = [
+        _as_utc(moment)
+        for membership, cohort in rows
+        for moment in (cohort.start_date, cohort.end_date, membership.expiry_date)
+        if moment is not None and _as_utc(moment) > now
+    ]
+    valid_until = min(boundaries, default=None)
+
+    # Solo lectura: las membresías vencidas se ignoran aquí y el sweeper las desactiva en bloque.
+    rows = [
+        (membership, cohort)
+        for membership, cohort in rows
+        if not membership.expiry_date or _as_utc(membership.expiry_date) >= now
+    ]
+
+    # Membresía activa en cohorte activa (modo clase)
+    live = sorted(
+        (
+            (membership, cohort)
+            for membership, cohort in rows
+            if cohort.status == CohortStatus.ACTIVE and _as_utc(cohort.start_date) <= now <= _as_utc(cohort.end_date)
+        ),
+        key=lambda item: _as_utc(item[1].start_date),
+        reverse=True,
     )
-    active = session.exec(statement_active).first()
-    if active:
-        membership, cohort = active
-        # Si la membresía tiene fecha de vencimiento y está vencida, marcar como inactiva
-        if membership.expiry_date and membership.expiry_date < now:
-            membership.is_active = False
-            membership.left_at = now
-            session.add(membership)
-            session.commit()
-        else:
-            return {
-                "effective_mode": "sesion_en_vivo",
-                "can_access_live_session": True,
-                "can_access_sparring": True,
-                "active_cohort_id": cohort.id,
-                "active_cohort_name": cohort.name,
-            }
-
-    # Buscar membresía activa en cohorte finalizada (modo sparring)
-    statement_finished = (
-        select(CohortMembership, Cohort)
-        .join(Cohort, CohortMembership.cohort_id == Cohort.id)
-        .where(CohortMembership.user_id == user.id)
-        .where(CohortMembership.is_active == True)
-        .where(Cohort.status == CohortStatus.FINISHED)
-        .order_by(Cohort.end_date.desc())
+    if live:
+        cohort = live[0][1]
+        return {
+            "effective_mode": "sesion_en_vivo",
+            "can_access_live_session": True,
+            "can_access_sparring": True,
+            "active_cohort_id": cohort.id,
+            "active_cohort_name": cohort.name,
+        }, valid_until
+
+    # Membresía activa en cohorte finalizada (modo sparring)
+    finished = sorted(
+        ((membership, cohort) for membership, cohort in rows if cohort.status == CohortStatus.FINISHED),
+        key=lambda item: _as_utc(item[1].end_date),
+        reverse=True,
     )
-    finished = session.exec(statement_finished).first()
     if finished:
-        membership, cohort = finished
-        if membership.expiry_date and membership.expiry_date < now:
-            membership.is_active = False
-            membership.left_at = now
-            session.add(membership)
-            session.commit()
-        else:
-            return {
-                "effective_mode": "sparring",
-                "can_access_live_session": False,
-                "can_access_sparring": True,
-                "active_cohort_id": cohort.id,
-                "active_cohort_name": cohort.name,
-            }
+        cohort = finished[0][1]
+        return {
+            "effective_mode": "sparring",
+            "can_access_live_session": False,
+            "can_access_sparring": True,
+            "active_cohort_id": cohort.id,
+            "active_cohort_name": cohort.name,
+        }, valid_until
 
     # Caso por defecto: sin membresía activa
-    return {
-        "effective_mode": "sparring",
-        "can_access_live_session": False,
-        "can_access_sparring": True,
-        "active_cohort_id": None,
-        "active_cohort_name": None,
-    }
+    return _default_access(user), valid_until
+
+
+def _resolve_user_access(session: Session, user: User) -> dict:
+    if user.role == UserRole.ADMIN:
+        return _default_access(user)
+
+    cached = access_cache.get(user.id)
+    if cached is not None:
+        return dict(cached)
+
+    now = _utc_now()
+    access, valid_until = _compute_user_access(session, user, now)
+    ttl = (valid_until - now).total_seconds() if valid_until else None
+    access_cache.set(user.id, dict(access), ttl_seconds=ttl)
+    return access
+
+
+def _invalidate_user_access(*user_ids: int | None) -> None:
+    for user_id in user_ids:
+        if user_id is not None:
+            access_cache.invalidate(user_id)
+
+
+def _get_user_by_email(session: Session, email: str) -> User | None:
+    return session.exec(select(User).where(User.email == email)).first()
+
+
+def _commit_and_refresh(session: Session, instance):
+    session.add(instance)
+    session.commit()
+    session.refresh(instance)
+    return instance
 
 
 def _to_user_profile(session: Session, user: User) -> UserProfile:
@@ -218,64 +370,11 @@ def _get_case_for_user(session: Session, case_id: int, user: User) -> Case:
     return case
 
 
-def _round_or_none(value: float | None, digits: int = 2) -> float | None:
-    if value is None:
-        return None
-    return round(value, digits)
-
-
-def _build_metrics_summary(cases: list[Case], cohort_id: int | None = None) -> dict:
-    cases_total = len(cases)
-    closed_cases = [item for item in cases if item.status == CaseStatus.CERRADO]
-    cases_closed = len(closed_cases)
-    close_rate = (cases_closed / cases_total * 100) if cases_total else 0.0
-
-    cycle_days_values: list[int] = []
-    agreement_quality_values: list[float] = []
-    confidence_delta_values: list[int] = []
-    trend_buckets: dict[str, list[int]] = {}
-
-    for case in closed_cases:
-        if case.closed_at and case.created_at:
-            delta_days = (case.closed_at.date() - case.created_at.date()).days
-            cycle_days_values.append(max(delta_days, 0))
-
-        quality_parts = [
-            case.agreement_quality_result,
-            case.agreement_quality_relationship,
-            case.agreement_quality_sustainability,
-        ]
-        quality_valid = [float(item) for item in quality_parts if item is not None]
-        if quality_valid:
-            agreement_quality_values.append(sum(quality_valid) / len(quality_valid))
-
-        if case.confidence_start is not None and case.confidence_end is not None:
-            delta = case.confidence_end - case.confidence_start
-            confidence_delta_values.append(delta)
-            period = (case.closed_at or case.updated_at).strftime("%Y-%m")
-            trend_buckets.setdefault(period, []).append(delta)
-
-    trend: list[MetricsTrendPoint] = []
-    for period in sorted(trend_buckets.keys()):
-        values = trend_buckets[period]
-        trend.append(
-            MetricsTrendPoint(
-                period=period,
-                confidence_delta_avg=round(sum(values) / len(values), 2),
-                cases_count=len(values),
-            )
-        )
-
-    return {
-        "cohort_id": cohort_id,
-        "cases_total": cases_total,
-        "cases_closed": cases_closed,
-        "close_rate": round(close_rate, 2),
-        "cycle_days_avg": _round_or_none(sum(cycle_days_values) / len(cycle_days_values), 2) if cycle_days_values else None,
-        "agreement_quality_avg": _round_or_none(sum(agreement_quality_values) / len(agreement_quality_values), 2) if agreement_quality_values else None,
-        "confidence_delta_avg": _round_or_none(sum(confidence_delta_values) / len(confidence_delta_values), 2) if confidence_delta_values else None,
-        "confidence_delta_trend": trend,
-    }
+def _analysis_provider_key() -> str:
+    # "hedged" cachea solo resultados de OpenAI, así que comparte clave con "openai".
+    if settings.analysis_provider in ("openai", "hedged"):
+        return f"openai:{settings.openai_model}"
+    return "rules"
 
 
 @app.get("/api/health")
@@ -307,17 +406,18 @@ def admin_update_cohort_member(
         membership.expiry_date = payload["expiry_date"]
     session.add(membership)
     session.commit()
+    _invalidate_user_access(user_id)
     return {"ok": True}
 
 @app.post("/api/auth/login", response_model=TokenResponse)
-def login(payload: LoginInput, session: Session = Depends(get_session)) -> TokenResponse:
-    statement = select(User).where(User.email == payload.email)
-    user = session.exec(statement).first()
-    if not user or not user.is_active or not verify_password(payload.password, user.password_hash):
+async def login(payload: LoginInput, session: Session = Depends(get_session)) -> TokenResponse:
+    user = await asyncio.to_thread(_get_user_by_email, session, payload.email)
+    if not user or not user.is_active or not await verify_password_async(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
-    token = create_access_token(subject=user.email)
-    return TokenResponse(access_token=token, user=_to_user_profile(session, user))
+    token = create_access_token(user)
+    profile = await asyncio.to_thread(_to_user_profile, session, user)
+    return TokenResponse(access_token=token, user=profile)
 
 
 @app.get("/api/auth/me", response_model=UserProfile)
@@ -339,26 +439,175 @@ def admin_list_users(
 
 
 @app.post("/api/admin/users", response_model=AdminUserRead)
-def admin_create_user(
+async def admin_create_user(
     payload: AdminUserCreate,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> User:
     _require_admin(current_user)
-    existing = session.exec(select(User).where(User.email == payload.email)).first()
+    existing = await asyncio.to_thread(_get_user_by_email, session, payload.email)
     if existing:
         raise HTTPException(status_code=400, detail="El email ya existe")
 
     user = User(
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password_async(payload.password),
         full_name=payload.full_name,
         role=payload.role,
         is_active=True,
     )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    return await asyncio.to_thread(_commit_and_refresh, session, user)
+
+
+def _parse_user_import(body: bytes, content_type: str, cohort_id: int | None, skip_existing: bool) -> BulkUserImport:
+    if content_type.startswith("text/csv"):
+        try:
+            text = body.decode("utf-8-sig")
+        except UnicodeDecodeError as exc:
+            raise HTTPException(status_code=400, detail="El CSV debe estar en UTF-8") from exc
+        # Columnas: email,password,full_name,role (las dos últimas opcionales).
+        rows = [
+            {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+        payload = {"users": rows, "cohort_id": cohort_id, "skip_existing": skip_existing}
+    else:
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError as exc:
+            raise HTTPException(status_code=400, detail="JSON inválido") from exc
+
+    try:
+        return BulkUserImport.model_validate(payload)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False)) from exc
+
+
+@app.post("/api/admin/users/import", response_model=BulkUserImportResult)
+async def admin_import_users(
+    request: Request,
+    cohort_id: int | None = None,
+    skip_existing: bool = False,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> BulkUserImportResult:
+    """Alta masiva desde JSON (`BulkUserImport`) o CSV crudo (`Content-Type: text/csv`)."""
+    _require_admin(current_user)
+    data = _parse_user_import(
+        await request.body(),
+        request.headers.get("content-type", ""),
+        cohort_id,
+        skip_existing,
+    )
+    if not data.users:
+        raise HTTPException(status_code=400, detail="No hay usuarios para importar")
+    if len(data.users) > settings.user_import_max_rows:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.user_import_max_rows} usuarios por importación",
+        )
+    if data.cohort_id is not None and not await asyncio.to_thread(session.get, Cohort, data.cohort_id):
+        raise HTTPException(status_code=404, detail="Cohorte no encontrada")
+
+    emails = [row.email.strip() for row in data.users]
+    existing_users = {
+        user.email: user
+        for user in await asyncio.to_thread(lambda: session.exec(select(User).where(User.email.in_(emails))).all())
+    }
+
+    errors: list[dict] = []
+    seen: set[str] = set()
+    to_create: list[tuple[str, AdminUserCreate]] = []
+    for index, (email, row) in enumerate(zip(emails, data.users), start=1):
+        if "@" not in email:
+            errors.append({"row": index, "email": email, "error": "Email inválido"})
+        elif not row.password:
+            errors.append({"row": index, "email": email, "error": "Contraseña requerida"})
+        elif email in seen:
+            errors.append({"row": index, "email": email, "error": "Email repetido en la importación"})
+        elif email in existing_users and not data.skip_existing:
+            errors.append({"row": index, "email": email, "error": "El email ya existe"})
+        elif email not in existing_users:
+            to_create.append((email, row))
+        seen.add(email)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    password_hashes = await asyncio.gather(*(hash_password_async(row.password) for _, row in to_create))
+    new_users = [
+        User(email=email, password_hash=password_hash, full_name=row.full_name, role=row.role, is_active=True)
+        for (email, row), password_hash in zip(to_create, password_hashes)
+    ]
+
+    def store_import() -> tuple[BulkUserImportResult, list[int]]:
+        session.add_all(new_users)
+        session.flush()
+
+        member_ids: list[int] = []
+        if data.cohort_id is not None:
+            member_ids = [user.id for user in new_users]
+            skipped_ids = [user.id for user in existing_users.values()]
+            if skipped_ids:
+                already_members = set(
+                    session.exec(
+                        select(CohortMembership.user_id)
+                        .where(CohortMembership.cohort_id == data.cohort_id)
+                        .where(CohortMembership.user_id.in_(skipped_ids))
+                        .where(CohortMembership.is_active == True)  # noqa: E712
+                    ).all()
+                )
+                member_ids.extend(user_id for user_id in skipped_ids if user_id not in already_members)
+            session.add_all(
+                CohortMembership(user_id=user_id, cohort_id=data.cohort_id, is_active=True) for user_id in member_ids
+            )
+
+        # La respuesta se arma antes del commit: evita recargar cada usuario después.
+        result = BulkUserImportResult(
+            created=len(new_users),
+            enrolled=len(member_ids),
+            skipped_emails=sorted(existing_users),
+            users=[AdminUserRead.model_validate(user) for user in new_users],
+        )
+        session.commit()
+        return result, member_ids
+
+    result, member_ids = await asyncio.to_thread(store_import)
+    _invalidate_user_access(*member_ids)
+    return result
+
+
+@app.patch("/api/admin/users/{user_id}", response_model=AdminUserRead)
+async def admin_update_user(
+    user_id: int,
+    payload: AdminUserUpdate,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> User:
+    _require_admin(current_user)
+    user = await asyncio.to_thread(session.get, User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+    data = payload.model_dump(exclude_unset=True, exclude_none=True)
+    revoke_tokens = False
+    if "full_name" in data:
+        user.full_name = data["full_name"]
+    if "role" in data and data["role"] != user.role:
+        user.role = data["role"]
+        revoke_tokens = True
+    if "is_active" in data and data["is_active"] != user.is_active:
+        user.is_active = data["is_active"]
+        revoke_tokens = revoke_tokens or not user.is_active
+    if "password" in data:
+        user.password_hash = await hash_password_async(data["password"])
+        revoke_tokens = True
+    if revoke_tokens:
+        user.token_version += 1
+    user.updated_at = _utc_now()
+
+    await asyncio.to_thread(_commit_and_refresh, session, user)
+    invalidate_cached_user(user.id)
+    _invalidate_user_access(user.id)
     return user
 
 
@@ -410,6 +659,8 @@ def admin_update_cohort(
     session.add(cohort)
     session.commit()
     session.refresh(cohort)
+    # Estado y fechas de la cohorte definen el acceso de todos sus miembros.
+    access_cache.clear()
     return cohort
 
 
@@ -444,6 +695,7 @@ def admin_add_cohort_members(
         added += 1
 
     session.commit()
+    _invalidate_user_access(*payload.user_ids)
     return {"ok": True, "added": added}
 
 
@@ -468,6 +720,7 @@ def admin_remove_cohort_member(
     membership.left_at = _utc_now()
     session.add(membership)
     session.commit()
+    _invalidate_user_access(user_id)
     return {"ok": True}
 
 
@@ -585,6 +838,7 @@ def create_case(
         confidence_start=case_in.confidence_start,
     )
     session.add(case)
+    record_case_created(session, case)
     session.commit()
     session.refresh(case)
 
@@ -594,16 +848,55 @@ def create_case(
     return case
 
 
+def _encode_case_cursor(updated_at: datetime, case_id: int) -> str:
+    raw = json.dumps({"updated_at": updated_at.isoformat(), "id": case_id})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_case_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(data["updated_at"]), int(data["id"])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Cursor inválido") from exc
+
+
 @app.get("/api/cases", response_model=list[CaseListItem])
 def list_cases(
+    response: Response,
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: CaseStatus | None = None,
+    cohort_id: int | None = None,
+    owner_user_id: int | None = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
-) -> list[Case]:
-    statement = select(Case)
+) -> list[CaseListItem]:
+    if limit is not None and not 1 <= limit <= CASE_LIST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit debe estar entre 1 y {CASE_LIST_MAX_LIMIT}")
+
+    # Solo las columnas del listado: los blobs JSON del caso no se leen ni se deserializan.
+    statement = select(*CASE_LIST_COLUMNS, Case.updated_at)
     if current_user.role != UserRole.ADMIN:
         statement = statement.where(Case.owner_user_id == current_user.id)
-    statement = statement.order_by(Case.updated_at.desc())
-    return list(session.exec(statement).all())
+    if owner_user_id is not None:
+        statement = statement.where(Case.owner_user_id == owner_user_id)
+    if status is not None:
+        statement = statement.where(Case.status == status)
+    if cohort_id is not None:
+        statement = statement.where(Case.cohort_id == cohort_id)
+    if cursor is not None:
+        after_updated_at, after_id = _decode_case_cursor(cursor)
+        statement = statement.where(tuple_(Case.updated_at, Case.id) < tuple_(after_updated_at, after_id))
+    statement = statement.order_by(Case.updated_at.desc(), Case.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+
+    rows = list(session.exec(statement).all())
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_case_cursor(rows[-1].updated_at, rows[-1].id)
+    return [CaseListItem.model_validate(row) for row in rows]
 
 
 @app.get("/api/case-templates", response_model=list[CaseTemplate])
@@ -645,6 +938,7 @@ def create_case_from_template(
         confidence_start=payload.confidence_start if payload else None,
     )
     session.add(case)
+    record_case_created(session, case)
     session.commit()
     session.refresh(case)
 
@@ -681,6 +975,7 @@ def delete_case(
     for version in versions:
         session.delete(version)
 
+    record_case_deleted(session, case)
     session.delete(case)
     session.commit()
     return {"ok": True}
@@ -709,42 +1004,757 @@ def upsert_preparation(
     return case
 
 
-@app.post("/api/cases/{case_id}/analyze", response_model=AnalysisOutput)
-def analyze_case(
-    case_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+def _cached_analysis(cache_key: str) -> tuple[AnalysisOutput, str] | None:
+    cached = analysis_cache.get(cache_key)
+    if cached is None:
+        return None
+    cached_analysis, provider_used = cached
+    return AnalysisOutput.model_validate_json(cached_analysis), provider_used
+
+
+def _remember_analysis(cache_key: str, analysis: AnalysisOutput, provider_used: str) -> None:
+    # Los fallbacks no se cachean: el próximo intento debe volver a consultar al proveedor.
+    if provider_used in ("openai", "rules"):
+        analysis_cache.set(cache_key, (analysis.model_dump_json(), provider_used))
+
+
+def _llm_call_metric(call_info: LLMCallInfo, mode: FeedbackMode, is_batch: bool = False) -> LLMCallMetric:
+    return LLMCallMetric(
+        model=call_info.model or settings.openai_model,
+        mode=mode,
+        case_id=call_info.case_id,
+        cohort_id=call_info.cohort_id,
+        outcome=call_info.outcome,
+        prompt_tokens=call_info.prompt_tokens,
+        cached_prompt_tokens=call_info.cached_prompt_tokens,
+        completion_tokens=call_info.completion_tokens,
+        latency_ms=round(call_info.latency_ms, 2),
+        is_batch=is_batch,
+    )
+
+
+def _record_llm_call(call_info: LLMCallInfo, mode: FeedbackMode) -> None:
+    # Contabilidad best-effort: un fallo al registrar no debe afectar el análisis.
+    try:
+        with Session(engine) as session:
+            session.add(_llm_call_metric(call_info, mode))
+            session.commit()
+    except Exception:
+        logger.exception("No se pudo registrar la llamada al LLM del caso %s", call_info.case_id)
+
+
+async def _record_llm_call_async(call_info: LLMCallInfo, mode: FeedbackMode) -> None:
+    # El INSERT corre en un thread; shield para que se complete aunque el request se cancele.
+    await asyncio.shield(asyncio.to_thread(_record_llm_call, call_info, mode))
+
+
+async def _call_openai(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    call_info: LLMCallInfo | None = None,
 ) -> AnalysisOutput:
-    case = _get_case_for_user(session, case_id, current_user)
-    if not case.preparation:
-        raise HTTPException(status_code=400, detail="Completa preparación antes de analizar")
+    call_info = call_info or LLMCallInfo()
+    try:
+        analysis = await asyncio.wait_for(
+            analyze_preparation_with_openai_async(preparation, mode, call_info=call_info),
+            timeout=settings.openai_call_deadline_seconds,
+        )
+    except Exception as exc:
+        if isinstance(exc, TimeoutError):
+            call_info.outcome = "timeout"
+        openai_breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelada desde afuera: no dice nada del proveedor, pero el cupo de prueba se libera.
+        call_info.outcome = "cancelled"
+        openai_breaker.release()
+        raise
+    finally:
+        await _record_llm_call_async(call_info, mode)
+    openai_breaker.record_success()
+    return analysis
+
+
+async def _run_openai_analysis(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    call_info: LLMCallInfo | None = None,
+) -> tuple[AnalysisOutput, str]:
+    if not openai_breaker.allow_request():
+        return analyze_preparation(preparation, mode), "rules_circuit_open"
+    try:
+        return await _call_openai(preparation, mode, call_info), "openai"
+    except Exception:
+        return analyze_preparation(preparation, mode), "rules_fallback"
+
+
+async def _run_hedged_analysis(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    cache_key: str,
+    on_late_result: Callable[[AnalysisOutput], Awaitable[None]] | None,
+    call_info: LLMCallInfo | None = None,
+) -> tuple[AnalysisOutput, str]:
+    rules_analysis = analyze_preparation(preparation, mode)
+    if not openai_breaker.allow_request():
+        return rules_analysis, "rules_circuit_open"
+
+    llm_task = asyncio.ensure_future(_call_openai(preparation, mode, call_info))
+    try:
+        analysis = await asyncio.wait_for(asyncio.shield(llm_task), timeout=settings.analysis_hedge_deadline_seconds)
+        return analysis, "openai"
+    except Exception:
+        if llm_task.done():
+            return rules_analysis, "rules_fallback"
+        # El LLM sigue trabajando: respondemos con reglas y guardamos su resultado cuando llegue.
+        _spawn_background(_finish_hedged_analysis(llm_task, cache_key, on_late_result))
+        return rules_analysis, "rules_hedged"
+
+
+async def _finish_hedged_analysis(
+    llm_task: asyncio.Future,
+    cache_key: str,
+    on_late_result: Callable[[AnalysisOutput], Awaitable[None]] | None,
+) -> None:
+    try:
+        analysis = await llm_task
+    except Exception:
+        return
+    _remember_analysis(cache_key, analysis, "openai")
+    if on_late_result is not None:
+        await on_late_result(analysis)
+
+
+def _spawn_background(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _run_analysis(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    on_late_result: Callable[[AnalysisOutput], Awaitable[None]] | None = None,
+    call_info: LLMCallInfo | None = None,
+) -> tuple[AnalysisOutput, str, bool]:
+    cache_key = analysis_cache_key(preparation, mode, _analysis_provider_key())
+    cached = _cached_analysis(cache_key)
+    if cached is not None:
+        return (*cached, True)
+
+    if settings.analysis_provider == "hedged":
+        analysis, provider_used = await _run_hedged_analysis(preparation, mode, cache_key, on_late_result, call_info)
+    elif settings.analysis_provider == "openai":
+        analysis, provider_used = await _run_openai_analysis(preparation, mode, call_info)
+    else:
+        analysis, provider_used = analyze_preparation(preparation, mode), "rules"
+
+    _remember_analysis(cache_key, analysis, provider_used)
+    return analysis, provider_used, False
+
+
+def _run_analysis_sync(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    call_info: LLMCallInfo | None = None,
+) -> tuple[AnalysisOutput, str, bool]:
+    cache_key = analysis_cache_key(preparation, mode, _analysis_provider_key())
+    cached = _cached_analysis(cache_key)
+    if cached is not None:
+        return (*cached, True)
 
-    preparation = PreparationInput.model_validate(case.preparation)
     provider_used = "rules"
-    if settings.analysis_provider == "openai":
-        try:
-            analysis = analyze_preparation_with_openai(preparation, case.mode)
-            provider_used = "openai"
-        except Exception:
-            analysis = analyze_preparation(preparation, case.mode)
-            provider_used = "rules_fallback"
+    if settings.analysis_provider in ("openai", "hedged"):
+        if openai_breaker.allow_request():
+            call_info = call_info or LLMCallInfo()
+            try:
+                analysis = analyze_preparation_with_openai(
+                    preparation,
+                    mode,
+                    timeout=settings.openai_call_deadline_seconds,
+                    call_info=call_info,
+                )
+                openai_breaker.record_success()
+                provider_used = "openai"
+            except Exception:
+                openai_breaker.record_failure()
+                analysis = analyze_preparation(preparation, mode)
+                provider_used = "rules_fallback"
+            finally:
+                _record_llm_call(call_info, mode)
+        else:
+            analysis = analyze_preparation(preparation, mode)
+            provider_used = "rules_circuit_open"
     else:
-        analysis = analyze_preparation(preparation, case.mode)
+        analysis = analyze_preparation(preparation, mode)
+
+    _remember_analysis(cache_key, analysis, provider_used)
+    return analysis, provider_used, False
 
+
+def _store_analysis(
+    session: Session,
+    case: Case,
+    analysis: AnalysisOutput,
+    provider_used: str,
+    cached: bool = False,
+    event: str = "analysis_generated",
+) -> CaseVersion:
     case.analysis = analysis.model_dump()
     case.inconsistency_count = len(analysis.inconsistencies)
     case.clarity_score = 100 - min(90, len(analysis.inconsistencies) * 20 + len(analysis.clarification_questions) * 10)
     case.status = CaseStatus.PREPARADO
     case.updated_at = _utc_now()
 
-    _save_version(session, case_id, "analysis_generated", {**case.analysis, "provider": provider_used})
+    version_payload = {**case.analysis, "provider": provider_used}
+    if cached:
+        version_payload["cached"] = True
+    version = _save_version(session, case.id, event, version_payload)
 
     session.add(case)
-    session.commit()
+    return version
+
+
+def _store_analysis_for_case(
+    case_id: int,
+    analysis: AnalysisOutput,
+    provider_used: str,
+    cached: bool = False,
+) -> int | None:
+    # Sesión propia: el resultado se persiste aunque el request que lo inició se cancele.
+    with Session(engine) as session:
+        case = session.get(Case, case_id)
+        if not case:
+            return None
+        version = _store_analysis(session, case, analysis, provider_used, cached)
+        session.commit()
+        return version.id
+
+
+def _store_late_analysis(case_id: int, fingerprint: str, analysis: AnalysisOutput) -> None:
+    with Session(engine) as session:
+        case = session.get(Case, case_id)
+        # Solo se mejora el análisis si el caso sigue preparado con la misma preparación.
+        if not case or case.status != CaseStatus.PREPARADO or not case.preparation:
+            return
+        if preparation_fingerprint(PreparationInput.model_validate(case.preparation)) != fingerprint:
+            return
+        _store_analysis(session, case, analysis, "openai", event="analysis_upgraded")
+        session.commit()
+
+
+def _run_analysis_job(job_id: int) -> None:
+    with Session(engine) as session:
+        claimed = session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id)
+            .where(AnalysisJob.status == AnalysisJobStatus.QUEUED)
+            .values(status=AnalysisJobStatus.RUNNING, started_at=_utc_now())
+        )
+        session.commit()
+        if claimed.rowcount != 1:
+            return
+
+        job = session.get(AnalysisJob, job_id)
+        case = session.get(Case, job.case_id)
+        try:
+            if not case or not case.preparation:
+                raise RuntimeError("Caso sin preparación para analizar")
+            preparation = PreparationInput.model_validate(case.preparation)
+            analysis, provider_used, cached = _run_analysis_sync(
+                preparation,
+                case.mode,
+                LLMCallInfo(case_id=case.id, cohort_id=case.cohort_id),
+            )
+            _store_analysis(session, case, analysis, provider_used, cached)
+            job.status = AnalysisJobStatus.SUCCEEDED
+            job.provider = provider_used
+            job.result = analysis.model_dump()
+        except Exception as exc:
+            session.rollback()
+            job = session.get(AnalysisJob, job_id)
+            job.status = AnalysisJobStatus.FAILED
+            job.error = str(exc)[:500]
+
+        job.finished_at = _utc_now()
+        session.add(job)
+        session.commit()
+
+
+analysis_jobs = AnalysisJobQueue(handler=_run_analysis_job, max_workers=settings.analysis_job_workers)
+
+
+def _requeue_stale_analysis_jobs(now: datetime | None = None) -> list[int]:
+    """Vuelve a encolar los jobs "running" viejos: pertenecen a un proceso que murió."""
+    stale_before = (now or _utc_now()) - STALE_ANALYSIS_JOB_AFTER
+    requeued: list[int] = []
+    with Session(engine) as session:
+        stale_ids = session.exec(
+            select(AnalysisJob.id)
+            .where(AnalysisJob.status == AnalysisJobStatus.RUNNING)
+            .where(AnalysisJob.started_at < stale_before)
+        ).all()
+        for job_id in stale_ids:
+            # Update condicional por job: si varios workers barren a la vez, cada job se reencola una vez.
+            reset = session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id)
+                .where(AnalysisJob.status == AnalysisJobStatus.RUNNING)
+                .where(AnalysisJob.started_at < stale_before)
+                .values(status=AnalysisJobStatus.QUEUED, started_at=None)
+            )
+            if reset.rowcount == 1:
+                requeued.append(job_id)
+        session.commit()
+    for job_id in requeued:
+        analysis_jobs.submit(job_id)
+    return requeued
+
+
+def _resume_analysis_jobs() -> None:
+    # Al arrancar: reencola los "running" viejos y lo que quedó pendiente en la cola en memoria.
+    requeued = set(_requeue_stale_analysis_jobs())
+    with Session(engine) as session:
+        pending = session.exec(
+            select(AnalysisJob.id)
+            .where(AnalysisJob.status == AnalysisJobStatus.QUEUED)
+            .order_by(AnalysisJob.created_at.asc())
+        ).all()
+    for job_id in pending:
+        if job_id not in requeued:
+            analysis_jobs.submit(job_id)
+
 
+@app.post("/api/cases/{case_id}/analyze", response_model=AnalysisOutput)
+async def analyze_case(
+    case_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisOutput:
+    case = await asyncio.to_thread(_get_case_for_user, session, case_id, current_user)
+    if not case.preparation:
+        raise HTTPException(status_code=400, detail="Completa preparación antes de analizar")
+
+    preparation = PreparationInput.model_validate(case.preparation)
+    mode = case.mode
+
+    fingerprint = preparation_fingerprint(preparation)
+    cohort_id = case.cohort_id
+
+    primary_stored = asyncio.Event()
+
+    async def store_upgrade(late_analysis: AnalysisOutput) -> None:
+        # La mejora va después de la versión principal: antes la vería sin preparar o quedaría pisada.
+        await primary_stored.wait()
+        await asyncio.to_thread(_store_late_analysis, case_id, fingerprint, late_analysis)
+
+    async def store_primary(analysis: AnalysisOutput, provider_used: str, cached: bool) -> None:
+        try:
+            await asyncio.to_thread(_store_analysis_for_case, case_id, analysis, provider_used, cached)
+        finally:
+            primary_stored.set()
+
+    async def analyze_and_store() -> AnalysisOutput:
+        try:
+            analysis, provider_used, cached = await _run_analysis(
+                preparation,
+                mode,
+                on_late_result=store_upgrade,
+                call_info=LLMCallInfo(case_id=case_id, cohort_id=cohort_id),
+            )
+        except BaseException:
+            primary_stored.set()
+            raise
+        # shield: si el request se cancela, la versión principal termina igual antes que la mejora.
+        await asyncio.shield(store_primary(analysis, provider_used, cached))
+        return analysis
+
+    # Doble click o dos pestañas: comparten una sola llamada al proveedor y una sola versión.
+    flight_key = (case_id, analysis_cache_key(preparation, mode, _analysis_provider_key()))
+    analysis, _shared = await analysis_flights.do(flight_key, analyze_and_store)
     return analysis
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.get("/api/cases/{case_id}/analyze/stream")
+async def stream_case_analysis(
+    case_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    case = await asyncio.to_thread(_get_case_for_user, session, case_id, current_user)
+    if not case.preparation:
+        raise HTTPException(status_code=400, detail="Completa preparación antes de analizar")
+
+    preparation = PreparationInput.model_validate(case.preparation)
+    mode = case.mode
+    cohort_id = case.cohort_id
+
+    async def events():
+        cache_key = analysis_cache_key(preparation, mode, _analysis_provider_key())
+        cached = _cached_analysis(cache_key)
+        sent: dict[str, object] = {}
+        analysis: AnalysisOutput | None = None
+
+        if cached is not None:
+            analysis, provider_used = cached
+        elif settings.analysis_provider in ("openai", "hedged") and openai_breaker.allow_request():
+            call_info = LLMCallInfo(case_id=case_id, cohort_id=cohort_id)
+            settled = False
+            try:
+                async with asyncio.timeout(settings.openai_call_deadline_seconds):
+                    async for item in stream_analysis_with_openai(preparation, mode, call_info=call_info):
+                        if isinstance(item, AnalysisOutput):
+                            analysis = item
+                        else:
+                            sent[item.key] = item.value
+                            yield _sse("section", {"key": item.key, "value": item.value})
+                openai_breaker.record_success()
+                settled = True
+                provider_used = "openai"
+            except Exception as exc:
+                if isinstance(exc, TimeoutError):
+                    call_info.outcome = "timeout"
+                openai_breaker.record_failure()
+                settled = True
+                analysis = analyze_preparation(preparation, mode)
+                provider_used = "rules_fallback"
+                sent.clear()
+                yield _sse("fallback", {"provider": provider_used})
+            finally:
+                if not settled:
+                    # El cliente cortó el stream (GeneratorExit/CancelledError): sin veredicto sobre
+                    # el proveedor, pero un cupo de prueba en half_open no puede quedar tomado.
+                    call_info.outcome = "cancelled"
+                    openai_breaker.release()
+                await _record_llm_call_async(call_info, mode)
+        else:
+            analysis = analyze_preparation(preparation, mode)
+            provider_used = "rules" if settings.analysis_provider == "rules" else "rules_circuit_open"
+
+        _remember_analysis(cache_key, analysis, provider_used)
+
+        # Secciones que no llegaron en streaming o que cambiaron al validar (ej. recorte a 3 preguntas).
+        for key, value in analysis.model_dump().items():
+            if sent.get(key) != value:
+                yield _sse("section", {"key": key, "value": value})
+
+        version_id = await asyncio.to_thread(
+            _store_analysis_for_case, case_id, analysis, provider_used, cached is not None
+        )
+
+        yield _sse(
+            "result",
+            {
+                "analysis": analysis.model_dump(),
+                "provider": provider_used,
+                "cached": cached is not None,
+                "version_id": version_id,
+            },
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/cases/{case_id}/analysis-jobs", response_model=AnalysisJobRead, status_code=202)
+def enqueue_analysis_job(
+    case_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisJob:
+    case = _get_case_for_user(session, case_id, current_user)
+    if not case.preparation:
+        raise HTTPException(status_code=400, detail="Completa preparación antes de analizar")
+
+    job = AnalysisJob(case_id=case_id, requested_by_user_id=current_user.id or 0)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+
+    analysis_jobs.submit(job.id)
+    return job
+
+
+@app.get("/api/analysis-jobs/{job_id}", response_model=AnalysisJobRead)
+def get_analysis_job(
+    job_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisJob:
+    job = session.get(AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    if current_user.role != UserRole.ADMIN and job.requested_by_user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Sin acceso al job")
+    return job
+
+
+@app.get("/api/admin/analysis/cache", response_model=AnalysisCacheStats)
+def admin_analysis_cache_stats(current_user: User = Depends(get_current_user)) -> AnalysisCacheStats:
+    _require_admin(current_user)
+    return AnalysisCacheStats(**analysis_cache.stats())
+
+
+@app.get("/api/admin/auth/password-hashing", response_model=PasswordHashingStats)
+def admin_password_hashing_stats(current_user: User = Depends(get_current_user)) -> PasswordHashingStats:
+    _require_admin(current_user)
+    return PasswordHashingStats(**password_hasher.stats())
+
+
+@app.get("/api/admin/analysis/circuit-breaker", response_model=CircuitBreakerStatus)
+def admin_analysis_circuit_breaker(current_user: User = Depends(get_current_user)) -> CircuitBreakerStatus:
+    _require_admin(current_user)
+    return CircuitBreakerStatus(**openai_breaker.snapshot())
+
+
+def _percentile(sorted_values: list[float], quantile: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(quantile * len(sorted_values)) - 1)
+    return round(sorted_values[index], 2)
+
+
+def _llm_call_cost(row) -> float:
+    # Los tokens servidos desde el cache de prefijos se facturan con descuento; el batch, también.
+    cost = (
+        (row.prompt_tokens - row.cached_prompt_tokens) * settings.openai_prompt_cost_per_million
+        + row.cached_prompt_tokens * settings.openai_cached_prompt_cost_per_million
+        + row.completion_tokens * settings.openai_completion_cost_per_million
+    ) / 1_000_000
+    return cost * settings.openai_batch_cost_factor if row.is_batch else cost
+
+
+def _llm_usage_bucket(group: str, rows: list) -> LLMUsageBucket:
+    outcomes: dict[str, int] = {}
+    for row in rows:
+        outcomes[row.outcome] = outcomes.get(row.outcome, 0) + 1
+    prompt_tokens = sum(row.prompt_tokens for row in rows)
+    cached_prompt_tokens = sum(row.cached_prompt_tokens for row in rows)
+    completion_tokens = sum(row.completion_tokens for row in rows)
+    # Las líneas de batch no tienen latencia por llamada: no entran en los percentiles.
+    latencies = sorted(row.latency_ms for row in rows if not row.is_batch)
+    cost = sum(_llm_call_cost(row) for row in rows)
+    return LLMUsageBucket(
+        group=group,
+        calls=len(rows),
+        outcomes=outcomes,
+        # Toda llamada que no termina en success cae al motor de reglas.
+        fallback_rate=round(1 - outcomes.get("success", 0) / len(rows), 4),
+        prompt_tokens=prompt_tokens,
+        cached_prompt_tokens=cached_prompt_tokens,
+        completion_tokens=completion_tokens,
+        estimated_cost_usd=round(cost, 6),
+        latency_p50_ms=_percentile(latencies, 0.50),
+        latency_p95_ms=_percentile(latencies, 0.95),
+        latency_p99_ms=_percentile(latencies, 0.99),
+    )
+
+
+@app.get("/api/admin/analysis/llm-usage", response_model=list[LLMUsageBucket])
+def admin_llm_usage(
+    group_by: str = "day",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> list[LLMUsageBucket]:
+    _require_admin(current_user)
+    if group_by not in ("day", "cohort", "mode"):
+        raise HTTPException(status_code=400, detail="group_by inválido (usar day, cohort o mode)")
+
+    statement = select(
+        LLMCallMetric.created_at,
+        LLMCallMetric.cohort_id,
+        LLMCallMetric.mode,
+        LLMCallMetric.outcome,
+        LLMCallMetric.prompt_tokens,
+        LLMCallMetric.cached_prompt_tokens,
+        LLMCallMetric.completion_tokens,
+        LLMCallMetric.latency_ms,
+        LLMCallMetric.is_batch,
+    )
+    if since is not None:
+        statement = statement.where(LLMCallMetric.created_at >= since)
+    if until is not None:
+        statement = statement.where(LLMCallMetric.created_at < until)
+
+    groups: dict[str, list] = {}
+    for row in session.exec(statement).all():
+        if group_by == "day":
+            key = row.created_at.strftime("%Y-%m-%d")
+        elif group_by == "cohort":
+            key = str(row.cohort_id) if row.cohort_id is not None else "sin_cohorte"
+        else:
+            key = FeedbackMode(row.mode).value
+        groups.setdefault(key, []).append(row)
+
+    return [_llm_usage_bucket(key, groups[key]) for key in sorted(groups)]
+
+
+def _analysis_batch_read(batch: AnalysisBatch) -> AnalysisBatchRead:
+    return AnalysisBatchRead(
+        **batch.model_dump(),
+        case_ids=sorted(int(case_id) for case_id in batch.case_fingerprints),
+    )
+
+
+def _get_analysis_batch_or_404(session: Session, batch_id: int) -> AnalysisBatch:
+    batch = session.get(AnalysisBatch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch no encontrado")
+    return batch
+
+
+def _apply_batch_results(
+    session: Session,
+    batch: AnalysisBatch,
+    results: dict[str, AnalysisOutput | str],
+    call_infos: dict[str, LLMCallInfo] | None = None,
+) -> None:
+    case_ids = [int(case_id) for case_id in batch.case_fingerprints]
+    cases = {case.id: case for case in session.exec(select(Case).where(Case.id.in_(case_ids))).all()}
+
+    # Cada línea del batch fue una llamada al LLM: se contabiliza en la misma transacción que
+    # aplica los resultados, así un sync repetido no la cuenta dos veces.
+    for case_id, call_info in (call_infos or {}).items():
+        case = cases.get(int(case_id))
+        call_info.case_id = int(case_id)
+        call_info.cohort_id = batch.cohort_id
+        session.add(_llm_call_metric(call_info, case.mode if case else FeedbackMode.PROFESIONAL, is_batch=True))
+
+    applied = skipped = failed = 0
+    for case_id, fingerprint in batch.case_fingerprints.items():
+        result = results.get(case_id)
+        if not isinstance(result, AnalysisOutput):
+            failed += 1
+            continue
+        case = cases.get(int(case_id))
+        # Igual que en la mejora tardía: no se pisa un caso que avanzó o cuya preparación cambió.
+        if (
+            not case
+            or case.status != CaseStatus.PREPARADO
+            or not case.preparation
+            or preparation_fingerprint(PreparationInput.model_validate(case.preparation)) != fingerprint
+        ):
+            skipped += 1
+            continue
+        _store_analysis(session, case, result, "openai_batch", event="analysis_batch")
+        applied += 1
+
+    batch.applied_count = applied
+    batch.skipped_count = skipped
+    batch.failed_count = failed
+    batch.applied_at = _utc_now()
+
+
+@app.post(
+    "/api/admin/cohorts/{cohort_id}/reanalysis-batches",
+    response_model=AnalysisBatchRead,
+    status_code=202,
+)
+def admin_create_reanalysis_batch(
+    cohort_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisBatchRead:
+    _require_admin(current_user)
+    if not session.get(Cohort, cohort_id):
+        raise HTTPException(status_code=404, detail="Cohorte no encontrada")
+
+    cases = session.exec(
+        select(Case).where(Case.cohort_id == cohort_id).where(Case.status == CaseStatus.PREPARADO).order_by(Case.id)
+    ).all()
+    requests: list[tuple[str, PreparationInput, FeedbackMode]] = []
+    fingerprints: dict[str, str] = {}
+    for case in cases:
+        if not case.preparation:
+            continue
+        preparation = PreparationInput.model_validate(case.preparation)
+        requests.append((str(case.id), preparation, case.mode))
+        fingerprints[str(case.id)] = preparation_fingerprint(preparation)
+    if not requests:
+        raise HTTPException(status_code=400, detail="La cohorte no tiene casos preparados para re-analizar")
+
+    try:
+        provider_batch = submit_analysis_batch(requests)
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail="No se pudo crear el batch en OpenAI") from exc
+
+    batch = AnalysisBatch(
+        cohort_id=cohort_id,
+        requested_by_user_id=current_user.id or 0,
+        provider_batch_id=provider_batch.id,
+        input_file_id=provider_batch.input_file_id,
+        status=provider_batch.status,
+        case_fingerprints=fingerprints,
+    )
+    session.add(batch)
+    session.commit()
+    session.refresh(batch)
+    return _analysis_batch_read(batch)
+
+
+@app.get("/api/admin/cohorts/{cohort_id}/reanalysis-batches", response_model=list[AnalysisBatchRead])
+def admin_list_reanalysis_batches(
+    cohort_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> list[AnalysisBatchRead]:
+    _require_admin(current_user)
+    batches = session.exec(
+        select(AnalysisBatch).where(AnalysisBatch.cohort_id == cohort_id).order_by(AnalysisBatch.id.desc())
+    ).all()
+    return [_analysis_batch_read(batch) for batch in batches]
+
+
+@app.get("/api/admin/analysis-batches/{batch_id}", response_model=AnalysisBatchRead)
+def admin_get_analysis_batch(
+    batch_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisBatchRead:
+    _require_admin(current_user)
+    return _analysis_batch_read(_get_analysis_batch_or_404(session, batch_id))
+
+
+@app.post("/api/admin/analysis-batches/{batch_id}/sync", response_model=AnalysisBatchRead)
+def admin_sync_analysis_batch(
+    batch_id: int,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+) -> AnalysisBatchRead:
+    _require_admin(current_user)
+    batch = _get_analysis_batch_or_404(session, batch_id)
+    if batch.applied_at is not None:
+        return _analysis_batch_read(batch)
+
+    # Solo las llamadas al proveedor se traducen a 502; un error al aplicar es un error propio.
+    call_infos: dict[str, LLMCallInfo] = {}
+    results: dict[str, AnalysisOutput | str] = {}
+    try:
+        provider_batch = retrieve_analysis_batch(batch.provider_batch_id)
+        if provider_batch.status in ANALYSIS_BATCH_FINAL_STATUSES and provider_batch.output_file_id:
+            results = fetch_analysis_batch_results(provider_batch.output_file_id, call_infos)
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail="No se pudo consultar el batch en OpenAI") from exc
+
+    batch.status = provider_batch.status
+    batch.output_file_id = provider_batch.output_file_id
+    if batch.status in ANALYSIS_BATCH_FINAL_STATUSES:
+        _apply_batch_results(session, batch, results, call_infos)
+    session.add(batch)
+    session.commit()
+    session.refresh(batch)
+    return _analysis_batch_read(batch)
+
+
 @app.post("/api/cases/{case_id}/execute", response_model=CaseRead)
 def mark_executed(
     case_id: int,
@@ -821,6 +1831,7 @@ def close_case(
     _save_version(session, case_id, "case_closed", memo)
 
     session.add(case)
+    record_case_closed(session, case)
     session.commit()
 
     return FinalMemo.model_validate(memo)
@@ -854,12 +1865,9 @@ def get_my_metrics(
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ) -> StudentMetricsSummary:
-    statement = select(Case)
-    if current_user.role != UserRole.ADMIN:
-        statement = statement.where(Case.owner_user_id == current_user.id)
-    cases = list(session.exec(statement).all())
-    summary = _build_metrics_summary(cases)
-    return StudentMetricsSummary(**summary)
+    if current_user.role == UserRole.ADMIN:
+        return StudentMetricsSummary(**read_metrics_summary(session, MetricsScope.GLOBAL))
+    return StudentMetricsSummary(**read_metrics_summary(session, MetricsScope.USER, current_user.id or 0))
 
 
 @app.get("/api/admin/metrics/anonymous", response_model=AdminAnonymousMetricsSummary)
@@ -870,11 +1878,17 @@ def get_admin_anonymous_metrics(
 ) -> AdminAnonymousMetricsSummary:
     _require_admin(current_user)
 
-    statement = select(Case)
-    if cohort_id is not None:
-        statement = statement.where(Case.cohort_id == cohort_id)
-
-    cases = list(session.exec(statement).all())
-    summary = _build_metrics_summary(cases, cohort_id=cohort_id)
-    summary["active_students_with_cases"] = len({item.owner_user_id for item in cases if item.owner_user_id is not None})
-    return AdminAnonymousMetricsSummary(**summary)
+    if cohort_id is None:
+        summary = read_metrics_summary(session, MetricsScope.GLOBAL)
+        owners = select(func.count(MetricsRollup.scope_id.distinct())).where(
+            MetricsRollup.scope == MetricsScope.USER.value, MetricsRollup.cases_created > 0
+        )
+    else:
+        summary = read_metrics_summary(session, MetricsScope.COHORT, cohort_id)
+        # Estudiantes distintos no se pueden sumar por mes; se cuentan sobre el índice de cohorte.
+        owners = select(func.count(Case.owner_user_id.distinct())).where(Case.cohort_id == cohort_id)
+    return AdminAnonymousMetricsSummary(
+        **summary,
+        cohort_id=cohort_id,
+        active_students_with_cases=session.exec(owners).one(),
+    )
@@ -0,0 +1,202 @@
+"""Rollup incremental de métricas de casos por scope (usuario, cohorte, global) y mes.
+
+Alta, cierre y borrado de un caso suman o restan su aporte dentro de la misma transacción,
+así los endpoints de métricas leen una fila por mes en lugar de recorrer los casos.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+
+from .models import Case, CaseStatus, MetricsRollup, MetricsScope
+from .schemas import MetricsTrendPoint
+
+
+COUNTER_FIELDS = (
+    "cases_created",
+    "cases_closed",
+    "cycle_days_sum",
+    "cycle_days_count",
+    "agreement_quality_sum",
+    "agreement_quality_count",
+    "confidence_delta_sum",
+    "confidence_delta_count",
+)
+_KEY_COLUMNS = ("scope", "scope_id", "period")
+_CASE_COLUMNS = (
+    Case.owner_user_id,
+    Case.cohort_id,
+    Case.status,
+    Case.confidence_start,
+    Case.confidence_end,
+    Case.agreement_quality_result,
+    Case.agreement_quality_relationship,
+    Case.agreement_quality_sustainability,
+    Case.closed_at,
+    Case.created_at,
+    Case.updated_at,
+)
+_REBUILD_BATCH_SIZE = 1000
+
+rollup_table = MetricsRollup.__table__
+
+
+def _period(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+
+def _scopes(case) -> list[tuple[str, int]]:
+    scopes = [(MetricsScope.GLOBAL.value, 0)]
+    if case.owner_user_id is not None:
+        scopes.append((MetricsScope.USER.value, case.owner_user_id))
+    if case.cohort_id is not None:
+        scopes.append((MetricsScope.COHORT.value, case.cohort_id))
+    return scopes
+
+
+def _closing_deltas(case) -> dict[str, float]:
+    deltas: dict[str, float] = {"cases_closed": 1}
+    if case.closed_at and case.created_at:
+        deltas["cycle_days_sum"] = max((case.closed_at.date() - case.created_at.date()).days, 0)
+        deltas["cycle_days_count"] = 1
+
+    quality_parts = [
+        case.agreement_quality_result,
+        case.agreement_quality_relationship,
+        case.agreement_quality_sustainability,
+    ]
+    quality_valid = [float(item) for item in quality_parts if item is not None]
+    if quality_valid:
+        deltas["agreement_quality_sum"] = sum(quality_valid) / len(quality_valid)
+        deltas["agreement_quality_count"] = 1
+
+    if case.confidence_start is not None and case.confidence_end is not None:
+        deltas["confidence_delta_sum"] = case.confidence_end - case.confidence_start
+        deltas["confidence_delta_count"] = 1
+    return deltas
+
+
+def _contributions(case) -> list[tuple[str, dict[str, float]]]:
+    contributions = [(_period(case.created_at), {"cases_created": 1})]
+    if case.status == CaseStatus.CERRADO:
+        contributions.append((_period(case.closed_at or case.updated_at), _closing_deltas(case)))
+    return contributions
+
+
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def _upsert_statement(dialect_name: str, key: dict, deltas: dict[str, float]):
+    """INSERT ... ON CONFLICT DO UPDATE para los motores que lo soportan; None en el resto."""
+    insert_factory = _UPSERT_INSERTS.get(dialect_name)
+    if insert_factory is None:
+        return None
+    values = {field: 0 for field in COUNTER_FIELDS}
+    values.update(deltas)
+    statement = insert_factory(rollup_table).values(**key, **values)
+    # Upsert atómico: cierres concurrentes del mismo mes no pisan sus sumas.
+    return statement.on_conflict_do_update(
+        index_elements=list(_KEY_COLUMNS),
+        set_={field: rollup_table.c[field] + statement.excluded[field] for field in deltas},
+    )
+
+
+def _increment(session: Session, case, period: str, deltas: dict[str, float], sign: int = 1) -> None:
+    signed = {field: value * sign for field, value in deltas.items()}
+    dialect_name = session.get_bind().dialect.name
+    for scope, scope_id in _scopes(case):
+        key = {"scope": scope, "scope_id": scope_id, "period": period}
+        statement = _upsert_statement(dialect_name, key, signed)
+        if statement is not None:
+            session.execute(statement)
+            continue
+
+        # Sin upsert nativo: UPDATE y, si la fila no existía, INSERT.
+        updated = session.execute(
+            update(rollup_table)
+            .where(*(rollup_table.c[column] == value for column, value in key.items()))
+            .values({field: rollup_table.c[field] + value for field, value in signed.items()})
+        )
+        if updated.rowcount == 0:
+            values = {field: 0 for field in COUNTER_FIELDS}
+            values.update(signed)
+            session.execute(insert(rollup_table).values(**key, **values))
+
+
+def record_case_created(session: Session, case: Case) -> None:
+    _increment(session, case, _period(case.created_at), {"cases_created": 1})
+
+
+def record_case_closed(session: Session, case: Case) -> None:
+    _increment(session, case, _period(case.closed_at or case.updated_at), _closing_deltas(case))
+
+
+def record_case_deleted(session: Session, case: Case) -> None:
+    for period, deltas in _contributions(case):
+        _increment(session, case, period, deltas, sign=-1)
+
+
+def rebuild_metrics_rollup(conn: Connection) -> int:
+    """Recalcula el rollup completo desde los casos; devuelve las filas generadas."""
+    totals: dict[tuple[str, int, str], dict[str, float]] = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    result = conn.execution_options(stream_results=True).execute(select(*_CASE_COLUMNS))
+    for rows in result.partitions(_REBUILD_BATCH_SIZE):
+        for case in rows:
+            for period, deltas in _contributions(case):
+                for scope, scope_id in _scopes(case):
+                    bucket = totals[(scope, scope_id, period)]
+                    for field, value in deltas.items():
+                        bucket[field] += value
+
+    conn.execute(delete(rollup_table))
+    if totals:
+        conn.execute(
+            insert(rollup_table),
+            [
+                {"scope": scope, "scope_id": scope_id, "period": period, **counters}
+                for (scope, scope_id, period), counters in totals.items()
+            ],
+        )
+    return len(totals)
+
+
+def _average(total: float, count: int) -> float | None:
+    return round(total / count, 2) if count else None
+
+
+def read_metrics_summary(session: Session, scope: MetricsScope, scope_id: int = 0) -> dict:
+    rows = session.exec(
+        select(MetricsRollup)
+        .where(MetricsRollup.scope == scope.value)
+        .where(MetricsRollup.scope_id == scope_id)
+        .order_by(MetricsRollup.period)
+    ).all()
+    totals = {field: sum(getattr(row, field) for row in rows) for field in COUNTER_FIELDS}
+
+    cases_total = totals["cases_created"]
+    cases_closed = totals["cases_closed"]
+    close_rate = (cases_closed / cases_total * 100) if cases_total else 0.0
+    return {
+        "cases_total": cases_total,
+        "cases_closed": cases_closed,
+        "close_rate": round(close_rate, 2),
+        "cycle_days_avg": _average(totals["cycle_days_sum"], totals["cycle_days_count"]),
+        "agreement_quality_avg": _average(totals["agreement_quality_sum"], totals["agreement_quality_count"]),
+        "confidence_delta_avg": _average(totals["confidence_delta_sum"], totals["confidence_delta_count"]),
+        "confidence_delta_trend": [
+            MetricsTrendPoint(
+                period=row.period,
+                confidence_delta_avg=round(row.confidence_delta_sum / row.confidence_delta_count, 2),
+                cases_count=row.confidence_delta_count,
+            )
+            for row in rows
+            if row.confidence_delta_count
+        ],
+    }
@@ -0,0 +1,212 @@
+"""Migraciones versionadas del esquema.
+
+Cada migración se aplica una sola vez y queda registrada en `schema_version`; al arrancar
+basta comparar la versión guardada con la última conocida. Las migraciones son idempotentes
+(bases previas a este registro pueden tener ya parte de los cambios) y los backfills sobre
+tablas grandes corren en lotes, cada uno en su propia transacción.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+from . import models  # noqa: F401 - registra las tablas en SQLModel.metadata
+from .metrics_rollup import rebuild_metrics_rollup
+from .models import Case, CaseVersion, CohortMembership, LeaderEvaluation
+
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """`upgrade` cambia el esquema; `backfill` procesa un lote y devuelve las filas tocadas."""
+
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None] | None = None
+    backfill: Callable[[Connection, int], int] | None = None
+
+
+def _add_missing_columns(conn: Connection, table: str, columns: dict[str, str]) -> None:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return
+    existing_columns = {column["name"] for column in inspector.get_columns(table)}
+    quoted_table = conn.dialect.identifier_preparer.quote(table)
+    for col_name, col_type in columns.items():
+        if col_name not in existing_columns:
+            conn.execute(text(f"ALTER TABLE {quoted_table} ADD COLUMN {col_name} {col_type}"))
+
+
+def _add_case_columns(conn: Connection) -> None:
+    _add_missing_columns(
+        conn,
+        "case",
+        {
+            "owner_user_id": "INTEGER",
+            "cohort_id": "INTEGER",
+            "origin": "VARCHAR(20) NOT NULL DEFAULT 'sparring'",
+            "is_read_only": "BOOLEAN NOT NULL DEFAULT 0",
+            "confidence_start": "INTEGER",
+            "confidence_end": "INTEGER",
+            "agreement_quality_result": "INTEGER",
+            "agreement_quality_relationship": "INTEGER",
+            "agreement_quality_sustainability": "INTEGER",
+            "closed_at": "DATETIME",
+        },
+    )
+
+
+def _normalize_case_origin(conn: Connection, batch_size: int) -> int:
+    # Casos viejos guardaron el nombre del enum en lugar de su valor.
+    result = conn.execute(
+        text(
+            'UPDATE "case" '
+            "SET origin = CASE origin "
+            "WHEN 'SPARRING' THEN 'sparring' "
+            "WHEN 'LIVE_SESSION' THEN 'live_session' "
+            "ELSE origin END "
+            'WHERE id IN (SELECT id FROM "case" WHERE origin IN (\'SPARRING\', \'LIVE_SESSION\') LIMIT :batch_size)'
+        ),
+        {"batch_size": batch_size},
+    )
+    return result.rowcount
+
+
+def _add_leader_evaluation_columns(conn: Connection) -> None:
+    _add_missing_columns(conn, "leaderevaluation", {"follow_up_date": "DATETIME"})
+
+
+def _add_user_columns(conn: Connection) -> None:
+    _add_missing_columns(conn, "user", {"token_version": "INTEGER NOT NULL DEFAULT 0"})
+
+
+# Índices de una columna que quedan cubiertos por el prefijo de un índice compuesto.
+_REDUNDANT_INDEXES = (
+    "ix_case_owner_user_id",
+    "ix_cohortmembership_user_id",
+    "ix_caseversion_case_id",
+    "ix_leaderevaluation_target_user_id",
+)
+
+
+_COMPOSITE_INDEXES_V6 = (
+    "ix_case_owner_user_id_updated_at",
+    "ix_caseversion_case_id_created_at",
+    "ix_cohortmembership_user_id_cohort_id_is_active",
+    "ix_leaderevaluation_target_user_id_created_at",
+)
+
+
+def _create_indexes(conn: Connection, index_names: tuple[str, ...]) -> None:
+    for model in (Case, CaseVersion, CohortMembership, LeaderEvaluation):
+        for index in model.__table__.indexes:
+            if index.name in index_names:
+                index.create(conn, checkfirst=True)
+
+
+def _create_composite_indexes(conn: Connection) -> None:
+    _create_indexes(conn, _COMPOSITE_INDEXES_V6)
+    for index_name in _REDUNDANT_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def _add_llm_call_metric_columns(conn: Connection) -> None:
+    _add_missing_columns(conn, "llmcallmetric", {"is_batch": "BOOLEAN NOT NULL DEFAULT 0"})
+
+
+def _create_case_keyset_index(conn: Connection) -> None:
+    _create_indexes(conn, ("ix_case_updated_at_id",))
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "Columnas de dueño, cohorte, origen y cierre en case", upgrade=_add_case_columns),
+    Migration(2, "Normaliza case.origin a los valores del enum", backfill=_normalize_case_origin),
+    Migration(3, "follow_up_date en leaderevaluation", upgrade=_add_leader_evaluation_columns),
+    Migration(4, "token_version en user", upgrade=_add_user_columns),
+    Migration(5, "Backfill de metrics_rollup desde los casos", upgrade=rebuild_metrics_rollup),
+    Migration(
+        6,
+        "Índices compuestos para listados por dueño, versiones, membresías y evaluaciones; "
+        "quita los de una columna que cubren",
+        upgrade=_create_composite_indexes,
+    ),
+    Migration(7, "is_batch en llmcallmetric", upgrade=_add_llm_call_metric_columns),
+    Migration(8, "Índice (updated_at, id) en case para el listado de admin", upgrade=_create_case_keyset_index),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def _lock_schema(conn: Connection) -> None:
+    # En SQLite toma el lock de escritura de entrada: si varios workers arrancan juntos,
+    # el resto espera y al entrar ve la versión ya actualizada.
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def run_migrations(engine: Engine, batch_size: int = BACKFILL_BATCH_SIZE) -> list[int]:
+    """Aplica las migraciones pendientes y devuelve las versiones aplicadas."""
+    with engine.connect() as conn:
+        if current_version(conn) >= LATEST_VERSION:
+            return []
+
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        # Tablas nuevas se crean ya con el esquema actual; las migraciones completan las viejas.
+        SQLModel.metadata.create_all(conn)
+        schema_version.create(conn, checkfirst=True)
+
+    applied: list[int] = []
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            _lock_schema(conn)
+            if current_version(conn) >= migration.version:
+                continue
+            if migration.upgrade is not None:
+                migration.upgrade(conn)
+
+        if migration.backfill is not None:
+            while True:
+                with engine.begin() as conn:
+                    if migration.backfill(conn, batch_size) < batch_size:
+                        break
+
+        with engine.begin() as conn:
+            _lock_schema(conn)
+            if current_version(conn) >= migration.version:
+                continue
+            conn.execute(
+                schema_version.insert().values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.now(UTC),
+                )
+            )
+        applied.append(migration.version)
+        logger.info("Migración %s aplicada: %s", migration.version, migration.description)
+    return applied
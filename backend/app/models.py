@@ -4,7 +4,7 @@ from datetime import UTC, datetime
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, UniqueConstraint
 from sqlalchemy.types import JSON
 from sqlmodel import Field, SQLModel
 
@@ -47,6 +47,19 @@ class CaseOrigin(str, Enum):
     SPARRING = "sparring"
 
 
+class MetricsScope(str, Enum):
+    USER = "user"
+    COHORT = "cohort"
+    GLOBAL = "global"
+
+
+class AnalysisJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     email: str = Field(index=True, unique=True, max_length=190)
@@ -54,6 +67,8 @@ class User(SQLModel, table=True):
     full_name: str = Field(default="", max_length=120)
     role: UserRole = Field(default=UserRole.STUDENT)
     is_active: bool = Field(default=True)
+    # Se incrementa al cambiar rol, contraseña o desactivar: revoca los tokens emitidos antes.
+    token_version: int = Field(default=0)
     created_at: datetime = Field(default_factory=utc_now)
     updated_at: datetime = Field(default_factory=utc_now)
 
@@ -69,8 +84,10 @@ class Cohort(SQLModel, table=True):
 
 
 class CohortMembership(SQLModel, table=True):
+    __table_args__ = (Index("ix_cohortmembership_user_id_cohort_id_is_active", "user_id", "cohort_id", "is_active"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id", index=True)
+    user_id: int = Field(foreign_key="user.id")
     cohort_id: int = Field(foreign_key="cohort.id", index=True)
     joined_at: datetime = Field(default_factory=utc_now)
     left_at: Optional[datetime] = None
@@ -90,11 +107,17 @@ class Subscription(SQLModel, table=True):
 
 
 class Case(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_case_owner_user_id_updated_at", "owner_user_id", "updated_at"),
+        # Listado de admin: keyset sobre (updated_at, id) sin filtro de dueño.
+        Index("ix_case_updated_at_id", "updated_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(max_length=120)
     mode: FeedbackMode = Field(default=FeedbackMode.PROFESIONAL)
     status: CaseStatus = Field(default=CaseStatus.EN_PREPARACION)
-    owner_user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
+    owner_user_id: Optional[int] = Field(default=None, foreign_key="user.id")
     cohort_id: Optional[int] = Field(default=None, foreign_key="cohort.id", index=True)
     origin: str = Field(default=CaseOrigin.SPARRING.value, max_length=20)
     is_read_only: bool = Field(default=False)
@@ -118,17 +141,85 @@ class Case(SQLModel, table=True):
 
 
 class CaseVersion(SQLModel, table=True):
+    __table_args__ = (Index("ix_caseversion_case_id_created_at", "case_id", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    case_id: int = Field(index=True)
+    case_id: int
     event: str = Field(max_length=50)
     payload: dict = Field(default_factory=dict, sa_column=Column(JSON))
     created_at: datetime = Field(default_factory=utc_now)
 
 
+class AnalysisJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    case_id: int = Field(index=True)
+    requested_by_user_id: int = Field(foreign_key="user.id", index=True)
+    status: AnalysisJobStatus = Field(default=AnalysisJobStatus.QUEUED, index=True)
+    provider: Optional[str] = Field(default=None, max_length=30)
+    result: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    error: str = Field(default="", max_length=500)
+    created_at: datetime = Field(default_factory=utc_now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class AnalysisBatch(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cohort_id: int = Field(foreign_key="cohort.id", index=True)
+    requested_by_user_id: int = Field(foreign_key="user.id", index=True)
+    provider_batch_id: str = Field(index=True, max_length=100)
+    input_file_id: str = Field(max_length=100)
+    output_file_id: Optional[str] = Field(default=None, max_length=100)
+    status: str = Field(default="validating", max_length=30)
+    # case_id (como string) -> huella de la preparación enviada
+    case_fingerprints: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    applied_count: int = Field(default=0)
+    skipped_count: int = Field(default=0)
+    failed_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=utc_now)
+    applied_at: Optional[datetime] = Field(default=None)
+
+
+class LLMCallMetric(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime = Field(default_factory=utc_now, index=True)
+    model: str = Field(max_length=60)
+    mode: FeedbackMode = Field(default=FeedbackMode.PROFESIONAL)
+    case_id: Optional[int] = Field(default=None, index=True)
+    cohort_id: Optional[int] = Field(default=None, index=True)
+    outcome: str = Field(max_length=30)
+    prompt_tokens: int = Field(default=0)
+    cached_prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    latency_ms: float = Field(default=0.0)
+    # Línea de un batch: se factura con descuento y no tiene latencia por llamada.
+    is_batch: bool = Field(default=False)
+
+
+class MetricsRollup(SQLModel, table=True):
+    __tablename__ = "metrics_rollup"
+    __table_args__ = (UniqueConstraint("scope", "scope_id", "period"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    scope: str = Field(max_length=10)
+    scope_id: int = Field(default=0)  # usuario o cohorte; 0 en el scope global
+    period: str = Field(max_length=7)  # YYYY-MM
+    cases_created: int = Field(default=0)
+    cases_closed: int = Field(default=0)
+    cycle_days_sum: int = Field(default=0)
+    cycle_days_count: int = Field(default=0)
+    agreement_quality_sum: float = Field(default=0.0)
+    agreement_quality_count: int = Field(default=0)
+    confidence_delta_sum: int = Field(default=0)
+    confidence_delta_count: int = Field(default=0)
+
+
 class LeaderEvaluation(SQLModel, table=True):
+    __table_args__ = (Index("ix_leaderevaluation_target_user_id_created_at", "target_user_id", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     evaluator_user_id: int = Field(foreign_key="user.id", index=True)
-    target_user_id: int = Field(foreign_key="user.id", index=True)
+    target_user_id: int = Field(foreign_key="user.id")
     cohort_id: Optional[int] = Field(default=None, foreign_key="cohort.id", index=True)
     follow_up_date: Optional[datetime] = None
     period_label: str = Field(max_length=7, index=True)  # YYYY-MM
@@ -1,9 +1,17 @@
 from __future__ import annotations
 
 import json
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from textwrap import dedent
+from typing import Any
 
-from openai import OpenAI
+import httpx
+from openai import APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from openai.types import CompletionUsage
 from pydantic import ValidationError
 
 from .models import FeedbackMode
@@ -11,108 +19,442 @@ from .schemas import AnalysisOutput, PreparationInput
 from .settings import settings
 
 
-def _system_prompt(mode: FeedbackMode) -> str:
-    tone = (
-        "Modo Curso: feedback pedagógico, breve referencia a conceptos de clase, sin perder estructura ejecutiva."
-        if mode == FeedbackMode.CURSO
-        else "Modo Profesional: feedback directo, exigente, ejecutivo, sin explicaciones largas."
+@dataclass
+class LLMCallInfo:
+    """Contabilidad de una llamada al LLM; case_id/cohort_id los completa quien llama."""
+
+    case_id: int | None = None
+    cohort_id: int | None = None
+    model: str = ""
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+    # success | empty_response | invalid_json | schema_error | timeout | error
+    outcome: str = "error"
+
+
+class InvalidLLMResponse(RuntimeError):
+    def __init__(self, message: str, outcome: str) -> None:
+        super().__init__(message)
+        self.outcome = outcome
+
+
+_client: OpenAI | None = None
+_async_client: AsyncOpenAI | None = None
+_client_lock = threading.Lock()
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.openai_read_timeout_seconds,
+        connect=settings.openai_connect_timeout_seconds,
     )
 
-    return dedent(
-        f"""
-        Eres un analista estratégico de negociación consultiva.
-        Evalúas cómo fue pensada la estrategia, no si se ganó o perdió.
-        {tone}
-
-        Reglas obligatorias:
-        - Respuesta SOLO en JSON válido.
-        - Máximo 3 preguntas de aclaración.
-        - No redactar mails.
-        - No dar scripts de conversación.
-        - No prometer resultados.
-        - Señalar incoherencias entre bloques cuando existan.
-        - Entregar tono ejecutivo, directo y estructurado.
-
-        Esquema JSON exacto:
-        {{
-          "clarification_questions": ["..."],
-          "observations": ["..."],
-          "suggestions": ["..."],
-          "next_steps": ["..."],
-          "inconsistencies": ["..."],
-          "preparation_level": "Inicial|Estructurado|Avanzado"
-        }}
-        """
-    ).strip()
 
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+        keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+    )
 
-def _user_prompt(preparation: PreparationInput) -> str:
-    return dedent(
-        f"""
-        Caso de preparación estratégica:
-
-        Contexto:
-        - Tipo de negociación: {preparation.context.negotiation_type}
-        - Nivel de impacto: {preparation.context.impact_level}
-        - Relación contraparte: {preparation.context.counterpart_relationship}
-
-        Objetivo:
-        - Objetivo explícito: {preparation.objective.explicit_objective}
-        - Objetivo real: {preparation.objective.real_objective}
-        - Resultado mínimo aceptable: {preparation.objective.minimum_acceptable_result}
-
-        Poder y alternativas:
-        - MAAN: {preparation.power_alternatives.maan}
-        - Fortaleza percibida del otro: {preparation.power_alternatives.counterpart_perceived_strength}
-        - Punto de ruptura: {preparation.power_alternatives.breakpoint}
-
-        Estrategia:
-        - ZOPA estimada: {preparation.strategy.estimated_zopa}
-        - Secuencia de concesiones: {preparation.strategy.concession_sequence}
-        - Hipótesis sobre contraparte: {preparation.strategy.counterpart_hypothesis}
-
-        Riesgos:
-        - Variable emocional propia: {preparation.risk.emotional_variable}
-        - Riesgo principal: {preparation.risk.main_risk}
-        - Señal clave: {preparation.risk.key_signal}
-        """
-    ).strip()
 
+def get_openai_client() -> OpenAI:
+    # Un único cliente por proceso: conserva el pool HTTP y las sesiones TLS entre requests.
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url or None,
+                    timeout=_http_timeout(),
+                    max_retries=settings.openai_max_retries,
+                    http_client=DefaultHttpxClient(timeout=_http_timeout(), limits=_http_limits()),
+                )
+    return _client
 
-def analyze_preparation_with_openai(
-    preparation: PreparationInput,
-    mode: FeedbackMode,
-) -> AnalysisOutput:
-    if not settings.openai_api_key:
-        raise RuntimeError("OPENAI_API_KEY no configurada")
 
-    client = OpenAI(api_key=settings.openai_api_key)
+def get_async_openai_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url or None,
+                    timeout=_http_timeout(),
+                    max_retries=settings.openai_max_retries,
+                    http_client=DefaultAsyncHttpxClient(timeout=_http_timeout(), limits=_http_limits()),
+                )
+    return _async_client
+
+
+def close_openai_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def close_async_openai_client() -> None:
+    global _async_client
+    with _client_lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
+
+
+_MODE_TONES = {
+    FeedbackMode.CURSO: "Modo Curso: feedback pedagógico, breve referencia a conceptos de clase, sin perder estructura ejecutiva.",
+    FeedbackMode.PROFESIONAL: "Modo Profesional: feedback directo, exigente, ejecutivo, sin explicaciones largas.",
+}
+
+# Parte estática primero y el tono del modo al final: el prefijo es idéntico para todos los
+# requests, así aplica el cache de prefijos del proveedor.
+_SYSTEM_PROMPT_PREFIX = dedent(
+    """
+    Eres un analista estratégico de negociación consultiva.
+    Evalúas cómo fue pensada la estrategia, no si se ganó o perdió.
+
+    Reglas obligatorias:
+    - Respuesta SOLO en JSON válido.
+    - Máximo 3 preguntas de aclaración.
+    - No redactar mails.
+    - No dar scripts de conversación.
+    - No prometer resultados.
+    - Señalar incoherencias entre bloques cuando existan.
+    - Entregar tono ejecutivo, directo y estructurado.
+
+    Esquema JSON exacto:
+    {
+      "clarification_questions": ["..."],
+      "observations": ["..."],
+      "suggestions": ["..."],
+      "next_steps": ["..."],
+      "inconsistencies": ["..."],
+      "preparation_level": "Inicial|Estructurado|Avanzado"
+    }
+    """
+).strip()
+
+_SYSTEM_PROMPTS = {mode: f"{_SYSTEM_PROMPT_PREFIX}\n\n{tone}" for mode, tone in _MODE_TONES.items()}
+
+_USER_PROMPT_TEMPLATE = dedent(
+    """
+    Caso de preparación estratégica:
 
-    completion = client.chat.completions.create(
-        model=settings.openai_model,
-        response_format={"type": "json_object"},
-        messages=[
+    Contexto:
+    - Tipo de negociación: {context.negotiation_type}
+    - Nivel de impacto: {context.impact_level}
+    - Relación contraparte: {context.counterpart_relationship}
+
+    Objetivo:
+    - Objetivo explícito: {objective.explicit_objective}
+    - Objetivo real: {objective.real_objective}
+    - Resultado mínimo aceptable: {objective.minimum_acceptable_result}
+
+    Poder y alternativas:
+    - MAAN: {power_alternatives.maan}
+    - Fortaleza percibida del otro: {power_alternatives.counterpart_perceived_strength}
+    - Punto de ruptura: {power_alternatives.breakpoint}
+
+    Estrategia:
+    - ZOPA estimada: {strategy.estimated_zopa}
+    - Secuencia de concesiones: {strategy.concession_sequence}
+    - Hipótesis sobre contraparte: {strategy.counterpart_hypothesis}
+
+    Riesgos:
+    - Variable emocional propia: {risk.emotional_variable}
+    - Riesgo principal: {risk.main_risk}
+    - Señal clave: {risk.key_signal}
+    """
+).strip()
+
+
+def _system_prompt(mode: FeedbackMode) -> str:
+    return _SYSTEM_PROMPTS[mode]
+
+
+def _user_prompt(preparation: PreparationInput) -> str:
+    return _USER_PROMPT_TEMPLATE.format(
+        context=preparation.context,
+        objective=preparation.objective,
+        power_alternatives=preparation.power_alternatives,
+        strategy=preparation.strategy,
+        risk=preparation.risk,
+    )
+
+
+def _chat_request(preparation: PreparationInput, mode: FeedbackMode) -> dict:
+    return {
+        "model": settings.openai_model,
+        "response_format": {"type": "json_object"},
+        "messages": [
             {"role": "system", "content": _system_prompt(mode)},
             {"role": "user", "content": _user_prompt(preparation)},
         ],
-        temperature=0.2,
-    )
+        "temperature": 0.2,
+    }
+
+
+def _parse_completion(completion) -> AnalysisOutput:
+    return _parse_content(completion.choices[0].message.content)
+
 
-    content = completion.choices[0].message.content
+def _parse_content(content: str | None) -> AnalysisOutput:
     if not content:
-        raise RuntimeError("OpenAI devolvió respuesta vacía")
+        raise InvalidLLMResponse("OpenAI devolvió respuesta vacía", "empty_response")
 
     try:
         payload = json.loads(content)
     except json.JSONDecodeError as exc:
-        raise RuntimeError("OpenAI devolvió JSON inválido") from exc
+        raise InvalidLLMResponse("OpenAI devolvió JSON inválido", "invalid_json") from exc
 
     try:
         analysis = AnalysisOutput.model_validate(payload)
     except ValidationError as exc:
-        raise RuntimeError("Respuesta OpenAI no cumple el esquema esperado") from exc
+        raise InvalidLLMResponse("Respuesta OpenAI no cumple el esquema esperado", "schema_error") from exc
 
     if len(analysis.clarification_questions) > 3:
         analysis.clarification_questions = analysis.clarification_questions[:3]
 
     return analysis
+
+
+@contextmanager
+def _track_call(call_info: LLMCallInfo | None) -> Iterator[None]:
+    if call_info is None:
+        yield
+        return
+
+    call_info.model = settings.openai_model
+    started = time.perf_counter()
+    try:
+        yield
+    except InvalidLLMResponse as exc:
+        call_info.outcome = exc.outcome
+        raise
+    except APITimeoutError:
+        call_info.outcome = "timeout"
+        raise
+    except Exception:
+        call_info.outcome = "error"
+        raise
+    else:
+        call_info.outcome = "success"
+    finally:
+        call_info.latency_ms = (time.perf_counter() - started) * 1000
+
+
+def _record_usage(call_info: LLMCallInfo | None, usage) -> None:
+    if call_info is None or usage is None:
+        return
+    call_info.prompt_tokens = usage.prompt_tokens or 0
+    call_info.completion_tokens = usage.completion_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    call_info.cached_prompt_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def analyze_preparation_with_openai(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    timeout: float | None = None,
+    call_info: LLMCallInfo | None = None,
+) -> AnalysisOutput:
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+
+    client = get_openai_client()
+    if timeout is not None:
+        # Presupuesto total de la llamada: sin reintentos que lo multipliquen.
+        client = client.with_options(timeout=timeout, max_retries=0)
+    with _track_call(call_info):
+        completion = client.chat.completions.create(**_chat_request(preparation, mode))
+        _record_usage(call_info, completion.usage)
+        return _parse_completion(completion)
+
+
+async def analyze_preparation_with_openai_async(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    call_info: LLMCallInfo | None = None,
+) -> AnalysisOutput:
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+
+    with _track_call(call_info):
+        completion = await get_async_openai_client().chat.completions.create(**_chat_request(preparation, mode))
+        _record_usage(call_info, completion.usage)
+        return _parse_completion(completion)
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+
+def submit_analysis_batch(requests: list[tuple[str, PreparationInput, FeedbackMode]]):
+    """Sube un JSONL con una chat completion por caso y crea el batch. Devuelve el Batch del proveedor."""
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": _chat_request(preparation, mode),
+            },
+            ensure_ascii=False,
+        )
+        for custom_id, preparation, mode in requests
+    ]
+    client = get_openai_client()
+    input_file = client.files.create(
+        file=("analysis_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+
+
+def retrieve_analysis_batch(batch_id: str):
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+    return get_openai_client().batches.retrieve(batch_id)
+
+
+def fetch_analysis_batch_results(
+    output_file_id: str,
+    call_infos: dict[str, LLMCallInfo] | None = None,
+) -> dict[str, AnalysisOutput | str]:
+    """Lee el archivo de salida del batch: custom_id -> análisis validado o mensaje de error.
+
+    Si se pasa `call_infos`, se completa con la contabilidad de cada línea (modelo, tokens y
+    resultado); el batch no informa latencia por llamada.
+    """
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+
+    results: dict[str, AnalysisOutput | str] = {}
+    content = get_openai_client().files.content(output_file_id).text
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        body = response.get("body") or {}
+        call_info = LLMCallInfo(model=body.get("model") or settings.openai_model)
+        if call_infos is not None:
+            call_infos[item["custom_id"]] = call_info
+        if body.get("usage"):
+            _record_usage(call_info, CompletionUsage.model_validate(body["usage"]))
+
+        if item.get("error") or response.get("status_code") != 200:
+            error = item.get("error") or {}
+            results[item["custom_id"]] = error.get("message") or f"HTTP {response.get('status_code')}"
+            continue
+        try:
+            results[item["custom_id"]] = _parse_content(body["choices"][0]["message"]["content"])
+            call_info.outcome = "success"
+        except InvalidLLMResponse as exc:
+            call_info.outcome = exc.outcome
+            results[item["custom_id"]] = str(exc)
+        except (KeyError, IndexError):
+            results[item["custom_id"]] = "Respuesta de batch inválida"
+    return results
+
+
+@dataclass(frozen=True)
+class AnalysisSection:
+    key: str
+    value: Any
+
+
+class _SectionParser:
+    """Parser incremental del objeto JSON de respuesta: entrega cada clave de primer nivel
+    en cuanto su valor está completo, sin esperar al cierre del objeto."""
+
+    _WHITESPACE = " \t\r\n"
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+
+    def _skip(self, pos: int, chars: str) -> int:
+        while pos < len(self._buffer) and self._buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def feed(self, chunk: str) -> list[AnalysisSection]:
+        self._buffer += chunk
+        sections: list[AnalysisSection] = []
+
+        if not self._started:
+            pos = self._skip(self._pos, self._WHITESPACE)
+            if pos >= len(self._buffer):
+                return sections
+            if self._buffer[pos] != "{":
+                raise InvalidLLMResponse("OpenAI devolvió JSON inválido", "invalid_json")
+            self._pos = pos + 1
+            self._started = True
+
+        while True:
+            pos = self._skip(self._pos, self._WHITESPACE + ",")
+            if pos >= len(self._buffer) or self._buffer[pos] != '"':
+                return sections
+            try:
+                key, pos = self._decoder.raw_decode(self._buffer, pos)
+                pos = self._skip(pos, self._WHITESPACE)
+                if pos >= len(self._buffer) or self._buffer[pos] != ":":
+                    return sections
+                value, pos = self._decoder.raw_decode(self._buffer, self._skip(pos + 1, self._WHITESPACE))
+            except json.JSONDecodeError:
+                return sections
+            # Un valor solo es definitivo cuando ya llegó el delimitador que lo cierra.
+            pos = self._skip(pos, self._WHITESPACE)
+            if pos >= len(self._buffer) or self._buffer[pos] not in ",}":
+                return sections
+            self._pos = pos
+            sections.append(AnalysisSection(key=key, value=value))
+
+
+async def stream_analysis_with_openai(
+    preparation: PreparationInput,
+    mode: FeedbackMode,
+    call_info: LLMCallInfo | None = None,
+) -> AsyncIterator[AnalysisSection | AnalysisOutput]:
+    """Emite cada sección apenas es parseable y termina con el AnalysisOutput validado."""
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+
+    with _track_call(call_info):
+        stream = await get_async_openai_client().chat.completions.create(
+            **_chat_request(preparation, mode),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parser = _SectionParser()
+        content_parts: list[str] = []
+        async for chunk in stream:
+            # El último chunk trae solo el uso de tokens, sin choices.
+            _record_usage(call_info, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            content_parts.append(delta)
+            for section in parser.feed(delta):
+                yield section
+
+        analysis = _parse_content("".join(content_parts))
+    yield analysis
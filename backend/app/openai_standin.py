@@ -0,0 +1,323 @@
+"""Stand-in local y determinístico de la API de OpenAI que usa openai_engine.
+
+Sirve para tests y pruebas de carga sin key real: `uvicorn app.openai_standin:app --port 8100`
+y `OPENAI_BASE_URL=http://localhost:8100/v1` en el backend. Latencia, tasa de error y
+payloads se configuran con las variables `OPENAI_STANDIN_*`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .settings import settings
+
+
+# Percentil 95 de la normal estándar, para derivar la dispersión de la log-normal.
+_Z_95 = 1.6449
+_STREAM_CHUNK_CHARS = 24
+
+
+def canned_analysis_content(request_body: dict) -> str:
+    # Misma entrada, misma salida: la huella sale de los mensajes enviados.
+    digest = hashlib.sha256(json.dumps(request_body.get("messages", []), sort_keys=True).encode("utf-8")).hexdigest()
+    return json.dumps(
+        {
+            "clarification_questions": [],
+            "observations": [f"Análisis simulado {digest[:8]}"],
+            "suggestions": ["Sugerencia simulada"],
+            "next_steps": ["Próximo paso simulado"],
+            "inconsistencies": [],
+            "preparation_level": "Estructurado",
+        },
+        ensure_ascii=False,
+    )
+
+
+def canned_payload_responder(payloads: list[str]) -> Callable[[dict], str]:
+    """Devuelve los payloads en ronda; pueden incluir respuestas inválidas para probar fallbacks."""
+    if not payloads:
+        raise ValueError("Se requiere al menos un payload")
+    cycle = itertools.cycle(payloads)
+    lock = threading.Lock()
+
+    def responder(request_body: dict) -> str:
+        with lock:
+            return next(cycle)
+
+    return responder
+
+
+@dataclass(frozen=True)
+class StandinBehavior:
+    """Latencia log-normal definida por mediana y p95, y fracción de requests que fallan."""
+
+    latency_median_ms: float = 0.0
+    latency_p95_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int | None = None
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.latency_median_ms <= 0:
+            return 0.0
+        p95 = max(self.latency_p95_ms, self.latency_median_ms)
+        sigma = math.log(p95 / self.latency_median_ms) / _Z_95
+        return rng.lognormvariate(math.log(self.latency_median_ms), sigma) / 1000
+
+    def should_fail(self, rng: random.Random) -> bool:
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _usage(request_body: dict, content: str) -> dict:
+    prompt_tokens = sum(_approx_tokens(str(message.get("content", ""))) for message in request_body.get("messages", []))
+    completion_tokens = _approx_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _chat_completion(request_body: dict, content: str, completion_id: str) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request_body.get("model", "standin"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _usage(request_body, content),
+    }
+
+
+def _stream_chunk(request_body: dict, completion_id: str, delta: dict, finish_reason: str | None = None) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request_body.get("model", "standin"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _parse_multipart(content_type: str, body: bytes) -> tuple[dict[str, str], tuple[str, bytes] | None]:
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    if not message.is_multipart():
+        raise HTTPException(status_code=400, detail="Se esperaba multipart/form-data")
+
+    fields: dict[str, str] = {}
+    upload: tuple[str, bytes] | None = None
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename() is not None:
+            upload = (part.get_filename(), part.get_payload(decode=True) or b"")
+        elif name:
+            fields[name] = part.get_content().strip()
+    return fields, upload
+
+
+def create_standin_app(
+    responder: Callable[[dict], str] = canned_analysis_content,
+    behavior: StandinBehavior | None = None,
+) -> FastAPI:
+    """`responder` recibe el body de la chat completion y devuelve el contenido del mensaje."""
+    standin = FastAPI(title="OpenAI stand-in")
+    behavior = behavior or StandinBehavior()
+    rng = random.Random(behavior.seed)
+    files: dict[str, dict] = {}
+    batches: dict[str, dict] = {}
+    ids = itertools.count(1)
+    lock = threading.Lock()
+
+    def next_id(prefix: str) -> str:
+        with lock:
+            return f"{prefix}-standin-{next(ids)}"
+
+    def store_file(filename: str, purpose: str, data: bytes) -> dict:
+        file_id = next_id("file")
+        files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "data": data,
+        }
+        return files[file_id]
+
+    def public_file(item: dict) -> dict:
+        return {key: value for key, value in item.items() if key != "data"}
+
+    def run_batch(batch: dict) -> None:
+        output_lines = []
+        completed = failed = 0
+        for line in files[batch["input_file_id"]]["data"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request_line = json.loads(line)
+            request_id = next_id("batch_req")
+            try:
+                content = responder(request_line["body"])
+            except Exception as exc:  # noqa: BLE001 - el error viaja en la línea de salida, como en OpenAI
+                failed += 1
+                output_lines.append(
+                    {
+                        "id": request_id,
+                        "custom_id": request_line["custom_id"],
+                        "response": None,
+                        "error": {"code": "standin_error", "message": str(exc)},
+                    }
+                )
+                continue
+            completed += 1
+            output_lines.append(
+                {
+                    "id": request_id,
+                    "custom_id": request_line["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": request_id,
+                        "body": _chat_completion(request_line["body"], content, next_id("chatcmpl")),
+                    },
+                    "error": None,
+                }
+            )
+
+        output = "\n".join(json.dumps(item, ensure_ascii=False) for item in output_lines)
+        batch["output_file_id"] = store_file("batch_output.jsonl", "batch_output", output.encode("utf-8"))["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": completed + failed, "completed": completed, "failed": failed}
+
+    async def stream_completion(request_body: dict, content: str, completion_id: str) -> AsyncIterator[str]:
+        chunks = [_stream_chunk(request_body, completion_id, {"role": "assistant", "content": ""})]
+        for start in range(0, len(content), _STREAM_CHUNK_CHARS):
+            delta = {"content": content[start : start + _STREAM_CHUNK_CHARS]}
+            chunks.append(_stream_chunk(request_body, completion_id, delta))
+        chunks.append(_stream_chunk(request_body, completion_id, {}, finish_reason="stop"))
+        if (request_body.get("stream_options") or {}).get("include_usage"):
+            chunks.append({**chunks[-1], "choices": [], "usage": _usage(request_body, content)})
+
+        for chunk in chunks:
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0)
+        yield "data: [DONE]\n\n"
+
+    @standin.post("/v1/chat/completions")
+    async def chat_completions(request_body: dict) -> Response:
+        with lock:
+            latency = behavior.sample_latency(rng)
+            fail = behavior.should_fail(rng)
+        if latency:
+            await asyncio.sleep(latency)
+        if fail:
+            return JSONResponse(
+                status_code=behavior.error_status,
+                content={"error": {"message": "Error simulado del stand-in", "type": "server_error", "code": None}},
+            )
+
+        content = responder(request_body)
+        completion_id = next_id("chatcmpl")
+        if request_body.get("stream"):
+            return StreamingResponse(
+                stream_completion(request_body, content, completion_id),
+                media_type="text/event-stream",
+            )
+        return JSONResponse(content=_chat_completion(request_body, content, completion_id))
+
+    @standin.post("/v1/files")
+    async def upload_file(request: Request) -> dict:
+        fields, upload = _parse_multipart(request.headers.get("content-type", ""), await request.body())
+        if upload is None:
+            raise HTTPException(status_code=400, detail="Falta el archivo")
+        filename, data = upload
+        return public_file(store_file(filename, fields.get("purpose", ""), data))
+
+    @standin.get("/v1/files/{file_id}/content")
+    def file_content(file_id: str) -> Response:
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="Archivo no encontrado")
+        return Response(content=files[file_id]["data"], media_type="application/octet-stream")
+
+    @standin.post("/v1/batches")
+    def create_batch(payload: dict) -> dict:
+        if payload.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="input_file_id inexistente")
+        batch_id = next_id("batch")
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload.get("endpoint"),
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload.get("completion_window"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        return batches[batch_id]
+
+    @standin.get("/v1/batches/{batch_id}")
+    def retrieve_batch(batch_id: str) -> dict:
+        batch = batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch no encontrado")
+        # La creación responde "in_progress"; el batch se procesa en la primera consulta.
+        with lock:
+            pending = batch["status"] == "in_progress"
+            if pending:
+                batch["status"] = "finalizing"
+        if pending:
+            run_batch(batch)
+        return batch
+
+    return standin
+
+
+def _app_from_settings() -> FastAPI:
+    responder = canned_analysis_content
+    if settings.openai_standin_payloads_file:
+        payloads = json.loads(Path(settings.openai_standin_payloads_file).read_text(encoding="utf-8"))
+        # Cada payload puede ser un objeto JSON o un string crudo (ej. JSON inválido a propósito).
+        responder = canned_payload_responder(
+            [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in payloads]
+        )
+    return create_standin_app(
+        responder,
+        StandinBehavior(
+            latency_median_ms=settings.openai_standin_latency_median_ms,
+            latency_p95_ms=settings.openai_standin_latency_p95_ms,
+            error_rate=settings.openai_standin_error_rate,
+            seed=int(settings.openai_standin_seed) if settings.openai_standin_seed else None,
+        ),
+    )
+
+
+app = _app_from_settings()
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+def _hash_in_worker(password: str, submitted_at: float) -> tuple[str, float]:
+    # La espera se mide al tomar la tarea, antes del pbkdf2, para no mezclarla con el cómputo.
+    waited = time.time() - submitted_at
+    return pwd_context.hash(password), waited
+
+
+def _verify_in_worker(password: str, password_hash: str, submitted_at: float) -> tuple[bool, float]:
+    waited = time.time() - submitted_at
+    return pwd_context.verify(password, password_hash), waited
+
+
+def _percentile_ms(samples: list[float], quantile: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(quantile * len(ordered)))
+    return round(ordered[index] * 1000, 2)
+
+
+class PasswordHasher:
+    """Hashing pbkdf2 fuera del event loop y del threadpool de requests.
+
+    Corre en un pool de procesos (escapa del GIL) y limita las operaciones en vuelo con un
+    semáforo; registra cuánto espera cada operación por el semáforo y por un worker libre.
+    Con `max_workers=0` usa threads, útil donde no se pueden lanzar procesos.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, sample_size: int = 1000) -> None:
+        self.max_workers = max_workers
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        # Un semáforo por event loop: asyncio.Semaphore queda atado al loop donde espera.
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._admission_waits: deque[float] = deque(maxlen=sample_size)
+        self._pool_waits: deque[float] = deque(maxlen=sample_size)
+        self.operations = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_executor(self) -> Executor | None:
+        if self.max_workers <= 0:
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        # spawn: hacer fork de un servidor con threads puede dejar locks tomados.
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    async def _run(self, fn, *args):
+        requested_at = time.perf_counter()
+        async with self._semaphore():
+            admitted_at = time.perf_counter()
+            with self._lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                result, pool_wait = await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), fn, *args, time.time()
+                )
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        with self._lock:
+            self.operations += 1
+            self._admission_waits.append(admitted_at - requested_at)
+            self._pool_waits.append(max(pool_wait, 0.0))
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash_in_worker, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(_verify_in_worker, password, password_hash)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            admission = list(self._admission_waits)
+            pool = list(self._pool_waits)
+            return {
+                "workers": self.max_workers,
+                "max_concurrency": self.max_concurrency,
+                "operations": self.operations,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admission_wait_p50_ms": _percentile_ms(admission, 0.50),
+                "admission_wait_p95_ms": _percentile_ms(admission, 0.95),
+                "pool_wait_p50_ms": _percentile_ms(pool, 0.50),
+                "pool_wait_p95_ms": _percentile_ms(pool, 0.95),
+            }
@@ -5,7 +5,7 @@ from typing import Any
 
 from pydantic import BaseModel, ConfigDict, Field
 
-from .models import CaseStatus, CohortStatus, FeedbackMode, UserRole
+from .models import AnalysisJobStatus, CaseStatus, CohortStatus, FeedbackMode, UserRole
 
 MAX_CHAR = 280
 
@@ -50,6 +50,13 @@ class AdminUserCreate(BaseModel):
     role: UserRole = UserRole.STUDENT
 
 
+class AdminUserUpdate(BaseModel):
+    full_name: str | None = None
+    role: UserRole | None = None
+    is_active: bool | None = None
+    password: str | None = None
+
+
 class AdminUserRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -60,6 +67,19 @@ class AdminUserRead(BaseModel):
     is_active: bool
 
 
+class BulkUserImport(BaseModel):
+    users: list[AdminUserCreate]
+    cohort_id: int | None = None
+    skip_existing: bool = False
+
+
+class BulkUserImportResult(BaseModel):
+    created: int
+    enrolled: int
+    skipped_emails: list[str]
+    users: list[AdminUserRead]
+
+
 class CohortCreate(BaseModel):
     name: str
     start_date: datetime
@@ -135,6 +155,84 @@ class AnalysisOutput(BaseModel):
     preparation_level: str
 
 
+class AnalysisCacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+
+class CircuitBreakerStatus(BaseModel):
+    state: str
+    failure_rate: float
+    window_calls: int
+    window_size: int
+    failure_rate_threshold: float
+    open_seconds: float
+    retry_in_seconds: float
+    times_opened: int
+    short_circuited: int
+
+
+class PasswordHashingStats(BaseModel):
+    workers: int
+    max_concurrency: int
+    operations: int
+    in_flight: int
+    max_in_flight: int
+    admission_wait_p50_ms: float | None = None
+    admission_wait_p95_ms: float | None = None
+    pool_wait_p50_ms: float | None = None
+    pool_wait_p95_ms: float | None = None
+
+
+class AnalysisJobRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    case_id: int
+    status: AnalysisJobStatus
+    provider: str | None = None
+    result: dict[str, Any]
+    error: str
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class AnalysisBatchRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    cohort_id: int
+    provider_batch_id: str
+    status: str
+    case_ids: list[int]
+    applied_count: int
+    skipped_count: int
+    failed_count: int
+    created_at: datetime
+    applied_at: datetime | None = None
+
+
+class LLMUsageBucket(BaseModel):
+    group: str
+    calls: int
+    outcomes: dict[str, int]
+    fallback_rate: float
+    prompt_tokens: int
+    cached_prompt_tokens: int
+    completion_tokens: int
+    estimated_cost_usd: float
+    latency_p50_ms: float | None = None
+    latency_p95_ms: float | None = None
+    latency_p99_ms: float | None = None
+
+
 class RealResultBlock(BaseModel):
     explicit_objective_achieved: str = Field(min_length=2, max_length=MAX_CHAR)
     real_objective_achieved: str = Field(default="", max_length=MAX_CHAR)
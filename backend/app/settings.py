@@ -30,12 +30,52 @@ _load_env_files()
 
 @dataclass(frozen=True)
 class Settings:
+    database_url: str = os.getenv("DATABASE_URL", "sqlite:///./rb_framework.db")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_timeout_seconds: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    sqlite_mmap_size_bytes: int = int(os.getenv("SQLITE_MMAP_SIZE_BYTES", str(256 * 1024 * 1024)))
+    sqlite_cache_size_kib: int = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "65536"))
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")
+    openai_max_connections: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    openai_max_keepalive_connections: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    openai_keepalive_expiry_seconds: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    openai_connect_timeout_seconds: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+    openai_read_timeout_seconds: float = float(os.getenv("OPENAI_READ_TIMEOUT_SECONDS", "30"))
+    openai_max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    openai_prompt_cost_per_million: float = float(os.getenv("OPENAI_PROMPT_COST_PER_MILLION", "0.40"))
+    openai_cached_prompt_cost_per_million: float = float(os.getenv("OPENAI_CACHED_PROMPT_COST_PER_MILLION", "0.10"))
+    openai_completion_cost_per_million: float = float(os.getenv("OPENAI_COMPLETION_COST_PER_MILLION", "1.60"))
+    openai_batch_cost_factor: float = float(os.getenv("OPENAI_BATCH_COST_FACTOR", "0.5"))
+    openai_call_deadline_seconds: float = float(os.getenv("OPENAI_CALL_DEADLINE_SECONDS", "15"))
+    openai_breaker_failure_rate: float = float(os.getenv("OPENAI_BREAKER_FAILURE_RATE", "0.5"))
+    openai_breaker_window_size: int = int(os.getenv("OPENAI_BREAKER_WINDOW_SIZE", "20"))
+    openai_breaker_minimum_calls: int = int(os.getenv("OPENAI_BREAKER_MINIMUM_CALLS", "5"))
+    openai_breaker_open_seconds: float = float(os.getenv("OPENAI_BREAKER_OPEN_SECONDS", "30"))
+    openai_standin_latency_median_ms: float = float(os.getenv("OPENAI_STANDIN_LATENCY_MEDIAN_MS", "0"))
+    openai_standin_latency_p95_ms: float = float(os.getenv("OPENAI_STANDIN_LATENCY_P95_MS", "0"))
+    openai_standin_error_rate: float = float(os.getenv("OPENAI_STANDIN_ERROR_RATE", "0"))
+    openai_standin_payloads_file: str = os.getenv("OPENAI_STANDIN_PAYLOADS_FILE", "")
+    openai_standin_seed: str = os.getenv("OPENAI_STANDIN_SEED", "")
     analysis_provider: str = os.getenv("ANALYSIS_PROVIDER", "openai")
+    analysis_hedge_deadline_seconds: float = float(os.getenv("ANALYSIS_HEDGE_DEADLINE_SECONDS", "0.8"))
+    analysis_job_workers: int = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+    analysis_cache_max_entries: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "512"))
+    analysis_cache_ttl_seconds: int = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "3600"))
     jwt_secret_key: str = os.getenv("JWT_SECRET_KEY", "change_this_in_production")
     jwt_algorithm: str = os.getenv("JWT_ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "720"))
+    password_hash_workers: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    password_hash_max_concurrency: int = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", "8"))
+    user_import_max_rows: int = int(os.getenv("USER_IMPORT_MAX_ROWS", "1000"))
+    membership_sweep_interval_seconds: float = float(os.getenv("MEMBERSHIP_SWEEP_INTERVAL_SECONDS", "60"))
+    access_cache_max_entries: int = int(os.getenv("ACCESS_CACHE_MAX_ENTRIES", "4096"))
+    access_cache_ttl_seconds: int = int(os.getenv("ACCESS_CACHE_TTL_SECONDS", "300"))
+    auth_user_cache_max_entries: int = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "4096"))
+    auth_user_cache_ttl_seconds: int = int(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
     bootstrap_admin_email: str = os.getenv("BOOTSTRAP_ADMIN_EMAIL", "admin@rb.local")
     bootstrap_admin_password: str = os.getenv("BOOTSTRAP_ADMIN_PASSWORD", "admin1234")
     bootstrap_admin_full_name: str = os.getenv("BOOTSTRAP_ADMIN_FULL_NAME", "Administrador RB")
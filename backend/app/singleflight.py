@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class SingleFlight:
+    """Coalesce llamadas async concurrentes con la misma clave en una sola ejecución.
+
+    La primera llamada lanza la tarea; las que llegan mientras sigue en vuelo esperan el
+    mismo resultado (o la misma excepción). La tarea se protege con shield para que la
+    cancelación de un request no aborte el trabajo que comparten los demás.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _task: self._forget(key, _task))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Marca la excepción como observada aunque todos los requests se hayan cancelado.
+            task.exception()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import copy
+
+from app.analysis_engine import RULES, analyze_preparation
+from app.keyword_matcher import KeywordAutomaton
+from app.models import FeedbackMode
+from app.schemas import PreparationInput
+
+from .test_api_workflows import REQUIRED_PREPARATION
+
+
+def _preparation(**overrides: dict[str, str]) -> PreparationInput:
+    data = copy.deepcopy(REQUIRED_PREPARATION)
+    for block, fields in overrides.items():
+        data[block].update(fields)
+    return PreparationInput.model_validate(data)
+
+
+def test_keyword_automaton_reports_overlapping_matches_in_one_pass():
+    automaton = KeywordAutomaton(["plan b", "plan", "an", "b2b", "negociación", "ción"])
+
+    assert automaton.find_all("un plan b2b de negociación") == {"plan b", "plan", "an", "b2b", "negociación", "ción"}
+    assert automaton.find_all("planeamos") == {"plan", "an"}
+    assert automaton.find_all("") == frozenset()
+
+
+def test_rule_table_messages_are_unique_and_bucketed():
+    messages = [rule.message for rule in RULES]
+    assert len(messages) == len(set(messages))
+    assert {rule.bucket for rule in RULES} <= {
+        "inconsistencies",
+        "clarification_questions",
+        "observations",
+        "suggestions",
+    }
+
+
+def test_rules_match_case_insensitively_and_respect_negation():
+    batna_question = "¿Tu MAAN describe una alternativa accionable y específica si no hay acuerdo?"
+
+    without_alternative = analyze_preparation(
+        _preparation(power_alternatives={"maan": "Nada definido"}),
+        FeedbackMode.PROFESIONAL,
+    )
+    assert batna_question in without_alternative.clarification_questions
+
+    with_alternative = analyze_preparation(
+        _preparation(power_alternatives={"maan": "PLAN B con otro PROVEEDOR"}),
+        FeedbackMode.PROFESIONAL,
+    )
+    assert batna_question not in with_alternative.clarification_questions
+
+
+def test_grouped_salary_rules_preserve_table_order():
+    analysis = analyze_preparation(
+        _preparation(
+            context={"negotiation_type": "Oferta laboral"},
+            power_alternatives={"maan": "Ninguna"},
+        ),
+        FeedbackMode.CURSO,
+    )
+
+    salary_inconsistency = (
+        "La estrategia salarial no explicita alternativa externa/interna; eso debilita tu poder de negociación percibido."
+    )
+    assert salary_inconsistency in analysis.inconsistencies
+    assert analysis.suggestions[-2:] == [
+        "Conecta cada hipótesis de contraparte con evidencia observable para fortalecer criterio aplicado en clase.",
+        "Elegí foco pedagógico por ronda (ética, poder o conducta) y evaluá con evidencia observable, no solo con impresiones.",
+    ]
+    assert len(analysis.clarification_questions) <= 3
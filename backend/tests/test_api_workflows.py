@@ -1,13 +1,40 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
 from types import SimpleNamespace
 
+import httpx
+import pytest
+import sqlalchemy
 from fastapi.testclient import TestClient
-from sqlmodel import SQLModel, Session, create_engine, select
-
-from app import auth, db, main
-from app.models import Case, User, UserRole
+from openai import AsyncOpenAI, OpenAI
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session, select
+
+from app import analysis_engine, auth, db, main, metrics_rollup, openai_engine, openai_standin
+from app.circuit_breaker import CircuitBreaker, CircuitState
+from app.metrics_rollup import rebuild_metrics_rollup
+from app.models import (
+    AnalysisJob,
+    AnalysisJobStatus,
+    Case,
+    CaseStatus,
+    CohortMembership,
+    FeedbackMode,
+    LLMCallMetric,
+    MetricsRollup,
+    User,
+    UserRole,
+)
+from app.schemas import AnalysisOutput
 
 
 ADMIN_EMAIL = "admin@rb.local"
@@ -144,7 +171,7 @@ def _create_cohort(client: TestClient, admin_token: str, idx: int = 1) -> dict:
 
 def _build_test_client(tmp_path: Path, monkeypatch) -> TestClient:
     test_db_path = tmp_path / "test_backend.db"
-    test_engine = create_engine(f"sqlite:///{test_db_path}", echo=False)
+    test_engine = db.create_db_engine(f"sqlite:///{test_db_path}")
 
     monkeypatch.setattr(db, "engine", test_engine)
     monkeypatch.setattr(main, "engine", test_engine)
@@ -152,10 +179,12 @@ def _build_test_client(tmp_path: Path, monkeypatch) -> TestClient:
     patched_settings = SimpleNamespace(**main.settings.__dict__)
     patched_settings.analysis_provider = "rules"
     monkeypatch.setattr(main, "settings", patched_settings)
+    main.analysis_cache.clear()
+    main.openai_breaker.reset()
+    auth.user_cache.clear()
+    main.access_cache.clear()
 
-    SQLModel.metadata.create_all(test_engine)
-    db._ensure_case_columns()
-    db._ensure_leader_evaluation_columns()
+    db.init_db()
 
     with Session(test_engine) as session:
         existing_admin = session.exec(select(User).where(User.email == ADMIN_EMAIL)).first()
@@ -174,6 +203,41 @@ def _build_test_client(tmp_path: Path, monkeypatch) -> TestClient:
     return TestClient(main.app)
 
 
+@contextmanager
+def _captured_statements() -> Iterator[list[str]]:
+    statements: list[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        sqlalchemy.event.remove(db.engine, "before_cursor_execute", capture)
+
+
+def _use_openai_standin(monkeypatch, standin_app) -> None:
+    patched_engine_settings = SimpleNamespace(**openai_engine.settings.__dict__)
+    patched_engine_settings.openai_api_key = "sk-test"
+    monkeypatch.setattr(openai_engine, "settings", patched_engine_settings)
+    monkeypatch.setattr(
+        openai_engine,
+        "_client",
+        OpenAI(api_key="sk-test", base_url="http://standin/v1", http_client=TestClient(standin_app), max_retries=0),
+    )
+    monkeypatch.setattr(
+        openai_engine,
+        "_async_client",
+        AsyncOpenAI(
+            api_key="sk-test",
+            base_url="http://standin/v1",
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=standin_app)),
+            max_retries=0,
+        ),
+    )
+
+
 def test_health_and_bootstrap_login(monkeypatch, tmp_path: Path):
     client = _build_test_client(tmp_path, monkeypatch)
 
@@ -238,6 +302,189 @@ def test_admin_anonymous_metrics_endpoint(monkeypatch, tmp_path: Path):
     assert payload["cases_total"] >= payload["cases_closed"]
 
 
+def test_metrics_are_read_from_rollup_rebuilt_from_cases(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=1)
+    cohort = _create_cohort(client, admin_token, idx=1)
+
+    with Session(db.engine) as session:
+        admin_id = session.exec(select(User.id).where(User.email == ADMIN_EMAIL)).one()
+        closed = {"status": CaseStatus.CERRADO, "cohort_id": cohort["id"]}
+        session.add_all(
+            [
+                Case(
+                    title="Ciclo de tres días",
+                    owner_user_id=admin_id,
+                    created_at=datetime(2026, 1, 1, 10),
+                    closed_at=datetime(2026, 1, 4, 9),
+                    agreement_quality_result=4,
+                    agreement_quality_relationship=5,
+                    confidence_start=5,
+                    confidence_end=8,
+                    **closed,
+                ),
+                Case(
+                    title="Cierre con fecha anterior",
+                    owner_user_id=student["id"],
+                    created_at=datetime(2026, 2, 10),
+                    closed_at=datetime(2026, 2, 9),
+                    confidence_start=6,
+                    confidence_end=5,
+                    **closed,
+                ),
+                Case(
+                    title="Sin confianza final",
+                    owner_user_id=student["id"],
+                    created_at=datetime(2026, 1, 5),
+                    updated_at=datetime(2026, 3, 2),
+                    agreement_quality_result=3,
+                    agreement_quality_relationship=3,
+                    agreement_quality_sustainability=3,
+                    confidence_start=4,
+                    **closed,
+                ),
+                Case(title="Abierto", owner_user_id=admin_id, preparation={"context": {"objective": "x" * 500}}),
+            ]
+        )
+        session.commit()
+    with db.engine.begin() as conn:
+        rebuild_metrics_rollup(conn)
+
+    with _captured_statements() as statements:
+        response = client.get("/api/admin/metrics/anonymous", headers=_auth_headers(admin_token))
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "cohort_id": None,
+        "cases_total": 4,
+        "cases_closed": 3,
+        "close_rate": 75.0,
+        "cycle_days_avg": 1.5,
+        "agreement_quality_avg": 3.75,
+        "confidence_delta_avg": 1.0,
+        "confidence_delta_trend": [
+            {"period": "2026-01", "confidence_delta_avg": 3.0, "cases_count": 1},
+            {"period": "2026-02", "confidence_delta_avg": -1.0, "cases_count": 1},
+        ],
+        "active_students_with_cases": 2,
+    }
+    assert not any('FROM "case"' in statement for statement in statements)
+
+    by_cohort = client.get(
+        f"/api/admin/metrics/anonymous?cohort_id={cohort['id']}", headers=_auth_headers(admin_token)
+    ).json()
+    assert (by_cohort["cases_total"], by_cohort["close_rate"]) == (3, 100.0)
+
+    student_token = _login(client, student["email"], "student1234")
+    mine = client.get("/api/metrics/me", headers=_auth_headers(student_token)).json()
+    assert (mine["cases_total"], mine["cycle_days_avg"], mine["agreement_quality_avg"]) == (2, 0.0, 3.0)
+
+
+def test_metrics_rollup_tracks_case_create_close_and_delete(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    _create_case_lifecycle(client, admin_token)
+    _create_case_lifecycle(client, admin_token)
+    discarded = client.post(
+        "/api/cases", json={"title": "Descartado", "mode": "curso"}, headers=_auth_headers(admin_token)
+    )
+    assert discarded.status_code == 200, discarded.text
+    assert client.delete(f"/api/cases/{discarded.json()['id']}", headers=_auth_headers(admin_token)).status_code == 200
+
+    def rollup_snapshot() -> set[tuple]:
+        with Session(db.engine) as session:
+            return {
+                (row.scope, row.scope_id, row.period, row.cases_created, row.cases_closed, row.confidence_delta_sum)
+                for row in session.exec(select(MetricsRollup)).all()
+            }
+
+    incremental = rollup_snapshot()
+    with db.engine.begin() as conn:
+        rebuild_metrics_rollup(conn)
+    assert incremental == rollup_snapshot()
+
+    metrics = client.get("/api/metrics/me", headers=_auth_headers(admin_token)).json()
+    assert (metrics["cases_total"], metrics["cases_closed"], metrics["confidence_delta_avg"]) == (2, 2, 2.0)
+
+
+def test_metrics_rollup_upsert_supports_postgres_and_plain_update_fallback(monkeypatch, tmp_path: Path):
+    key = {"scope": "global", "scope_id": 0, "period": "2026-05"}
+    postgres_sql = str(
+        metrics_rollup._upsert_statement("postgresql", key, {"cases_created": 1}).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ON CONFLICT (scope, scope_id, period) DO UPDATE" in postgres_sql
+    assert metrics_rollup._upsert_statement("mysql", key, {"cases_created": 1}) is None
+
+    # Un motor sin upsert nativo usa UPDATE y luego INSERT, con el mismo resultado.
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(metrics_rollup, "_UPSERT_INSERTS", {})
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    _create_case_lifecycle(client, admin_token)
+    _create_case_lifecycle(client, admin_token)
+
+    metrics = client.get("/api/metrics/me", headers=_auth_headers(admin_token)).json()
+    assert (metrics["cases_total"], metrics["cases_closed"]) == (2, 2)
+    with Session(db.engine) as session:
+        global_rows = session.exec(select(MetricsRollup).where(MetricsRollup.scope == "global")).all()
+    assert len(global_rows) == 1
+
+
+def test_case_list_projects_columns_and_paginates_with_cursor(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=1)
+    student_token = _login(client, student["email"], "student1234")
+
+    admin_ids = [
+        client.post(
+            "/api/cases", json={"title": f"Caso {idx}", "mode": "curso"}, headers=_auth_headers(admin_token)
+        ).json()["id"]
+        for idx in range(5)
+    ]
+    student_case = client.post(
+        "/api/cases", json={"title": "Caso alumno", "mode": "curso"}, headers=_auth_headers(student_token)
+    ).json()
+    with Session(db.engine) as session:
+        # Mismo updated_at en tres casos: el id desempata el orden y el cursor.
+        for case_id in admin_ids[1:4]:
+            case = session.get(Case, case_id)
+            case.updated_at = datetime(2026, 5, 1, 12)
+            session.add(case)
+        session.commit()
+
+    full_list = client.get("/api/cases", headers=_auth_headers(admin_token))
+    assert "X-Next-Cursor" not in full_list.headers
+    expected_order = [item["id"] for item in full_list.json()]
+    assert len(expected_order) == 6
+
+    paged: list[int] = []
+    cursor = None
+    with _captured_statements() as statements:
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = client.get("/api/cases", params=params, headers=_auth_headers(admin_token))
+            assert page.status_code == 200, page.text
+            paged.extend(item["id"] for item in page.json())
+            cursor = page.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+    assert paged == expected_order
+    case_queries = [statement for statement in statements if 'FROM "case"' in statement]
+    assert case_queries and not any("preparation" in statement for statement in case_queries)
+
+    by_owner = client.get(f"/api/cases?owner_user_id={student['id']}", headers=_auth_headers(admin_token)).json()
+    assert [item["id"] for item in by_owner] == [student_case["id"]]
+    assert client.get("/api/cases?status=cerrado", headers=_auth_headers(admin_token)).json() == []
+    assert [item["id"] for item in client.get("/api/cases", headers=_auth_headers(student_token)).json()] == [
+        student_case["id"]
+    ]
+    assert client.get("/api/cases?cursor=no-es-un-cursor", headers=_auth_headers(admin_token)).status_code == 400
+    assert client.get("/api/cases?limit=0", headers=_auth_headers(admin_token)).status_code == 400
+
+
 def test_leader_evaluation_admin_create_and_student_read(monkeypatch, tmp_path: Path):
     client = _build_test_client(tmp_path, monkeypatch)
     admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
@@ -495,3 +742,867 @@ def test_leader_evaluation_rejects_invalid_period_label(monkeypatch, tmp_path: P
         headers=_auth_headers(admin_token),
     )
     assert response.status_code == 400
+
+
+def test_repeated_analysis_is_served_from_cache(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso cacheado", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    stats_before = client.get("/api/admin/analysis/cache", headers=_auth_headers(admin_token)).json()
+    first = client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+    second = client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json() == second.json()
+
+    stats_after = client.get("/api/admin/analysis/cache", headers=_auth_headers(admin_token)).json()
+    assert stats_after["misses"] == stats_before["misses"] + 1
+    assert stats_after["hits"] == stats_before["hits"] + 1
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    analysis_versions = [item for item in versions if item["event"] == "analysis_generated"]
+    assert [item["payload"].get("cached", False) for item in analysis_versions] == [False, True]
+
+
+def test_analyze_awaits_async_openai_provider(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+
+    async def fake_openai(preparation, mode, call_info=None):
+        return AnalysisOutput(
+            clarification_questions=["¿Pregunta IA?"],
+            observations=["Observación IA"],
+            suggestions=[],
+            next_steps=[],
+            inconsistencies=[],
+            preparation_level="Avanzado",
+        )
+
+    monkeypatch.setattr(main, "analyze_preparation_with_openai_async", fake_openai)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso IA", "mode": "profesional"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    response = client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+    assert response.status_code == 200, response.text
+    assert response.json()["observations"] == ["Observación IA"]
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    assert versions[-1]["payload"]["provider"] == "openai"
+
+
+def test_analysis_job_runs_in_background_and_is_pollable(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=60)
+    student_token = _login(client, student["email"], "student1234")
+
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso en cola", "mode": "curso"},
+        headers=_auth_headers(student_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(student_token))
+
+    enqueue = client.post(f"/api/cases/{case_id}/analysis-jobs", headers=_auth_headers(student_token))
+    assert enqueue.status_code == 202, enqueue.text
+    job_id = enqueue.json()["id"]
+
+    deadline = time.monotonic() + 10
+    job = enqueue.json()
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(f"/api/analysis-jobs/{job_id}", headers=_auth_headers(student_token)).json()
+
+    assert job["status"] == "succeeded", job
+    assert job["provider"] == "rules"
+    assert job["result"]["preparation_level"]
+
+    case_data = client.get(f"/api/cases/{case_id}", headers=_auth_headers(student_token)).json()
+    assert case_data["status"] == "preparado"
+    assert case_data["analysis"] == job["result"]
+
+    other = _create_student(client, admin_token, idx=61)
+    other_token = _login(client, other["email"], "student1234")
+    forbidden = client.get(f"/api/analysis-jobs/{job_id}", headers=_auth_headers(other_token))
+    assert forbidden.status_code == 403
+
+
+def test_running_analysis_job_left_by_a_quick_restart_is_requeued_later(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso con job colgado", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    # El proceso murió con el job tomado hace un minuto: al arrancar todavía no parece colgado.
+    with Session(db.engine) as session:
+        admin = session.exec(select(User).where(User.email == ADMIN_EMAIL)).one()
+        job = AnalysisJob(
+            case_id=case_id,
+            requested_by_user_id=admin.id,
+            status=AnalysisJobStatus.RUNNING,
+            started_at=datetime.now(UTC) - timedelta(minutes=1),
+        )
+        session.add(job)
+        session.commit()
+        job_id = job.id
+    assert main._requeue_stale_analysis_jobs() == []
+
+    # Un barrido posterior, ya vencido el plazo, lo reencola y el worker lo termina.
+    assert main._requeue_stale_analysis_jobs(now=datetime.now(UTC) + main.STALE_ANALYSIS_JOB_AFTER) == [job_id]
+    deadline = time.monotonic() + 10
+    status = "queued"
+    while status in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        status = client.get(f"/api/analysis-jobs/{job_id}", headers=_auth_headers(admin_token)).json()["status"]
+    assert status == "succeeded"
+
+
+def test_concurrent_identical_analyses_share_one_provider_call(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    calls = 0
+
+    async def slow_openai(preparation, mode, call_info=None):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return analysis_engine.analyze_preparation(preparation, mode)
+
+    monkeypatch.setattr(main, "analyze_preparation_with_openai_async", slow_openai)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso doble click", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    async def double_click() -> list[httpx.Response]:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            return await asyncio.gather(
+                *(
+                    async_client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+                    for _ in range(2)
+                )
+            )
+
+    responses = asyncio.run(double_click())
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+    assert calls == 1
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    assert len([item for item in versions if item["event"] == "analysis_generated"]) == 1
+
+
+def test_analyze_waits_for_database_lock_off_the_event_loop(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso con la base bloqueada", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    async def analyze_while_locked() -> tuple[httpx.Response, httpx.Response, bool]:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            with db.engine.connect() as locker:
+                locker.exec_driver_sql("BEGIN IMMEDIATE")
+                analyze = asyncio.ensure_future(
+                    async_client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+                )
+                await asyncio.sleep(0.3)
+                # El análisis espera el lock de escritura en un thread; el loop sigue atendiendo.
+                health = await asyncio.wait_for(async_client.get("/api/health"), timeout=1)
+                still_waiting = not analyze.done()
+                locker.exec_driver_sql("COMMIT")
+            return await analyze, health, still_waiting
+
+    analyze_response, health_response, still_waiting = asyncio.run(analyze_while_locked())
+    assert health_response.status_code == 200
+    assert still_waiting
+    assert analyze_response.status_code == 200, analyze_response.text
+
+
+def test_open_circuit_short_circuits_to_rules_engine(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    calls = 0
+
+    async def failing_openai(preparation, mode, call_info=None):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("upstream caído")
+
+    monkeypatch.setattr(main, "analyze_preparation_with_openai_async", failing_openai)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso con proveedor caído", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    for _ in range(main.openai_breaker.minimum_calls + 2):
+        response = client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+        assert response.status_code == 200
+
+    assert calls == main.openai_breaker.minimum_calls
+    status = client.get("/api/admin/analysis/circuit-breaker", headers=_auth_headers(admin_token)).json()
+    assert status["state"] == "open"
+    assert status["short_circuited"] == 2
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    assert versions[-1]["payload"]["provider"] == "rules_circuit_open"
+
+
+def test_hedged_analysis_answers_with_rules_and_upgrades_later(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "hedged")
+    monkeypatch.setattr(main.settings, "analysis_hedge_deadline_seconds", 0.05)
+    llm_analysis = AnalysisOutput(
+        clarification_questions=[],
+        observations=["Observación IA tardía"],
+        suggestions=[],
+        next_steps=[],
+        inconsistencies=[],
+        preparation_level="Avanzado",
+    )
+
+    async def slow_openai(preparation, mode, call_info=None):
+        await asyncio.sleep(0.3)
+        return llm_analysis
+
+    store_threads: list[int] = []
+    store_late_analysis = main._store_late_analysis
+
+    def tracked_store(case_id, fingerprint, analysis):
+        store_threads.append(threading.get_ident())
+        store_late_analysis(case_id, fingerprint, analysis)
+
+    store_analysis_for_case = main._store_analysis_for_case
+
+    def slow_primary_store(*args):
+        # La versión de reglas todavía se está guardando cuando llega la respuesta del LLM.
+        time.sleep(0.6)
+        return store_analysis_for_case(*args)
+
+    monkeypatch.setattr(main, "analyze_preparation_with_openai_async", slow_openai)
+    monkeypatch.setattr(main, "_store_late_analysis", tracked_store)
+    monkeypatch.setattr(main, "_store_analysis_for_case", slow_primary_store)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso en vivo", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    async def analyze_then_wait() -> tuple[httpx.Response, int]:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            response = await async_client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+            await asyncio.gather(*main._background_tasks)
+            return response, threading.get_ident()
+
+    response, loop_thread = asyncio.run(analyze_then_wait())
+    assert response.status_code == 200
+    # La mejora tardía se guarda fuera del thread del event loop.
+    assert len(store_threads) == 1 and store_threads[0] != loop_thread
+    assert response.json()["observations"] != llm_analysis.observations
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    assert [(item["event"], item["payload"]["provider"]) for item in versions if "provider" in item["payload"]] == [
+        ("analysis_generated", "rules_hedged"),
+        ("analysis_upgraded", "openai"),
+    ]
+    case_data = client.get(f"/api/cases/{case_id}", headers=_auth_headers(admin_token)).json()
+    assert case_data["analysis"]["observations"] == llm_analysis.observations
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_analysis_stream_emits_sections_then_persisted_result(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    llm_analysis = AnalysisOutput(
+        clarification_questions=[],
+        observations=["Observación en streaming"],
+        suggestions=["Sugerencia en streaming"],
+        next_steps=[],
+        inconsistencies=[],
+        preparation_level="Avanzado",
+    )
+
+    async def fake_stream(preparation, mode, call_info=None):
+        yield openai_engine.AnalysisSection("observations", llm_analysis.observations)
+        yield openai_engine.AnalysisSection("suggestions", llm_analysis.suggestions)
+        yield llm_analysis
+
+    monkeypatch.setattr(main, "stream_analysis_with_openai", fake_stream)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso en streaming", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    response = client.get(f"/api/cases/{case_id}/analyze/stream", headers=_auth_headers(admin_token))
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _sse_events(response.text)
+    assert events[:2] == [
+        ("section", {"key": "observations", "value": ["Observación en streaming"]}),
+        ("section", {"key": "suggestions", "value": ["Sugerencia en streaming"]}),
+    ]
+    assert {data["key"] for event, data in events if event == "section"} == set(AnalysisOutput.model_fields)
+    final_event, result = events[-1]
+    assert final_event == "result"
+    assert result["provider"] == "openai"
+    assert result["analysis"] == llm_analysis.model_dump()
+
+    versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+    assert versions[-1]["id"] == result["version_id"]
+    assert versions[-1]["payload"]["provider"] == "openai"
+
+
+def test_analysis_stream_falls_back_to_rules_when_stream_fails(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+
+    async def broken_stream(preparation, mode, call_info=None):
+        yield openai_engine.AnalysisSection("observations", ["Parcial"])
+        raise RuntimeError("stream cortado")
+
+    monkeypatch.setattr(main, "stream_analysis_with_openai", broken_stream)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso con stream cortado", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    events = _sse_events(
+        client.get(f"/api/cases/{case_id}/analyze/stream", headers=_auth_headers(admin_token)).text
+    )
+    assert [event for event, _ in events[:2]] == ["section", "fallback"]
+    assert events[-1][0] == "result"
+    assert events[-1][1]["provider"] == "rules_fallback"
+    assert events[-1][1]["analysis"]["observations"] != ["Parcial"]
+
+
+def test_analysis_stream_disconnect_releases_half_open_probe(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    now = 0.0
+    breaker = CircuitBreaker(
+        failure_rate_threshold=0.5,
+        window_size=2,
+        minimum_calls=1,
+        open_seconds=10,
+        clock=lambda: now,
+    )
+    monkeypatch.setattr(main, "openai_breaker", breaker)
+    breaker.record_failure()
+    now = 11.0
+    assert breaker.state == CircuitState.HALF_OPEN
+
+    async def slow_stream(preparation, mode, call_info=None):
+        yield openai_engine.AnalysisSection("observations", ["Primera sección"])
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(main, "stream_analysis_with_openai", slow_stream)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso con cliente que se va", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    async def read_first_event_and_disconnect() -> str:
+        with Session(db.engine) as session:
+            admin = session.exec(select(User).where(User.email == ADMIN_EMAIL)).one()
+            response = await main.stream_case_analysis(case_id, session, admin)
+            body = response.body_iterator
+            first_event = await body.__anext__()
+            await body.aclose()
+        return first_event
+
+    assert asyncio.run(read_first_event_and_disconnect()).startswith("event: section")
+    # La prueba cortada no deja el breaker tomado: la siguiente llamada puede probar al proveedor.
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    with Session(db.engine) as session:
+        assert session.exec(select(LLMCallMetric.outcome)).all() == ["cancelled"]
+
+
+def test_cohort_reanalysis_batch_applies_results_in_bulk(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    _use_openai_standin(monkeypatch, openai_standin.create_standin_app())
+
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=70)
+    cohort = _create_cohort(client, admin_token, idx=70)
+    client.post(
+        f"/api/admin/cohorts/{cohort['id']}/members",
+        json={"user_ids": [student["id"]]},
+        headers=_auth_headers(admin_token),
+    )
+    student_token = _login(client, student["email"], "student1234")
+
+    template_id = client.get("/api/case-templates", headers=_auth_headers(student_token)).json()[0]["id"]
+    case_ids = []
+    for _ in range(3):
+        case_id = client.post(
+            f"/api/cases/from-template/{template_id}",
+            json={},
+            headers=_auth_headers(student_token),
+        ).json()["id"]
+        client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(student_token))
+        client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(student_token))
+        case_ids.append(case_id)
+
+    created = client.post(
+        f"/api/admin/cohorts/{cohort['id']}/reanalysis-batches",
+        headers=_auth_headers(admin_token),
+    )
+    assert created.status_code == 202, created.text
+    batch = created.json()
+    assert batch["case_ids"] == case_ids
+    assert batch["status"] == "in_progress"
+
+    # La preparación cambió mientras el batch corría: ese caso no se pisa.
+    edited_preparation = {**REQUIRED_PREPARATION, "risk": {**REQUIRED_PREPARATION["risk"], "main_risk": "Otro riesgo"}}
+    client.put(f"/api/cases/{case_ids[0]}/preparation", json=edited_preparation, headers=_auth_headers(student_token))
+    client.post(f"/api/cases/{case_ids[0]}/analyze", headers=_auth_headers(student_token))
+
+    # Un error local al aplicar no se disfraza de falla del proveedor (502) y no deja nada a medias.
+    def broken_apply(session, batch, results, call_infos=None):
+        raise RuntimeError("falla local al aplicar")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(main, "_apply_batch_results", broken_apply)
+        with pytest.raises(RuntimeError, match="falla local"):
+            client.post(f"/api/admin/analysis-batches/{batch['id']}/sync", headers=_auth_headers(admin_token))
+    pending = client.get(f"/api/admin/analysis-batches/{batch['id']}", headers=_auth_headers(admin_token)).json()
+    assert (pending["status"], pending["applied_at"]) == ("in_progress", None)
+
+    synced = client.post(f"/api/admin/analysis-batches/{batch['id']}/sync", headers=_auth_headers(admin_token))
+    assert synced.status_code == 200, synced.text
+    assert synced.json()["status"] == "completed"
+    assert (synced.json()["applied_count"], synced.json()["skipped_count"], synced.json()["failed_count"]) == (2, 1, 0)
+
+    for case_id in case_ids[1:]:
+        versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+        assert (versions[-1]["event"], versions[-1]["payload"]["provider"]) == ("analysis_batch", "openai_batch")
+        case_data = client.get(f"/api/cases/{case_id}", headers=_auth_headers(admin_token)).json()
+        assert case_data["analysis"]["observations"][0].startswith("Análisis simulado")
+
+    untouched = client.get(f"/api/cases/{case_ids[0]}/versions", headers=_auth_headers(admin_token)).json()
+    assert untouched[-1]["event"] != "analysis_batch"
+
+    again = client.post(f"/api/admin/analysis-batches/{batch['id']}/sync", headers=_auth_headers(admin_token))
+    assert again.json() == synced.json()
+
+    # Cada línea del batch se contabiliza una sola vez, con sus tokens y sin latencia.
+    with Session(db.engine) as session:
+        batch_calls = session.exec(select(LLMCallMetric).where(LLMCallMetric.is_batch)).all()
+    assert sorted(call.case_id for call in batch_calls) == case_ids
+    assert {(call.cohort_id, call.outcome) for call in batch_calls} == {(cohort["id"], "success")}
+    assert all(call.prompt_tokens > 0 and call.completion_tokens > 0 for call in batch_calls)
+
+    usage = client.get(
+        "/api/admin/analysis/llm-usage",
+        params={"group_by": "cohort"},
+        headers=_auth_headers(admin_token),
+    ).json()
+    cohort_usage = next(bucket for bucket in usage if bucket["group"] == str(cohort["id"]))
+    assert (cohort_usage["calls"], cohort_usage["latency_p50_ms"]) == (3, None)
+    assert cohort_usage["estimated_cost_usd"] > 0
+
+
+def test_llm_call_recording_failure_is_logged(monkeypatch, tmp_path: Path, caplog):
+    # Base sin tablas: el INSERT falla y el análisis no se entera, pero queda en el log.
+    monkeypatch.setattr(main, "engine", db.create_db_engine(f"sqlite:///{tmp_path / 'sin_tablas.db'}"))
+    with caplog.at_level(logging.ERROR, logger=main.logger.name):
+        main._record_llm_call(openai_engine.LLMCallInfo(case_id=7, outcome="success"), FeedbackMode.CURSO)
+    assert "No se pudo registrar la llamada al LLM del caso 7" in caplog.text
+
+
+def test_llm_calls_are_accounted_per_cohort_and_mode(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    monkeypatch.setattr(main.settings, "openai_prompt_cost_per_million", 1.0)
+    monkeypatch.setattr(main.settings, "openai_completion_cost_per_million", 2.0)
+    outcomes = iter(["success", "invalid_json"])
+
+    async def metered_openai(preparation, mode, call_info=None):
+        call_info.model = "gpt-test"
+        call_info.prompt_tokens = 1000
+        call_info.completion_tokens = 500
+        call_info.latency_ms = 120.0
+        call_info.outcome = next(outcomes)
+        if call_info.outcome != "success":
+            raise RuntimeError("OpenAI devolvió JSON inválido")
+        return analysis_engine.analyze_preparation(preparation, mode)
+
+    monkeypatch.setattr(main, "analyze_preparation_with_openai_async", metered_openai)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    for idx, mode in enumerate(("curso", "profesional")):
+        case_id = client.post(
+            "/api/cases",
+            json={"title": f"Caso medido {idx}", "mode": mode},
+            headers=_auth_headers(admin_token),
+        ).json()["id"]
+        client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+        assert client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token)).status_code == 200
+
+    by_mode = client.get("/api/admin/analysis/llm-usage?group_by=mode", headers=_auth_headers(admin_token))
+    assert by_mode.status_code == 200, by_mode.text
+    assert [(item["group"], item["outcomes"]) for item in by_mode.json()] == [
+        ("curso", {"success": 1}),
+        ("profesional", {"invalid_json": 1}),
+    ]
+    assert by_mode.json()[1]["fallback_rate"] == 1.0
+
+    by_cohort = client.get("/api/admin/analysis/llm-usage?group_by=cohort", headers=_auth_headers(admin_token)).json()
+    assert len(by_cohort) == 1
+    assert by_cohort[0]["group"] == "sin_cohorte"
+    assert by_cohort[0]["calls"] == 2
+    assert by_cohort[0]["prompt_tokens"] == 2000
+    assert by_cohort[0]["estimated_cost_usd"] == 0.004
+    assert by_cohort[0]["latency_p95_ms"] == 120.0
+
+    invalid = client.get("/api/admin/analysis/llm-usage?group_by=model", headers=_auth_headers(admin_token))
+    assert invalid.status_code == 400
+
+
+def test_openai_mode_runs_real_code_path_against_standin(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    canned = {
+        "clarification_questions": ["¿Uno?", "¿Dos?", "¿Tres?", "¿Cuatro?"],
+        "observations": ["Observación enlatada"],
+        "suggestions": [],
+        "next_steps": [],
+        "inconsistencies": [],
+        "preparation_level": "Avanzado",
+    }
+    _use_openai_standin(
+        monkeypatch,
+        openai_standin.create_standin_app(
+            openai_standin.canned_payload_responder([json.dumps(canned), "esto no es JSON"]),
+            openai_standin.StandinBehavior(latency_median_ms=5, latency_p95_ms=20, seed=1),
+        ),
+    )
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    providers = []
+    for idx in range(2):
+        case_id = client.post(
+            "/api/cases",
+            json={"title": f"Caso stand-in {idx}", "mode": "profesional"},
+            headers=_auth_headers(admin_token),
+        ).json()["id"]
+        preparation = {**REQUIRED_PREPARATION, "risk": {**REQUIRED_PREPARATION["risk"], "key_signal": f"Señal {idx}"}}
+        client.put(f"/api/cases/{case_id}/preparation", json=preparation, headers=_auth_headers(admin_token))
+        response = client.post(f"/api/cases/{case_id}/analyze", headers=_auth_headers(admin_token))
+        assert response.status_code == 200, response.text
+        if idx == 0:
+            assert response.json()["observations"] == ["Observación enlatada"]
+            assert len(response.json()["clarification_questions"]) == 3
+        versions = client.get(f"/api/cases/{case_id}/versions", headers=_auth_headers(admin_token)).json()
+        providers.append(versions[-1]["payload"]["provider"])
+
+    assert providers == ["openai", "rules_fallback"]
+    usage = client.get("/api/admin/analysis/llm-usage?group_by=mode", headers=_auth_headers(admin_token)).json()
+    assert usage[0]["outcomes"] == {"success": 1, "invalid_json": 1}
+    assert usage[0]["prompt_tokens"] > 0
+    assert usage[0]["latency_p50_ms"] >= 1
+
+
+def test_analysis_stream_uses_standin_streaming_and_error_rate(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    monkeypatch.setattr(main.settings, "analysis_provider", "openai")
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    case_id = client.post(
+        "/api/cases",
+        json={"title": "Caso stream stand-in", "mode": "curso"},
+        headers=_auth_headers(admin_token),
+    ).json()["id"]
+    client.put(f"/api/cases/{case_id}/preparation", json=REQUIRED_PREPARATION, headers=_auth_headers(admin_token))
+
+    _use_openai_standin(monkeypatch, openai_standin.create_standin_app())
+    events = _sse_events(client.get(f"/api/cases/{case_id}/analyze/stream", headers=_auth_headers(admin_token)).text)
+    assert events[0] == ("section", {"key": "clarification_questions", "value": []})
+    assert events[-1][1]["provider"] == "openai"
+    assert events[-1][1]["analysis"]["observations"][0].startswith("Análisis simulado")
+
+    main.analysis_cache.clear()
+    _use_openai_standin(
+        monkeypatch,
+        openai_standin.create_standin_app(behavior=openai_standin.StandinBehavior(error_rate=1.0)),
+    )
+    events = _sse_events(client.get(f"/api/cases/{case_id}/analyze/stream", headers=_auth_headers(admin_token)).text)
+    assert events[0] == ("fallback", {"provider": "rules_fallback"})
+    assert events[-1][1]["provider"] == "rules_fallback"
+
+    usage = client.get("/api/admin/analysis/llm-usage?group_by=mode", headers=_auth_headers(admin_token)).json()
+    assert usage[0]["outcomes"] == {"success": 1, "error": 1}
+    assert usage[0]["completion_tokens"] > 0
+
+
+def test_authenticated_requests_use_token_claims_and_user_cache(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=80)
+    student_token = _login(client, student["email"], "student1234")
+
+    claims = auth.jwt.decode(student_token, auth.settings.jwt_secret_key, algorithms=[auth.settings.jwt_algorithm])
+    assert (claims["uid"], claims["role"], claims["tv"]) == (student["id"], "student", 0)
+
+    assert client.get("/api/case-templates", headers=_auth_headers(student_token)).status_code == 200
+    with _captured_statements() as statements:
+        response = client.get("/api/case-templates", headers=_auth_headers(student_token))
+    assert response.status_code == 200
+    assert statements == []
+
+    promoted = client.patch(
+        f"/api/admin/users/{student['id']}",
+        json={"role": "admin"},
+        headers=_auth_headers(admin_token),
+    )
+    assert promoted.status_code == 200, promoted.text
+    assert client.get("/api/case-templates", headers=_auth_headers(student_token)).status_code == 401
+
+    new_token = _login(client, student["email"], "student1234")
+    assert client.get("/api/admin/users", headers=_auth_headers(new_token)).status_code == 200
+
+    client.patch(f"/api/admin/users/{student['id']}", json={"is_active": False}, headers=_auth_headers(admin_token))
+    assert client.get("/api/auth/me", headers=_auth_headers(new_token)).status_code == 401
+
+
+def test_token_issued_by_another_worker_reloads_the_cached_user(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=81)
+    old_token = _login(client, student["email"], "student1234")
+    assert client.get("/api/auth/me", headers=_auth_headers(old_token)).status_code == 200
+
+    # Otro worker cambió la contraseña: la base avanzó pero el cache de este proceso no se enteró.
+    with Session(db.engine) as session:
+        user = session.get(User, student["id"])
+        user.token_version += 1
+        session.add(user)
+        session.commit()
+
+    new_token = _login(client, student["email"], "student1234")
+    assert client.get("/api/auth/me", headers=_auth_headers(new_token)).status_code == 200
+    assert client.get("/api/auth/me", headers=_auth_headers(old_token)).status_code == 401
+
+
+def test_bulk_user_import_from_csv_enrolls_into_cohort(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    cohort = _create_cohort(client, admin_token, idx=90)
+    existing = _create_student(client, admin_token, idx=90)
+
+    csv_body = (
+        "email,password,full_name,role\n"
+        "nuevo1@rb.local,clave1234,Nuevo Uno,\n"
+        "nuevo2@rb.local,clave1234,Nuevo Dos,student\n"
+        f"{existing['email']},ignorada,,\n"
+    )
+    rejected = client.post(
+        f"/api/admin/users/import?cohort_id={cohort['id']}",
+        content=csv_body,
+        headers={**_auth_headers(admin_token), "Content-Type": "text/csv"},
+    )
+    assert rejected.status_code == 400
+    assert rejected.json()["detail"] == [{"row": 3, "email": existing["email"], "error": "El email ya existe"}]
+
+    imported = client.post(
+        f"/api/admin/users/import?cohort_id={cohort['id']}&skip_existing=true",
+        content=csv_body,
+        headers={**_auth_headers(admin_token), "Content-Type": "text/csv"},
+    )
+    assert imported.status_code == 200, imported.text
+    body = imported.json()
+    assert (body["created"], body["enrolled"], body["skipped_emails"]) == (2, 3, [existing["email"]])
+    assert [user["email"] for user in body["users"]] == ["nuevo1@rb.local", "nuevo2@rb.local"]
+
+    members = client.get(f"/api/admin/cohorts/{cohort['id']}/members", headers=_auth_headers(admin_token)).json()
+    assert len(members) == 3
+    assert _login(client, "nuevo2@rb.local", "clave1234")
+
+
+def test_bulk_user_import_from_json_is_all_or_nothing(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+
+    response = client.post(
+        "/api/admin/users/import",
+        json={
+            "users": [
+                {"email": "a@rb.local", "password": "clave1234"},
+                {"email": "a@rb.local", "password": "clave1234"},
+                {"email": "sin-arroba", "password": "clave1234"},
+            ]
+        },
+        headers=_auth_headers(admin_token),
+    )
+    assert response.status_code == 400
+    assert [error["row"] for error in response.json()["detail"]] == [2, 3]
+
+    users = client.get("/api/admin/users", headers=_auth_headers(admin_token)).json()
+    assert [user["email"] for user in users] == [ADMIN_EMAIL]
+
+
+def test_access_profile_is_cached_until_next_cohort_boundary(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    student = _create_student(client, admin_token, idx=95)
+    live_cohort = _create_cohort(client, admin_token, idx=95)
+    upcoming = client.post(
+        "/api/admin/cohorts",
+        json={
+            "name": "Cohorte próxima",
+            "start_date": (datetime.now(UTC) + timedelta(seconds=60)).isoformat(),
+            "end_date": (datetime.now(UTC) + timedelta(days=30)).isoformat(),
+            "status": "active",
+        },
+        headers=_auth_headers(admin_token),
+    ).json()
+    for cohort in (live_cohort, upcoming):
+        client.post(
+            f"/api/admin/cohorts/{cohort['id']}/members",
+            json={"user_ids": [student["id"]]},
+            headers=_auth_headers(admin_token),
+        )
+    student_token = _login(client, student["email"], "student1234")
+
+    first = client.get("/api/auth/me", headers=_auth_headers(student_token)).json()
+    assert (first["effective_mode"], first["active_cohort_id"]) == ("sesion_en_vivo", live_cohort["id"])
+    with _captured_statements() as statements:
+        again = client.get("/api/auth/me", headers=_auth_headers(student_token)).json()
+    assert again == first
+    assert statements == []
+
+    # La entrada vence cuando arranca la próxima cohorte, antes que el TTL configurado.
+    expires_at, _value = main.access_cache._entries[student["id"]]
+    assert expires_at - time.monotonic() <= 60
+
+    client.delete(
+        f"/api/admin/cohorts/{live_cohort['id']}/members/{student['id']}",
+        headers=_auth_headers(admin_token),
+    )
+    after_removal = client.get("/api/auth/me", headers=_auth_headers(student_token)).json()
+    assert (after_removal["effective_mode"], after_removal["active_cohort_id"]) == ("sparring", None)
+
+    client.post(
+        f"/api/admin/cohorts/{live_cohort['id']}/members",
+        json={"user_ids": [student["id"]]},
+        headers=_auth_headers(admin_token),
+    )
+    client.patch(
+        f"/api/admin/cohorts/{live_cohort['id']}",
+        json={"status": "finished"},
+        headers=_auth_headers(admin_token),
+    )
+    after_finish = client.get("/api/auth/me", headers=_auth_headers(student_token)).json()
+    assert (after_finish["effective_mode"], after_finish["active_cohort_id"]) == ("sparring", live_cohort["id"])
+
+
+def test_expired_membership_is_ignored_on_read_and_swept_in_bulk(monkeypatch, tmp_path: Path):
+    client = _build_test_client(tmp_path, monkeypatch)
+    admin_token = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    cohort = _create_cohort(client, admin_token, idx=97)
+    students = [_create_student(client, admin_token, idx=97 + offset) for offset in range(2)]
+    client.post(
+        f"/api/admin/cohorts/{cohort['id']}/members",
+        json={"user_ids": [student["id"] for student in students]},
+        headers=_auth_headers(admin_token),
+    )
+    with Session(db.engine) as session:
+        for membership in session.exec(select(CohortMembership)).all():
+            membership.expiry_date = datetime.now(UTC) - timedelta(days=1)
+            session.add(membership)
+        session.commit()
+
+    student_token = _login(client, students[0]["email"], "student1234")
+    with _captured_statements() as statements:
+        profile = client.get("/api/auth/me", headers=_auth_headers(student_token)).json()
+    assert (profile["effective_mode"], profile["active_cohort_id"]) == ("sparring", None)
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+
+    assert main._sweep_expired_memberships() == 2
+    assert main._sweep_expired_memberships() == 0
+    with Session(db.engine) as session:
+        memberships = session.exec(select(CohortMembership)).all()
+        assert [membership.is_active for membership in memberships] == [False, False]
+        assert all(membership.left_at is not None for membership in memberships)
+
+
+def test_sqlite_engine_uses_wal_and_readers_do_not_block_on_writers(tmp_path: Path):
+    engine = db.create_db_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == main.settings.sqlite_busy_timeout_ms
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -main.settings.sqlite_cache_size_kib
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE item (id INTEGER PRIMARY KEY)")
+        conn.exec_driver_sql("INSERT INTO item (id) VALUES (1)")
+
+    with engine.connect() as writer, engine.connect() as reader:
+        writer.exec_driver_sql("BEGIN IMMEDIATE")
+        writer.exec_driver_sql("INSERT INTO item (id) VALUES (2)")
+        # Con WAL el lector ve la última versión confirmada sin esperar al escritor.
+        assert reader.exec_driver_sql("SELECT COUNT(*) FROM item").scalar() == 1
+        writer.exec_driver_sql("COMMIT")
+    engine.dispose()
+
+
+def test_in_memory_sqlite_engine_is_shared_across_threads():
+    engine = db.create_db_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE item (id INTEGER PRIMARY KEY)")
+        conn.exec_driver_sql("INSERT INTO item (id) VALUES (1)")
+
+    def count_items() -> int:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT COUNT(*) FROM item").scalar()
+
+    # Los endpoints en threadpool, asyncio.to_thread y los workers de jobs ven la misma base.
+    assert asyncio.run(asyncio.to_thread(count_items)) == 1
+    engine.dispose()
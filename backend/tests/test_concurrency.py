@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from app import password_hashing
+from app.circuit_breaker import CircuitBreaker, CircuitState
+from app.password_hashing import PasswordHasher, pwd_context
+from app.singleflight import SingleFlight
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    calls = 0
+
+    async def slow_analysis() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "resultado"
+
+    async def scenario() -> list[tuple[str, bool]]:
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do(("case", 1), slow_analysis) for _ in range(3)))
+        assert flights.in_flight() == 0
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert calls == 1
+    assert [value for value, _shared in results] == ["resultado"] * 3
+    assert sorted(shared for _value, shared in results) == [False, True, True]
+
+
+def test_single_flight_propagates_errors_and_allows_retry():
+    attempts = 0
+
+    async def flaky() -> str:
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0)
+        if attempts == 1:
+            raise RuntimeError("proveedor caído")
+        return "ok"
+
+    async def scenario() -> str:
+        flights = SingleFlight()
+        with pytest.raises(RuntimeError):
+            await flights.do("key", flaky)
+        value, shared = await flights.do("key", flaky)
+        assert shared is False
+        return value
+
+    assert asyncio.run(scenario()) == "ok"
+    assert attempts == 2
+
+
+def test_circuit_breaker_opens_on_failure_rate_and_recovers_through_half_open():
+    now = 0.0
+    breaker = CircuitBreaker(
+        failure_rate_threshold=0.5,
+        window_size=4,
+        minimum_calls=4,
+        open_seconds=30,
+        clock=lambda: now,
+    )
+
+    for outcome in (True, False, True, False):
+        assert breaker.allow_request()
+        breaker.record_success() if outcome else breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["short_circuited"] == 1
+
+    now = 31.0
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+    now = 62.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+def test_circuit_breaker_release_frees_half_open_probe_without_verdict():
+    now = 0.0
+    breaker = CircuitBreaker(
+        failure_rate_threshold=0.5,
+        window_size=2,
+        minimum_calls=1,
+        open_seconds=10,
+        clock=lambda: now,
+    )
+    breaker.record_failure()
+    now = 11.0
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_password_hasher_bounds_concurrency_and_reports_queue_time():
+    hasher = PasswordHasher(max_workers=1, max_concurrency=2)
+    password_hash = pwd_context.hash("clave-segura")
+
+    async def burst() -> list[bool]:
+        checks = [hasher.verify("clave-segura", password_hash) for _ in range(4)]
+        return await asyncio.gather(*checks, hasher.verify("otra", password_hash))
+
+    try:
+        results = asyncio.run(burst())
+        new_hash = asyncio.run(hasher.hash("nueva"))
+    finally:
+        hasher.shutdown()
+
+    assert results == [True, True, True, True, False]
+    assert pwd_context.verify("nueva", new_hash)
+    stats = hasher.stats()
+    assert stats["operations"] == 6
+    assert stats["max_in_flight"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["admission_wait_p95_ms"] > 0
+    assert stats["pool_wait_p50_ms"] is not None
+
+
+def test_password_worker_reports_wait_before_hashing(monkeypatch):
+    class SlowContext:
+        def hash(self, password: str) -> str:
+            time.sleep(0.2)
+            return "hash"
+
+        def verify(self, password: str, password_hash: str) -> bool:
+            time.sleep(0.2)
+            return True
+
+    monkeypatch.setattr(password_hashing, "pwd_context", SlowContext())
+    _, hash_wait = password_hashing._hash_in_worker("clave", time.time() - 0.05)
+    _, verify_wait = password_hashing._verify_in_worker("clave", "hash", time.time() - 0.05)
+    # La espera en la cola no incluye los 200 ms del pbkdf2.
+    assert 0.05 <= hash_wait < 0.15
+    assert 0.05 <= verify_wait < 0.15
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+from fastapi import Response
+from sqlalchemy import event, inspect
+from sqlmodel import Session
+
+from app import db, main
+from app.migrations import _REDUNDANT_INDEXES, LATEST_VERSION, current_version, run_migrations
+from app.models import Case, Cohort, CohortMembership, User, UserRole
+
+
+def test_migrations_upgrade_legacy_database_once(tmp_path: Path):
+    engine = db.create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE "case" (id INTEGER PRIMARY KEY, title VARCHAR(120), status VARCHAR(27), '
+            "origin VARCHAR(20), created_at DATETIME, updated_at DATETIME)"
+        )
+        conn.exec_driver_sql('CREATE TABLE "user" (id INTEGER PRIMARY KEY, email VARCHAR(190))')
+        for case_id, origin in enumerate(["SPARRING", "LIVE_SESSION", "sparring", "SPARRING", "LIVE_SESSION"], start=1):
+            conn.exec_driver_sql(
+                'INSERT INTO "case" (id, title, status, origin, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    case_id,
+                    f"Caso {case_id}",
+                    "CERRADO" if case_id == 1 else "EN_PREPARACION",
+                    origin,
+                    "2025-11-03 10:00:00",
+                    "2025-12-01 10:00:00",
+                ),
+            )
+
+    assert run_migrations(engine, batch_size=2) == list(range(1, LATEST_VERSION + 1))
+
+    with engine.connect() as conn:
+        case_columns = {column["name"] for column in inspect(conn).get_columns("case")}
+        user_columns = {column["name"] for column in inspect(conn).get_columns("user")}
+        origins = [row[0] for row in conn.exec_driver_sql('SELECT origin FROM "case" ORDER BY id')]
+        assert current_version(conn) == LATEST_VERSION
+        global_rollup = conn.exec_driver_sql(
+            "SELECT period, cases_created, cases_closed FROM metrics_rollup WHERE scope = 'global' ORDER BY period"
+        ).all()
+        assert inspect(conn).has_table("leaderevaluation")
+        case_indexes = {index["name"] for index in inspect(conn).get_indexes("case")}
+    assert {"owner_user_id", "cohort_id", "closed_at"} <= case_columns
+    assert "token_version" in user_columns
+    assert "ix_case_owner_user_id_updated_at" in case_indexes
+    assert origins == ["sparring", "live_session", "sparring", "sparring", "live_session"]
+    assert [tuple(row) for row in global_rollup] == [("2025-11", 5, 0), ("2025-12", 0, 1)]
+
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    assert run_migrations(engine) == []
+    # Un arranque con el esquema al día solo consulta la versión.
+    assert not any(statement.lstrip().upper().startswith(("UPDATE", "ALTER", "CREATE")) for statement in statements)
+    assert len(statements) <= 2
+    engine.dispose()
+
+
+def _explained_app_queries(engine, run) -> list[tuple[str, str]]:
+    """Ejecuta `run` y devuelve cada SELECT que emitió junto con su EXPLAIN QUERY PLAN."""
+    executed: list[tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    with engine.connect() as conn:
+        return [
+            (sql, " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parameters)))
+            for sql, parameters in executed
+        ]
+
+
+def test_hot_queries_are_served_by_composite_indexes(tmp_path: Path):
+    engine = db.create_db_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    run_migrations(engine)
+    now = datetime.now(UTC)
+    with Session(engine) as session:
+        student = User(email="plan@example.com", full_name="Plan", password_hash="x", role=UserRole.STUDENT)
+        admin = User(email="plan-admin@example.com", full_name="Admin", password_hash="x", role=UserRole.ADMIN)
+        cohort = Cohort(name="Cohorte plan", start_date=now - timedelta(days=1), end_date=now + timedelta(days=30))
+        session.add_all([student, admin, cohort])
+        session.commit()
+        session.add(CohortMembership(user_id=student.id, cohort_id=cohort.id))
+        cases = [
+            Case(title=f"Caso {idx}", owner_user_id=student.id, updated_at=now - timedelta(hours=idx)) for idx in range(3)
+        ]
+        session.add_all(cases)
+        session.commit()
+        session.refresh(student)
+        session.refresh(admin)
+        case_id = cases[0].id
+
+        # Las sentencias reales de la app, cada una con la tabla que debe resolver su índice.
+        cursor = main._encode_case_cursor(now, 10**6)
+        hot_queries = {
+            "ix_case_owner_user_id_updated_at": (
+                'FROM "case"',
+                lambda: main.list_cases(Response(), limit=2, cursor=cursor, session=session, current_user=student),
+            ),
+            # Sin filtro de dueño: el keyset del admin recorre (updated_at, id).
+            "ix_case_updated_at_id": (
+                'FROM "case"',
+                lambda: main.list_cases(Response(), limit=2, cursor=cursor, session=session, current_user=admin),
+            ),
+            "ix_caseversion_case_id_created_at": (
+                "FROM caseversion",
+                lambda: main.get_versions(case_id, session=session, current_user=student),
+            ),
+            "ix_cohortmembership_user_id_cohort_id_is_active": (
+                "FROM cohortmembership",
+                lambda: main._compute_user_access(session, student, now),
+            ),
+            "ix_leaderevaluation_target_user_id_created_at": (
+                "FROM leaderevaluation",
+                lambda: main.list_my_leader_evaluations(session=session, current_user=student),
+            ),
+        }
+        plans = {
+            index_name: next(plan for sql, plan in _explained_app_queries(engine, run) if table in sql)
+            for index_name, (table, run) in hot_queries.items()
+        }
+
+    for index_name, plan in plans.items():
+        assert index_name in plan, plan
+        # El orden sale del índice: sin ordenamiento temporal.
+        assert "TEMP B-TREE" not in plan, plan
+    engine.dispose()
+
+
+def test_redundant_single_column_indexes_are_dropped(tmp_path: Path):
+    engine = db.create_db_engine(f"sqlite:///{tmp_path / 'redundant.db'}")
+    run_migrations(engine)
+    # Base anterior a la migración 6: todavía tiene los índices de una columna.
+    with engine.begin() as conn:
+        conn.exec_driver_sql('CREATE INDEX ix_case_owner_user_id ON "case" (owner_user_id)')
+        conn.exec_driver_sql("CREATE INDEX ix_cohortmembership_user_id ON cohortmembership (user_id)")
+        conn.exec_driver_sql("CREATE INDEX ix_caseversion_case_id ON caseversion (case_id)")
+        conn.exec_driver_sql("CREATE INDEX ix_leaderevaluation_target_user_id ON leaderevaluation (target_user_id)")
+        conn.exec_driver_sql("DELETE FROM schema_version WHERE version >= 6")
+    run_migrations(engine)
+
+    index_names = {
+        index["name"]
+        for table in ("case", "cohortmembership", "caseversion", "leaderevaluation")
+        for index in inspect(engine).get_indexes(table)
+    }
+    assert index_names.isdisjoint(_REDUNDANT_INDEXES)
+    assert "ix_cohortmembership_user_id_cohort_id_is_active" in index_names
+    engine.dispose()
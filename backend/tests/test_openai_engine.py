@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import statistics
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app import openai_engine, openai_standin
+from app.models import FeedbackMode
+from app.schemas import PreparationInput
+
+from .test_api_workflows import REQUIRED_PREPARATION
+
+
+def _patch_settings(monkeypatch, **overrides) -> None:
+    patched_settings = SimpleNamespace(**openai_engine.settings.__dict__)
+    patched_settings.openai_api_key = "sk-test"
+    for key, value in overrides.items():
+        setattr(patched_settings, key, value)
+    monkeypatch.setattr(openai_engine, "settings", patched_settings)
+
+
+def test_openai_client_is_shared_and_uses_configured_pool(monkeypatch):
+    _patch_settings(monkeypatch, openai_max_connections=7, openai_connect_timeout_seconds=1.5)
+    openai_engine.close_openai_client()
+
+    client = openai_engine.get_openai_client()
+    try:
+        assert openai_engine.get_openai_client() is client
+        assert client.timeout.connect == 1.5
+        assert client._client._transport._pool._max_connections == 7
+    finally:
+        openai_engine.close_openai_client()
+
+    assert openai_engine._client is None
+
+
+def test_section_parser_emits_each_top_level_field_once_complete():
+    payload = (
+        '{"observations": ["Uno, con coma", "Dos"], "suggestions": [], '
+        '"preparation_level": "Intermedio", "next_steps": ["{no es objeto}"]}'
+    )
+    parser = openai_engine._SectionParser()
+    emitted: list[tuple[str, object]] = []
+    for start in range(0, len(payload), 3):
+        emitted.extend((section.key, section.value) for section in parser.feed(payload[start : start + 3]))
+
+    assert emitted == [
+        ("observations", ["Uno, con coma", "Dos"]),
+        ("suggestions", []),
+        ("preparation_level", "Intermedio"),
+        ("next_steps", ["{no es objeto}"]),
+    ]
+
+
+def _completion_payload(content: str) -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-test",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": 812,
+            "completion_tokens": 143,
+            "total_tokens": 955,
+            "prompt_tokens_details": {"cached_tokens": 512},
+        },
+    }
+
+
+def test_async_call_records_usage_latency_and_outcome(monkeypatch):
+    _patch_settings(monkeypatch, openai_model="gpt-test")
+    contents = iter(['{"observations": ["sin resto del esquema"]}', "no es json"])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=_completion_payload(next(contents)))
+
+    client = AsyncOpenAI(
+        api_key="sk-test",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(openai_engine, "_async_client", client)
+    preparation = PreparationInput.model_validate(REQUIRED_PREPARATION)
+
+    for expected_outcome in ("schema_error", "invalid_json"):
+        call_info = openai_engine.LLMCallInfo(case_id=7)
+        with pytest.raises(openai_engine.InvalidLLMResponse):
+            asyncio.run(
+                openai_engine.analyze_preparation_with_openai_async(preparation, FeedbackMode.CURSO, call_info=call_info)
+            )
+        assert call_info.outcome == expected_outcome
+        assert (call_info.model, call_info.prompt_tokens, call_info.completion_tokens) == ("gpt-test", 812, 143)
+        assert call_info.cached_prompt_tokens == 512
+        assert call_info.latency_ms > 0
+
+
+def test_system_prompts_are_precompiled_and_share_a_static_prefix():
+    curso = openai_engine._system_prompt(FeedbackMode.CURSO)
+    profesional = openai_engine._system_prompt(FeedbackMode.PROFESIONAL)
+
+    assert curso is openai_engine._system_prompt(FeedbackMode.CURSO)
+    assert curso.startswith(openai_engine._SYSTEM_PROMPT_PREFIX)
+    assert profesional.startswith(openai_engine._SYSTEM_PROMPT_PREFIX)
+    assert curso.endswith(openai_engine._MODE_TONES[FeedbackMode.CURSO])
+
+    user_prompt = openai_engine._user_prompt(PreparationInput.model_validate(REQUIRED_PREPARATION))
+    assert "- MAAN: Oferta externa alternativa" in user_prompt
+    assert "{" not in user_prompt
+
+
+def test_standin_latency_follows_configured_median_and_p95():
+    behavior = openai_standin.StandinBehavior(latency_median_ms=100, latency_p95_ms=400)
+    rng = random.Random(7)
+    samples = sorted(behavior.sample_latency(rng) * 1000 for _ in range(4000))
+
+    assert 90 <= statistics.median(samples) <= 110
+    assert 340 <= samples[int(len(samples) * 0.95)] <= 460
+    assert openai_standin.StandinBehavior().sample_latency(rng) == 0.0
+
+
+def test_openai_client_targets_configured_base_url(monkeypatch):
+    _patch_settings(monkeypatch, openai_base_url="http://localhost:8100/v1")
+    openai_engine.close_openai_client()
+    try:
+        assert str(openai_engine.get_openai_client().base_url) == "http://localhost:8100/v1/"
+    finally:
+        openai_engine.close_openai_client()